@@ -0,0 +1,404 @@
+"""
+Benchmark do processar_dados.py, etapa por etapa, sobre planilhas sintéticas (gerar_planilha_sintetica.py)
+ou sobre uma planilha existente.
+
+Etapas medidas (tempo e pico de memória alocada):
+    leitura_excel      abrir a planilha e carregar as abas em DataFrames
+    leitura_planos     ler_aba_plano + compilação das fórmulas
+    leitura_dados      ler_aba_dados (matriz de valores de cada DataSource)
+    hierarquia         build_account_hierarchy + detecção de referências circulares
+    calculo            cálculo de todas as visões (plano x DataSource)
+    serializacao_json  JSON compacto injetado no index.html, gravado em os.devnull
+    injecao_html       gravação dos dados numa cópia do index.html (serialização + cópia do HTML em blocos)
+    pipeline_completo  processar_planilha_integrado + injeção, como na linha de comando (sem cache)
+    partida            novo processo do processar_dados.py até a primeira linha de saída (imports + início do main)
+
+Os resultados vão para um arquivo JSON (padrão: benchmark_resultados/benchmark_AAAAMMDD_HHMMSS.json), que pode
+ser comparado com o de outra versão:
+    python benchmark.py                                   # cenários 'pequeno' e 'medio'
+    python benchmark.py --cenarios grande --repeticoes 5
+    python benchmark.py --planilha DADOS.xlsx
+    python benchmark.py --contas 5000 --periodos 120      # cenário 'personalizado'
+    python benchmark.py --comparar antes.json depois.json
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import processar_dados
+from gerar_planilha_sintetica import GERADOR_VERSAO, PARAMETROS_PADRAO, gerar_planilha_sintetica
+
+FORMATO_RESULTADOS = 1 # Versão do formato do arquivo de resultados
+DEFAULT_PASTA_PLANILHAS = ".benchmark_planilhas"
+DEFAULT_PASTA_RESULTADOS = "benchmark_resultados"
+DEFAULT_REPETICOES = 3
+DEFAULT_TOLERANCIA = 0.10 # Aumento relativo de tempo/memória considerado regressão na comparação
+MB = 1024 * 1024
+
+ETAPAS = ("leitura_excel", "leitura_planos", "leitura_dados", "hierarquia", "calculo",
+          "serializacao_json", "injecao_html", "pipeline_completo", "partida")
+
+# Parâmetros do gerador de cada cenário pré-definido (os ausentes vêm de PARAMETROS_PADRAO)
+CENARIOS = {
+    "pequeno": {"contas": 200, "profundidade": 4, "periodos": 12, "data_sources": 2, "vinculos_por_analitica": 2, "planos": 1},
+    "medio": {"contas": 1000, "profundidade": 4, "periodos": 36, "data_sources": 3, "vinculos_por_analitica": 2, "planos": 2},
+    "grande": {"contas": 3000, "profundidade": 5, "periodos": 60, "data_sources": 3, "vinculos_por_analitica": 3, "planos": 2},
+}
+DEFAULT_CENARIOS = ("pequeno", "medio")
+
+
+class MedidorDeEtapas:
+    """
+    Executa e mede as etapas de uma rodada: o tempo de cada uma ou, com memoria=True, o pico de memória
+    alocada pelo Python/NumPy durante a etapa (tracemalloc, que já deve estar ativo). Usa a mesma medição
+    das métricas do processar_dados.py (medir_recursos), que não se confunde com as medições internas dele.
+    """
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.medidas = {} # {etapa: segundos} ou {etapa: {"pico_mb", "pico_adicional_mb"}}
+
+    def medir(self, etapa, funcao, *args, **kwargs):
+        medidas = {}
+        with processar_dados.medir_recursos(medidas):
+            resultado = funcao(*args, **kwargs)
+        if self.memoria:
+            self.medidas[etapa] = {"pico_mb": medidas["pico_memoria_mb"], "pico_adicional_mb": medidas["memoria_adicional_mb"]}
+        else:
+            self.medidas[etapa] = medidas["segundos"]
+        return resultado
+
+
+def medir_partida(caminho_excel, caminho_html_modelo, pasta_temporaria, reader, engine):
+    """
+    Segundos entre iniciar o processar_dados.py num processo novo (numa pasta com cópias da planilha e do
+    index.html) e a primeira linha que ele imprime. O processo é encerrado logo depois dessa linha.
+    """
+    pasta = os.path.join(pasta_temporaria, "partida")
+    os.makedirs(pasta, exist_ok=True)
+    shutil.copyfile(caminho_excel, os.path.join(pasta, "DADOS.xlsx"))
+    shutil.copyfile(caminho_html_modelo, os.path.join(pasta, "index.html"))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processar_dados.py")
+    inicio = time.perf_counter()
+    processo = subprocess.Popen([sys.executable, script, "--no-cache", "--reader", reader, "--engine", engine], cwd=pasta,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env={**os.environ, "PYTHONUNBUFFERED": "1"})
+    try:
+        if not processo.stdout.readline():
+            raise RuntimeError("O processar_dados.py terminou sem imprimir nada.")
+        return time.perf_counter() - inicio
+    finally:
+        processo.kill()
+        processo.wait()
+        processo.stdout.close()
+
+
+def executar_rodada(caminho_excel, caminho_html_modelo, pasta_temporaria, medidor, reader, engine, workers):
+    """
+    Executa todas as etapas uma vez, com a saída do processar_dados.py suprimida. A partida (processo novo) só
+    é medida nas rodadas de tempo.
+    Retorna um resumo da rodada (visões, contas e tamanho do JSON).
+    """
+    caminho_html = os.path.join(pasta_temporaria, "index.html")
+
+    def ler_abas():
+        with processar_dados.abrir_leitor_excel(caminho_excel, reader) as leitor:
+            nomes = [nome for nome in leitor.sheet_names if not nome.startswith('~$')]
+            abas_plano = {nome: leitor.parse(nome) for nome in nomes if nome.lower().startswith("plano")}
+            abas_dados = {nome: leitor.parse(nome) for nome in nomes if nome.lower().startswith("dados")}
+        return abas_plano, abas_dados
+
+    def ler_planos(abas_plano):
+        planos = {}
+        for sheet_name, df_plano in abas_plano.items():
+            plano_lido = processar_dados.ler_aba_plano(df_plano, sheet_name)
+            if plano_lido is None:
+                continue
+            plan_name = processar_dados.get_name_in_parentheses(sheet_name) or sheet_name.strip()
+            processar_dados.compilar_formulas_do_plano(plano_lido[0], plan_name)
+            planos[plan_name] = plano_lido
+        return planos
+
+    def ler_dados(abas_dados):
+        dados = {}
+        for sheet_name, df_dados in abas_dados.items():
+            raw_data_info = processar_dados.ler_aba_dados(df_dados, sheet_name)
+            if raw_data_info is not None:
+                dados[processar_dados.get_name_in_parentheses(sheet_name) or sheet_name.strip()] = raw_data_info
+        return dados
+
+    def montar_hierarquias(planos):
+        hierarquias = {}
+        for plan_name, (accounts_list, _) in planos.items():
+            hierarquias[plan_name] = processar_dados.build_account_hierarchy(accounts_list)
+            processar_dados.report_dependency_cycles(hierarquias[plan_name][3], plan_name)
+        return hierarquias
+
+    def calcular(planos, hierarquias, dados):
+        tarefas = [(plan_name, ds_name, accounts_list, hierarquias[plan_name])
+                   for plan_name, (accounts_list, linked_data_sources) in planos.items()
+                   for ds_name in sorted(linked_data_sources.intersection(dados))
+                   if dados[ds_name]["periodos"]]
+        return {"calculated_views": processar_dados.calcular_visoes(tarefas, dados, engine, workers)}
+
+    def pipeline_completo():
+        resultado = processar_dados.processar_planilha_integrado(caminho_excel, engine=engine, reader=reader, cache=None, workers=workers)
+        processar_dados.update_index_html_with_json(caminho_html, resultado)
+
+    with open(os.devnull, "w", encoding="utf-8") as saida_nula, contextlib.redirect_stdout(saida_nula):
+        abas_plano, abas_dados = medidor.medir("leitura_excel", ler_abas)
+        planos = medidor.medir("leitura_planos", ler_planos, abas_plano)
+        dados = medidor.medir("leitura_dados", ler_dados, abas_dados)
+        del abas_plano, abas_dados
+        hierarquias = medidor.medir("hierarquia", montar_hierarquias, planos)
+        resultado = medidor.medir("calculo", calcular, planos, hierarquias, dados)
+        with open(os.devnull, "wb") as destino_nulo:
+            tamanho_json = medidor.medir("serializacao_json", processar_dados.escrever_json_compacto, destino_nulo, resultado)
+        shutil.copyfile(caminho_html_modelo, caminho_html)
+        if not medidor.medir("injecao_html", processar_dados.update_index_html_with_json, caminho_html, resultado):
+            raise RuntimeError(f"Falha ao injetar os dados em '{caminho_html}'.")
+        del planos, hierarquias, dados
+        shutil.copyfile(caminho_html_modelo, caminho_html)
+        medidor.medir("pipeline_completo", pipeline_completo)
+    if not medidor.memoria:
+        medidor.medidas["partida"] = medir_partida(caminho_excel, caminho_html_modelo, pasta_temporaria, reader, engine)
+
+    return {
+        "visoes": len(resultado["calculated_views"]),
+        "contas_nas_visoes": sum(len(view["accounts"]) for view in resultado["calculated_views"]),
+        "tamanho_json_bytes": tamanho_json,
+    }
+
+
+def medir_cenario(nome, caminho_excel, parametros, caminho_html_modelo, reader, engine, workers, repeticoes, medir_memoria):
+    """Roda 'repeticoes' rodadas cronometradas e, opcionalmente, uma rodada com medição de memória."""
+    tempos = {etapa: [] for etapa in ETAPAS}
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as pasta_temporaria:
+        for repeticao in range(1, repeticoes + 1):
+            medidor = MedidorDeEtapas()
+            resumo = executar_rodada(caminho_excel, caminho_html_modelo, pasta_temporaria, medidor, reader, engine, workers)
+            for etapa, segundos in medidor.medidas.items():
+                tempos[etapa].append(segundos)
+            print(f"   rodada {repeticao}/{repeticoes}: " + ", ".join(f"{etapa} {segundos:.3f}s" for etapa, segundos in medidor.medidas.items()))
+
+        memoria = {}
+        if medir_memoria:
+            # Rodada separada: o tracemalloc deixa a execução bem mais lenta e distorceria os tempos
+            medidor = MedidorDeEtapas(memoria=True)
+            tracemalloc.start()
+            try:
+                executar_rodada(caminho_excel, caminho_html_modelo, pasta_temporaria, medidor, reader, engine, workers)
+            finally:
+                tracemalloc.stop()
+            memoria = medidor.medidas
+
+    etapas = {}
+    for etapa in ETAPAS:
+        amostras = tempos[etapa]
+        etapas[etapa] = {
+            "segundos": [round(segundos, 6) for segundos in amostras],
+            "min": round(min(amostras), 6),
+            "mediana": round(statistics.median(amostras), 6),
+            "media": round(statistics.mean(amostras), 6),
+        }
+        if etapa in memoria:
+            etapas[etapa]["pico_memoria_mb"] = round(memoria[etapa]["pico_mb"], 3)
+            etapas[etapa]["pico_adicional_mb"] = round(memoria[etapa]["pico_adicional_mb"], 3)
+
+    resultado = {
+        "nome": nome,
+        "parametros": parametros,
+        "planilha": caminho_excel,
+        "tamanho_planilha_bytes": os.path.getsize(caminho_excel),
+        **resumo,
+        "etapas": etapas,
+    }
+    if memoria:
+        resultado["pico_memoria_mb"] = round(max(medidas["pico_mb"] for medidas in memoria.values()), 3)
+    return resultado
+
+
+def preparar_planilha_sintetica(nome, parametros, pasta_planilhas):
+    """Gera (ou reaproveita, se já existir) a planilha sintética do cenário e retorna o caminho."""
+    identificador = hashlib.sha1(json.dumps([GERADOR_VERSAO, parametros], sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    caminho = os.path.join(pasta_planilhas, f"{nome}_{identificador}.xlsx")
+    if not os.path.exists(caminho):
+        os.makedirs(pasta_planilhas, exist_ok=True)
+        print(f"Gerando planilha sintética '{caminho}'...")
+        inicio = time.perf_counter()
+        caminho_temporario = caminho + ".tmp.xlsx"
+        resumo = gerar_planilha_sintetica(caminho_temporario, **parametros)
+        os.replace(caminho_temporario, caminho)
+        print(f" - {resumo['contas']} contas, {resumo['celulas_de_dados']} células de dados ({time.perf_counter() - inicio:.1f}s).")
+    return caminho
+
+
+def versao_instalada(pacote):
+    """Versão do pacote instalado, sem importá-lo (None se não estiver instalado)."""
+    try:
+        return importlib.metadata.version(pacote)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def descrever_ambiente():
+    """Versões e máquina, gravadas junto com os resultados para comparações entre execuções."""
+    pasta_script = os.path.dirname(os.path.abspath(__file__))
+    commit = None
+    alteracoes_locais = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=pasta_script, capture_output=True, text=True, check=True).stdout.strip()
+        alteracoes_locais = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=pasta_script,
+                                                capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        pass # Fora de um repositório git (ou sem git instalado)
+    return {
+        "commit": commit,
+        "alteracoes_locais": alteracoes_locais,
+        "python": platform.python_version(),
+        "pandas": versao_instalada("pandas"),
+        "numpy": np.__version__,
+        "calamine": processar_dados.calamine_disponivel(),
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def comparar_resultados(caminho_base, caminho_novo, tolerancia=DEFAULT_TOLERANCIA):
+    """
+    Compara dois arquivos de resultados cenário a cenário (pelo nome) e etapa a etapa, usando o menor tempo
+    de cada etapa e o pico de memória. Imprime a tabela e retorna a quantidade de regressões encontradas.
+    """
+    with open(caminho_base, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(caminho_novo, "r", encoding="utf-8") as f:
+        novo = json.load(f)
+    print(f"Base: {caminho_base} (commit {base['ambiente'].get('commit')})")
+    print(f"Novo: {caminho_novo} (commit {novo['ambiente'].get('commit')})")
+    print(f"Tolerância: {tolerancia:.0%}")
+
+    cenarios_base = {cenario["nome"]: cenario for cenario in base["cenarios"]}
+    regressoes = 0
+    for cenario in novo["cenarios"]:
+        cenario_base = cenarios_base.get(cenario["nome"])
+        if cenario_base is None:
+            print(f"\nCenário '{cenario['nome']}' não existe na base. Ignorando.")
+            continue
+        print(f"\n--- Cenário '{cenario['nome']}' ---")
+        if cenario_base.get("parametros") != cenario.get("parametros"):
+            print("Aviso: os parâmetros do cenário são diferentes nas duas execuções.")
+        print(f"{'etapa':<20}{'base (s)':>12}{'novo (s)':>12}{'razão':>9}{'base (MB)':>12}{'novo (MB)':>12}")
+        for etapa in ETAPAS:
+            medidas_base = cenario_base["etapas"].get(etapa)
+            medidas_novo = cenario["etapas"].get(etapa)
+            if medidas_base is None or medidas_novo is None:
+                continue
+            razao = medidas_novo["min"] / medidas_base["min"] if medidas_base["min"] > 0 else float("inf")
+            marcas = []
+            if razao > 1 + tolerancia:
+                marcas.append("REGRESSÃO (tempo)")
+            memoria_base = medidas_base.get("pico_adicional_mb")
+            memoria_novo = medidas_novo.get("pico_adicional_mb")
+            if memoria_base is not None and memoria_novo is not None and memoria_novo > memoria_base * (1 + tolerancia) + 1:
+                marcas.append("REGRESSÃO (memória)")
+            regressoes += len(marcas)
+            texto_memoria_base = f"{memoria_base:.1f}" if memoria_base is not None else "-"
+            texto_memoria_novo = f"{memoria_novo:.1f}" if memoria_novo is not None else "-"
+            print(f"{etapa:<20}{medidas_base['min']:>12.3f}{medidas_novo['min']:>12.3f}{razao:>8.2f}x"
+                  f"{texto_memoria_base:>12}{texto_memoria_novo:>12}  {' '.join(marcas)}")
+    print(f"\n{regressoes} regressão(ões) acima da tolerância.")
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede o processar_dados.py etapa por etapa e grava os resultados em JSON.")
+    parser.add_argument("--cenarios", nargs="+", choices=sorted(CENARIOS),
+                        help=f"Cenários sintéticos pré-definidos (padrão: {' '.join(DEFAULT_CENARIOS)}).")
+    parser.add_argument("--planilha", action="append", default=[],
+                        help="Mede uma planilha existente em vez dos cenários sintéticos (pode ser repetido).")
+    grupo_gerador = parser.add_argument_group("cenário personalizado (qualquer um destes cria o cenário 'personalizado')")
+    grupo_gerador.add_argument("--contas", type=int, help=f"Contas por plano (padrão: {PARAMETROS_PADRAO['contas']}).")
+    grupo_gerador.add_argument("--profundidade", type=int, help=f"Níveis da hierarquia (padrão: {PARAMETROS_PADRAO['profundidade']}).")
+    grupo_gerador.add_argument("--periodos", type=int, help=f"Períodos por DataSource (padrão: {PARAMETROS_PADRAO['periodos']}).")
+    grupo_gerador.add_argument("--data-sources", type=int, help=f"Quantidade de DataSources (padrão: {PARAMETROS_PADRAO['data_sources']}).")
+    grupo_gerador.add_argument("--vinculos", type=int, help=f"Códigos brutos por conta analítica (padrão: {PARAMETROS_PADRAO['vinculos_por_analitica']}).")
+    grupo_gerador.add_argument("--fracao-calculo", type=float, help=f"Fração de contas de cálculo (padrão: {PARAMETROS_PADRAO['fracao_calculo']}).")
+    grupo_gerador.add_argument("--planos", type=int, help=f"Quantidade de planos (padrão: {PARAMETROS_PADRAO['planos']}).")
+    grupo_gerador.add_argument("--semente", type=int, help=f"Semente dos números aleatórios (padrão: {PARAMETROS_PADRAO['semente']}).")
+    parser.add_argument("--repeticoes", type=int, default=DEFAULT_REPETICOES,
+                        help=f"Rodadas cronometradas por cenário; o resultado guarda todas e o mínimo/mediana/média (padrão: {DEFAULT_REPETICOES}).")
+    parser.add_argument("--sem-memoria", action="store_true", help="Não faz a rodada extra de medição de memória (tracemalloc).")
+    parser.add_argument("--engine", choices=processar_dados.ENGINES, default=processar_dados.DEFAULT_ENGINE, help="Motor de cálculo.")
+    parser.add_argument("--reader", choices=processar_dados.EXCEL_READERS, default=processar_dados.DEFAULT_EXCEL_READER, help="Leitor da planilha.")
+    parser.add_argument("--workers", type=int, default=1, help="Processos para o cálculo das visões (0 = todos os núcleos; padrão: 1).")
+    parser.add_argument("--html", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html"),
+                        help="index.html usado como modelo na etapa de injeção (é copiado; o original não é alterado).")
+    parser.add_argument("--pasta-planilhas", default=DEFAULT_PASTA_PLANILHAS, help=f"Onde guardar as planilhas geradas (padrão: '{DEFAULT_PASTA_PLANILHAS}').")
+    parser.add_argument("--saida", help=f"Arquivo JSON de resultados (padrão: '{DEFAULT_PASTA_RESULTADOS}/benchmark_AAAAMMDD_HHMMSS.json').")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NOVO"),
+                        help="Compara dois arquivos de resultados em vez de medir; sai com código 1 se houver regressão.")
+    parser.add_argument("--tolerancia", type=float, default=DEFAULT_TOLERANCIA,
+                        help=f"Aumento relativo tolerado na comparação (padrão: {DEFAULT_TOLERANCIA}).")
+    args = parser.parse_args()
+
+    if args.comparar:
+        sys.exit(1 if comparar_resultados(args.comparar[0], args.comparar[1], args.tolerancia) else 0)
+    if args.repeticoes < 1:
+        parser.error("--repeticoes deve ser maior ou igual a 1.")
+    reader = processar_dados.resolver_leitor_excel(args.reader)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    # Cenários: (nome, caminho da planilha, parâmetros do gerador ou None)
+    cenarios = []
+    personalizado = {chave: valor for chave, valor in (("contas", args.contas), ("profundidade", args.profundidade),
+                                                        ("periodos", args.periodos), ("data_sources", args.data_sources),
+                                                        ("vinculos_por_analitica", args.vinculos), ("fracao_calculo", args.fracao_calculo),
+                                                        ("planos", args.planos), ("semente", args.semente)) if valor is not None}
+    nomes_cenarios = args.cenarios or ([] if args.planilha or personalizado else list(DEFAULT_CENARIOS))
+    for nome in nomes_cenarios:
+        parametros = {**PARAMETROS_PADRAO, **CENARIOS[nome]}
+        cenarios.append((nome, preparar_planilha_sintetica(nome, parametros, args.pasta_planilhas), parametros))
+    if personalizado:
+        parametros = {**PARAMETROS_PADRAO, **personalizado}
+        cenarios.append(("personalizado", preparar_planilha_sintetica("personalizado", parametros, args.pasta_planilhas), parametros))
+    for caminho in args.planilha:
+        if not os.path.exists(caminho):
+            parser.error(f"Planilha '{caminho}' não encontrada.")
+        cenarios.append((os.path.basename(caminho), caminho, None))
+
+    resultados = {
+        "formato": FORMATO_RESULTADOS,
+        "data": datetime.datetime.now().astimezone().isoformat(),
+        "ambiente": descrever_ambiente(),
+        "opcoes": {"engine": args.engine, "reader": reader, "workers": workers, "repeticoes": args.repeticoes,
+                   "memoria": not args.sem_memoria, "gerador": GERADOR_VERSAO},
+        "cenarios": [],
+    }
+    for nome, caminho_excel, parametros in cenarios:
+        print(f"\n--- Cenário '{nome}' ({caminho_excel}) ---")
+        cenario = medir_cenario(nome, caminho_excel, parametros, args.html, reader, args.engine, workers, args.repeticoes, not args.sem_memoria)
+        resultados["cenarios"].append(cenario)
+        print(f" {cenario['visoes']} visões, {cenario['contas_nas_visoes']} contas nas visões, JSON de {cenario['tamanho_json_bytes'] / MB:.1f} MB")
+        for etapa, medidas in cenario["etapas"].items():
+            texto_memoria = f", pico +{medidas['pico_adicional_mb']:.1f} MB" if "pico_adicional_mb" in medidas else ""
+            print(f"   {etapa:<20} min {medidas['min']:.3f}s  mediana {medidas['mediana']:.3f}s{texto_memoria}")
+
+    caminho_saida = args.saida or os.path.join(DEFAULT_PASTA_RESULTADOS, f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    if os.path.dirname(caminho_saida):
+        os.makedirs(os.path.dirname(caminho_saida), exist_ok=True)
+    with open(caminho_saida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em '{caminho_saida}'.")
@@ -0,0 +1,176 @@
+"""
+Consulta o banco de resultados gravado pelo processar_dados.py --banco, sem reprocessar a planilha nem ler o
+index.html. As linhas são lidas do banco e impressas uma a uma, sem carregar o resultado inteiro em memória.
+
+Uso:
+    python consultar_resultados.py --listar visoes                        # planos x DataSources gravados
+    python consultar_resultados.py --listar periodos
+    python consultar_resultados.py --listar contas --plano DRE
+    python consultar_resultados.py --plano DRE --data-source "GRUPO X" --conta 010 --periodo 2024-Q3
+    python consultar_resultados.py --plano DRE --conta 001 --subcontas --periodo 2024 2025 --formato csv > receitas.csv
+
+Períodos (--periodo): o nome exato do período ou, para os períodos 'AAAA-MM-DD HH:MM:SS', um mês (2024-07),
+trimestre (2024-Q3 ou 2024-T3), semestre (2024-S2) ou ano (2024). Nos agregados o valor é a soma dos períodos,
+como no index.html. Sem --periodo, vêm todos os períodos de cada visão, na ordem da visão.
+"""
+import argparse
+import csv
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import sys
+
+DEFAULT_BANCO = "resultados.sqlite" # O mesmo padrão do processar_dados.py --banco
+FORMATOS_SAIDA = ("tsv", "csv", "jsonl")
+LISTAGENS = ("planos", "data-sources", "periodos", "visoes", "contas")
+COLUNAS_VALORES = ("plano", "data_source", "codigo", "descricao", "periodo", "valor")
+
+_TRIMESTRE_EM_PORTUGUES = re.compile(r'^(\d{4})-T([1-4])$', re.IGNORECASE)
+
+def normalizar_periodo(periodo):
+    """Período pedido na linha de comando como gravado no banco (ex: '2024-t3' -> '2024-Q3')."""
+    periodo = periodo.strip()
+    match = _TRIMESTRE_EM_PORTUGUES.match(periodo)
+    if match:
+        return f"{match.group(1)}-Q{match.group(2)}"
+    if re.match(r'^\d{4}-[qs][1-4]$', periodo):
+        return periodo.upper()
+    return periodo
+
+def _filtros(plano=None, data_source=None, contas=None, subcontas=False):
+    """Cláusulas WHERE (lista) e parâmetros das consultas de valores."""
+    clausulas, parametros = [], []
+    if plano is not None:
+        clausulas.append("pl.nome = ?")
+        parametros.append(plano)
+    if data_source is not None:
+        clausulas.append("ds.nome = ?")
+        parametros.append(data_source)
+    if contas:
+        alternativas = []
+        for codigo in contas:
+            alternativas.append("c.codigo = ?")
+            parametros.append(codigo)
+            if subcontas:
+                # A hierarquia segue os códigos: 001.01 e 001.01.02 são subcontas de 001
+                alternativas.append("c.codigo LIKE ? ESCAPE '\\'")
+                parametros.append(codigo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + ".%")
+        clausulas.append("(" + " OR ".join(alternativas) + ")")
+    return clausulas, parametros
+
+_JUNCOES = """
+    FROM visoes vi
+    JOIN planos pl ON pl.id = vi.plano_id
+    JOIN data_sources ds ON ds.id = vi.data_source_id
+    JOIN valores v ON v.visao_id = vi.id
+    JOIN contas c ON c.id = v.conta_id
+"""
+
+def consultar_valores(conexao, plano=None, data_source=None, contas=None, subcontas=False, periodos=None):
+    """
+    Gera (plano, data_source, codigo, descricao, periodo, valor) do banco, na ordem das contas no plano.
+    periodos: nomes exatos ou agregados (ver normalizar_periodo); cada um vira uma linha por conta com a soma dos
+    períodos que ele cobre. Sem periodos, uma linha por período de cada visão.
+    """
+    clausulas, parametros = _filtros(plano, data_source, contas, subcontas)
+    if not periodos:
+        sql = ("SELECT pl.nome, ds.nome, c.codigo, c.descricao, p.nome, v.valor" + _JUNCOES +
+               "    JOIN periodos p ON p.id = v.periodo_id\n"
+               "    JOIN visao_periodos vp ON vp.visao_id = vi.id AND vp.periodo_id = p.id\n" +
+               (" WHERE " + " AND ".join(clausulas) if clausulas else "") +
+               " ORDER BY pl.nome, ds.nome, c.posicao, vp.posicao")
+        yield from conexao.execute(sql, parametros)
+        return
+
+    for periodo in periodos:
+        periodo = normalizar_periodo(periodo)
+        # Um subconjunto pequeno de períodos: a busca nos valores usa a chave primária (visão, conta, período)
+        filtro_periodo = ("v.periodo_id IN (SELECT id FROM periodos WHERE nome = ? OR mes = ? OR trimestre = ? "
+                          "OR semestre = ? OR CAST(ano AS TEXT) = ?)")
+        sql = ("SELECT pl.nome, ds.nome, c.codigo, c.descricao, ?, SUM(v.valor)" + _JUNCOES +
+               " WHERE " + " AND ".join(clausulas + [filtro_periodo]) +
+               " GROUP BY vi.id, c.id ORDER BY pl.nome, ds.nome, c.posicao")
+        yield from conexao.execute(sql, [periodo, *parametros, *([periodo] * 5)])
+
+def listar(conexao, o_que, plano=None):
+    """(cabeçalho, linhas) de uma listagem do banco (ver LISTAGENS)."""
+    if o_que == "planos":
+        return ("plano", "contas"), conexao.execute(
+            "SELECT pl.nome, COUNT(c.id) FROM planos pl LEFT JOIN contas c ON c.plano_id = pl.id GROUP BY pl.id ORDER BY pl.nome")
+    if o_que == "data-sources":
+        return ("data_source",), conexao.execute("SELECT nome FROM data_sources ORDER BY nome")
+    if o_que == "periodos":
+        return ("periodo", "mes", "trimestre", "semestre", "ano"), conexao.execute(
+            "SELECT nome, mes, trimestre, semestre, ano FROM periodos ORDER BY COALESCE(mes, nome), nome")
+    if o_que == "visoes":
+        return ("plano", "data_source", "contas", "periodos", "atualizada_em"), conexao.execute(
+            "SELECT pl.nome, ds.nome, (SELECT COUNT(DISTINCT conta_id) FROM valores WHERE visao_id = vi.id), "
+            "(SELECT COUNT(*) FROM visao_periodos WHERE visao_id = vi.id), vi.atualizada_em "
+            "FROM visoes vi JOIN planos pl ON pl.id = vi.plano_id JOIN data_sources ds ON ds.id = vi.data_source_id "
+            "ORDER BY pl.nome, ds.nome")
+    # contas
+    sql = ("SELECT pl.nome, c.codigo, c.descricao, c.tipo, c.formula, c.nivel FROM contas c JOIN planos pl ON pl.id = c.plano_id" +
+           (" WHERE pl.nome = ?" if plano is not None else "") + " ORDER BY pl.nome, c.posicao")
+    return ("plano", "codigo", "descricao", "tipo", "formula", "nivel"), conexao.execute(sql, [plano] if plano is not None else [])
+
+def imprimir_linhas(cabecalho, linhas, formato, saida=sys.stdout):
+    """Imprime as linhas conforme avançam; retorna quantas foram impressas."""
+    quantidade = 0
+    if formato == "jsonl":
+        for linha in linhas:
+            saida.write(json.dumps(dict(zip(cabecalho, linha)), ensure_ascii=False) + "\n")
+            quantidade += 1
+        return quantidade
+    escritor = csv.writer(saida, delimiter="\t" if formato == "tsv" else ",", lineterminator="\n")
+    escritor.writerow(cabecalho)
+    for linha in linhas:
+        escritor.writerow(["" if valor is None else valor for valor in linha])
+        quantidade += 1
+    return quantidade
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consulta o banco de resultados do processar_dados.py --banco.")
+    parser.add_argument("--banco", default=DEFAULT_BANCO, metavar="ARQUIVO",
+                        help=f"Banco SQLite gravado pelo processar_dados.py --banco (padrão: '{DEFAULT_BANCO}').")
+    parser.add_argument("--listar", choices=LISTAGENS,
+                        help="Lista planos, DataSources, períodos, visões ou as contas (de --plano, ou de todos) em vez de valores.")
+    parser.add_argument("--plano", help="Nome do plano de contas.")
+    parser.add_argument("--data-source", help="Nome do DataSource.")
+    parser.add_argument("--conta", nargs="+", metavar="CODIGO", help="Códigos das contas.")
+    parser.add_argument("--subcontas", action="store_true", help="Inclui as subcontas de cada --conta (códigos que começam por 'CODIGO.').")
+    parser.add_argument("--periodo", nargs="+", metavar="PERIODO",
+                        help="Períodos exatos ou agregados: mês (2024-07), trimestre (2024-Q3 ou 2024-T3), semestre (2024-S2) ou ano (2024).")
+    parser.add_argument("--formato", choices=FORMATOS_SAIDA, default="tsv",
+                        help="Saída: 'tsv' (padrão, separada por tabulações), 'csv' ou 'jsonl' (um objeto JSON por linha).")
+    args = parser.parse_args()
+    if args.subcontas and not args.conta:
+        parser.error("--subcontas exige --conta.")
+
+    if not os.path.exists(args.banco):
+        parser.error(f"o banco '{args.banco}' não existe. Gere-o com: python processar_dados.py --banco {args.banco}")
+    conexao = sqlite3.connect(pathlib.Path(args.banco).resolve().as_uri() + "?mode=ro", uri=True) # Só leitura: a consulta nunca altera o banco
+    linhas = None
+    try:
+        if args.listar:
+            cabecalho, linhas = listar(conexao, args.listar, args.plano)
+        else:
+            cabecalho, linhas = COLUNAS_VALORES, consultar_valores(conexao, args.plano, args.data_source, args.conta, args.subcontas, args.periodo)
+        quantidade = imprimir_linhas(cabecalho, linhas, args.formato)
+        sys.stdout.flush()
+    except sqlite3.Error as e:
+        print(f"Erro ao consultar o banco '{args.banco}': {e}", file=sys.stderr)
+        sys.exit(1)
+    except BrokenPipeError:
+        # Saída cortada (ex: | head): o restante é descartado sem erro
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(0)
+    finally:
+        if linhas is not None:
+            linhas.close()
+        conexao.close()
+    if quantidade == 0:
+        print("Nenhum resultado para os filtros informados.", file=sys.stderr)
+        sys.exit(1)
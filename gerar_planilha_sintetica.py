@@ -0,0 +1,164 @@
+"""
+Gera planilhas sintéticas no mesmo layout do DADOS.xlsx (abas 'plano de contas (...)' e 'dados(...)'),
+para medir o desempenho do processar_dados.py com volumes controlados (ver benchmark.py).
+
+Uso:
+    python gerar_planilha_sintetica.py sintetica.xlsx --contas 3000 --profundidade 5 --periodos 60 --data-sources 3
+"""
+import argparse
+import datetime
+import math
+import random
+
+import numpy as np
+import openpyxl
+
+GERADOR_VERSAO = 1 # Mude quando o layout gerado mudar (o benchmark reaproveita planilhas já geradas pelo nome)
+
+PARAMETROS_PADRAO = {
+    "contas": 1000, # Contas por plano (incluindo as de cálculo)
+    "profundidade": 4, # Níveis da hierarquia (ex: 4 -> 001, 001.01, 001.01.01, 001.01.01.0001)
+    "periodos": 36, # Períodos mensais por DataSource, a partir de jan/2025
+    "data_sources": 3, # Abas de dados; cada plano tem uma coluna de vínculo para cada uma
+    "vinculos_por_analitica": 2, # Códigos brutos vinculados a cada conta analítica, por DataSource
+    "fracao_calculo": 0.03, # Fração das contas que são 'calculo (...)'
+    "planos": 1,
+    "semente": 1,
+}
+
+def _distribuir(total, partes):
+    """Divide 'total' em 'partes' inteiros o mais iguais possível."""
+    base, resto = divmod(total, partes)
+    return [base + (1 if i < resto else 0) for i in range(partes)]
+
+def _gerar_subarvore(codigo, nivel, orcamento, profundidade, leque, contas):
+    """
+    Acrescenta a 'contas' a conta 'codigo' e seus descendentes, usando exatamente 'orcamento' contas.
+    Contas sem filhos são analíticas; no penúltimo nível todo o orçamento restante vira folhas.
+    """
+    indice = len(contas)
+    contas.append([codigo, "analitica"])
+    restante = orcamento - 1
+    if restante <= 0 or nivel >= profundidade:
+        return
+    contas[indice][1] = "sintetica"
+    if nivel == profundidade - 1:
+        filhos = [1] * restante
+    else:
+        filhos = _distribuir(restante, min(leque, restante))
+    largura = 4 if nivel == profundidade - 1 else max(2, len(str(len(filhos))))
+    for posicao, orcamento_filho in enumerate(filhos, start=1):
+        _gerar_subarvore(f"{codigo}.{posicao:0{largura}d}", nivel + 1, orcamento_filho, profundidade, leque, contas)
+
+def gerar_plano(contas, profundidade, fracao_calculo, rng):
+    """
+    Retorna a lista [(codigo, tipo), ...] de um plano: grupos hierárquicos no primeiro nível intercalados
+    com contas de cálculo, que somam/subtraem contas anteriores (como 'calculo (001 + 002)' no DADOS.xlsx).
+    """
+    num_calculo = min(contas - 1, int(round(contas * fracao_calculo))) if contas > 1 else 0
+    num_hierarquicas = contas - num_calculo
+    num_grupos = max(1, min(num_hierarquicas, int(round(num_hierarquicas ** (1 / profundidade)))))
+    leque = 1
+    if profundidade > 1:
+        por_grupo = num_hierarquicas / num_grupos
+        leque = max(1, math.ceil(max(por_grupo - 1, 1) ** (1 / (profundidade - 1))))
+
+    orcamentos = _distribuir(num_hierarquicas, num_grupos)
+    calculos_por_grupo = _distribuir(num_calculo, num_grupos)
+    largura = max(3, len(str(num_grupos + num_calculo)))
+
+    plano = []
+    primeiro_nivel = [] # Códigos de primeiro nível já criados (alvos das fórmulas)
+    posicao = 0
+    for orcamento, num_calculos in zip(orcamentos, calculos_por_grupo):
+        posicao += 1
+        codigo_grupo = f"{posicao:0{largura}d}"
+        contas_do_grupo = []
+        _gerar_subarvore(codigo_grupo, 1, orcamento, profundidade, leque, contas_do_grupo)
+        plano.extend(tuple(conta) for conta in contas_do_grupo)
+        primeiro_nivel.append(codigo_grupo)
+        for _ in range(num_calculos):
+            posicao += 1
+            codigo_calculo = f"{posicao:0{largura}d}"
+            # Referencia 2 a 4 contas anteriores: quase sempre de primeiro nível, às vezes uma conta interna
+            candidatos = primeiro_nivel if len(primeiro_nivel) >= 2 else [codigo for codigo, _ in plano]
+            termos = rng.sample(candidatos, min(len(candidatos), rng.randint(2, 4)))
+            if rng.random() < 0.2:
+                termos[-1] = rng.choice(plano)[0]
+            formula = termos[0]
+            for termo in termos[1:]:
+                operador = rng.choice(("+", "+", "-", "-", "*", "/"))
+                formula += f" {operador} {termo}"
+            plano.append((codigo_calculo, f"calculo ({formula})"))
+            primeiro_nivel.append(codigo_calculo)
+    return plano
+
+def gerar_planilha_sintetica(caminho, contas=PARAMETROS_PADRAO["contas"], profundidade=PARAMETROS_PADRAO["profundidade"],
+                             periodos=PARAMETROS_PADRAO["periodos"], data_sources=PARAMETROS_PADRAO["data_sources"],
+                             vinculos_por_analitica=PARAMETROS_PADRAO["vinculos_por_analitica"],
+                             fracao_calculo=PARAMETROS_PADRAO["fracao_calculo"], planos=PARAMETROS_PADRAO["planos"],
+                             semente=PARAMETROS_PADRAO["semente"]):
+    """
+    Grava em 'caminho' uma planilha .xlsx com 'planos' abas de plano e 'data_sources' abas de dados.
+    O resultado é determinístico para os mesmos parâmetros. Retorna um resumo do que foi gerado.
+    """
+    if contas < 1 or profundidade < 1 or periodos < 1 or data_sources < 1 or planos < 1 or vinculos_por_analitica < 1:
+        raise ValueError("contas, profundidade, periodos, data_sources, planos e vinculos_por_analitica devem ser >= 1.")
+    if not 0 <= fracao_calculo < 1:
+        raise ValueError("fracao_calculo deve estar entre 0 e 1.")
+
+    rng = random.Random(semente)
+    valores_rng = np.random.default_rng(semente)
+    nomes_ds = [f"DS{numero:02d}" for numero in range(1, data_sources + 1)]
+    cabecalhos_periodos = [datetime.datetime(2025 + mes // 12, mes % 12 + 1, 1) for mes in range(periodos)]
+
+    workbook = openpyxl.Workbook(write_only=True)
+    codigos_brutos = [] # Códigos brutos vinculados, na ordem em que aparecem nos planos
+    total_contas = 0
+    for numero_plano in range(1, planos + 1):
+        plano = gerar_plano(contas, profundidade, fracao_calculo, rng)
+        total_contas += len(plano)
+        aba = workbook.create_sheet(f"plano de contas (PLANO{numero_plano:02d})")
+        aba.append(["Codigo", "Descricao", "Tipo"] + [f"Vinculo({ds})" for ds in nomes_ds])
+        for codigo, tipo in plano:
+            vinculos = [None] * len(nomes_ds)
+            if tipo == "analitica":
+                # Os mesmos códigos brutos em todos os DataSources (cada aba de dados tem os seus valores)
+                codigos = [f"P{numero_plano:02d}R{len(codigos_brutos) + k:07d}" for k in range(vinculos_por_analitica)]
+                codigos_brutos.extend(codigos)
+                vinculos = ["; ".join(codigos)] * len(nomes_ds)
+            aba.append([codigo, f"Conta {codigo}", tipo] + vinculos)
+
+    for ds in nomes_ds:
+        aba = workbook.create_sheet(f"dados({ds})")
+        aba.append(["Codigo", "Descricao"] + cabecalhos_periodos)
+        valores = np.round(valores_rng.uniform(-5000, 20000, size=(len(codigos_brutos), periodos)), 2)
+        for codigo, linha in zip(codigos_brutos, valores.tolist()):
+            aba.append([codigo, f"Bruto {codigo}"] + linha)
+
+    workbook.save(caminho)
+    return {
+        "contas": total_contas,
+        "codigos_brutos_por_data_source": len(codigos_brutos),
+        "celulas_de_dados": len(codigos_brutos) * periodos * data_sources,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera uma planilha sintética no layout do DADOS.xlsx.")
+    parser.add_argument("caminho", help="Arquivo .xlsx a gerar.")
+    parser.add_argument("--contas", type=int, default=PARAMETROS_PADRAO["contas"], help="Contas por plano (incluindo as de cálculo).")
+    parser.add_argument("--profundidade", type=int, default=PARAMETROS_PADRAO["profundidade"], help="Níveis da hierarquia de contas.")
+    parser.add_argument("--periodos", type=int, default=PARAMETROS_PADRAO["periodos"], help="Períodos mensais por DataSource.")
+    parser.add_argument("--data-sources", type=int, default=PARAMETROS_PADRAO["data_sources"], help="Quantidade de abas de dados.")
+    parser.add_argument("--vinculos", type=int, default=PARAMETROS_PADRAO["vinculos_por_analitica"], help="Códigos brutos por conta analítica, por DataSource.")
+    parser.add_argument("--fracao-calculo", type=float, default=PARAMETROS_PADRAO["fracao_calculo"], help="Fração das contas que são de cálculo.")
+    parser.add_argument("--planos", type=int, default=PARAMETROS_PADRAO["planos"], help="Quantidade de abas de plano.")
+    parser.add_argument("--semente", type=int, default=PARAMETROS_PADRAO["semente"], help="Semente dos números aleatórios.")
+    args = parser.parse_args()
+
+    resumo = gerar_planilha_sintetica(args.caminho, contas=args.contas, profundidade=args.profundidade, periodos=args.periodos,
+                                      data_sources=args.data_sources, vinculos_por_analitica=args.vinculos,
+                                      fracao_calculo=args.fracao_calculo, planos=args.planos, semente=args.semente)
+    print(f"Planilha '{args.caminho}' gerada: {resumo['contas']} contas, {resumo['codigos_brutos_por_data_source']} códigos brutos "
+          f"por DataSource, {resumo['celulas_de_dados']} células de dados.")
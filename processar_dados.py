@@ -1,8 +1,22 @@
-import pandas as pd
+import numpy as np
 import json
 import re
 import os
+import sys
+import math
+import importlib.util
+import hashlib
+import pickle
+import contextlib
+import copy
+import itertools
+import time
+import tracemalloc
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ElementTree
 from collections import defaultdict
+from collections.abc import Mapping, Sequence
 from datetime import datetime
 import datetime # Importar datetime explicitamente para usar timedelta
 
@@ -38,7 +52,11 @@ def get_parent_code(account_code):
     return None # Retorna None se for código de nível superior ou inválido
 
 def build_account_hierarchy(accounts_list):
-    """Constrói uma estrutura de dicionário para lookup rápido e para identificar filhos."""
+    """
+    Constrói uma estrutura de dicionário para lookup rápido e para identificar filhos, além do grafo de
+    dependências entre as contas (ver build_dependency_graph).
+    Retorna (account_dict, children_map, level_map, dependency_graph).
+    """
     # Dicionário principal para lookup rápido por código
     account_dict = {acc["codigo"]: acc for acc in accounts_list if "codigo" in acc and acc["codigo"] is not None}
     # Dicionário para armazenar filhos diretos de cada conta
@@ -62,15 +80,120 @@ def build_account_hierarchy(accounts_list):
         # Calcula o nível baseado na quantidade de pontos. Código '1' tem nível 1, '1.1' tem nível 2, etc.
         level_map[codigo] = codigo.count('.') + 1
 
-    return account_dict, children_map, level_map
+    dependency_graph = build_dependency_graph(account_dict, children_map)
+    return account_dict, children_map, level_map, dependency_graph
 
-# Cache para armazenar valores calculados durante a execução de get_calculated_value
-# Este cache é limpo para cada combinação Plano-DataSource
-calculation_cache = {}
+def get_account_dependencies(account, children_map):
+    """
+    Contas das quais o valor de uma conta depende: os filhos diretos (sintéticas) ou as contas
+    referenciadas pela fórmula compilada (cálculo). Analíticas dependem apenas dos dados brutos.
+    """
+    tipo = account["tipo"].lower()
+    if tipo == "sintetica":
+        return list(children_map.get(account["codigo"], []))
+    if tipo.startswith("calculo") and account.get("formula") and account.get("formula_compilada") is not None:
+        return list(account["formula_compilada"].codigos)
+    return []
+
+def build_dependency_graph(account_dict, children_map):
+    """
+    Monta o grafo de dependências do plano (arestas pai->filhos das sintéticas e conta->referências das
+    fórmulas) e calcula, sem recursão, uma ordem de avaliação em que cada conta vem depois de todas as
+    contas de que depende. Referências circulares são detectadas antecipadamente.
+    Retorna um dicionário com:
+    - "dependencias": {codigo: [codigos dos quais depende]} (apenas contas existentes no plano)
+    - "dependentes": {codigo: [codigos que dependem dele]} (dependências reversas)
+    - "ordem": lista de todos os códigos na ordem de avaliação
+    - "ciclos": lista de ciclos, cada um a lista de códigos envolvidos (na ordem do plano)
+    - "contas_em_ciclo": conjunto dos códigos que participam de algum ciclo (valem 0.0)
+    """
+    dependencias = {}
+    dependentes = defaultdict(list)
+    for codigo, account in account_dict.items():
+        deps = [dep for dep in dict.fromkeys(get_account_dependencies(account, children_map)) if dep in account_dict]
+        dependencias[codigo] = deps
+        for dep in deps:
+            dependentes[dep].append(codigo)
+
+    # Algoritmo de Tarjan (iterativo) para componentes fortemente conexos. Como as arestas apontam da conta
+    # para suas dependências, os componentes saem já em ordem de avaliação (dependências primeiro).
+    posicao_no_plano = {codigo: i for i, codigo in enumerate(account_dict)}
+    index = {}
+    lowlink = {}
+    pilha = []
+    na_pilha = set()
+    ordem = []
+    ciclos = []
+    contador = 0
+    for raiz in account_dict:
+        if raiz in index:
+            continue
+        index[raiz] = lowlink[raiz] = contador
+        contador += 1
+        pilha.append(raiz)
+        na_pilha.add(raiz)
+        trabalho = [(raiz, iter(dependencias[raiz]))]
+        while trabalho:
+            codigo, deps_restantes = trabalho[-1]
+            desceu = False
+            for dep in deps_restantes:
+                if dep not in index:
+                    index[dep] = lowlink[dep] = contador
+                    contador += 1
+                    pilha.append(dep)
+                    na_pilha.add(dep)
+                    trabalho.append((dep, iter(dependencias[dep])))
+                    desceu = True
+                    break
+                if dep in na_pilha:
+                    lowlink[codigo] = min(lowlink[codigo], index[dep])
+            if desceu:
+                continue
+            trabalho.pop()
+            if trabalho:
+                pai = trabalho[-1][0]
+                lowlink[pai] = min(lowlink[pai], lowlink[codigo])
+            if lowlink[codigo] == index[codigo]:
+                componente = []
+                while True:
+                    membro = pilha.pop()
+                    na_pilha.discard(membro)
+                    componente.append(membro)
+                    if membro == codigo:
+                        break
+                componente.sort(key=posicao_no_plano.get)
+                if len(componente) > 1 or codigo in dependencias[codigo]:
+                    ciclos.append(componente)
+                ordem.extend(componente)
+
+    return {
+        "dependencias": dependencias,
+        "dependentes": dict(dependentes),
+        "ordem": ordem,
+        "ciclos": ciclos,
+        "contas_em_ciclo": {codigo for ciclo in ciclos for codigo in ciclo},
+    }
+
+def report_dependency_cycles(dependency_graph, plan_name):
+    """Informa, uma vez por plano, as referências circulares encontradas no grafo de dependências."""
+    for ciclo in dependency_graph["ciclos"]:
+        print(f"Erro: Referência circular no plano '{plan_name}' envolvendo as contas {ciclo}. Essas contas terão valor 0.0.")
+
+def valor_ausente(value):
+    """
+    Mesmo critério do pd.isna para um valor isolado (None, NaN, NaT, pd.NA), sem precisar do pandas:
+    NaN e NaT são os únicos valores diferentes de si mesmos, e a comparação com pd.NA não vira bool.
+    """
+    if value is None:
+        return True
+    try:
+        return bool(value != value)
+    except TypeError:
+        return True
 
 def safe_float_conversion(value, default=0.0):
     """Tenta converter um valor para float, retornando um default em caso de erro ou valor ausente."""
-    if pd.notnull(value):
+    if not valor_ausente(value):
         try:
             # Tentar converter para float. Isso pode falhar se o valor for texto não numérico.
             return float(value)
@@ -79,16 +202,206 @@ def safe_float_conversion(value, default=0.0):
             return default
     return default # Retorna default para None/NaN
 
-def get_calculated_value(account_code, period, account_dict, children_map, raw_data_for_ds_dict, ds_name):
+# --- Compilador de fórmulas das contas 'calculo' ---
+# Cada fórmula é analisada uma única vez, na leitura do plano, e transformada em uma árvore restrita a
+# + - * / (binários e unários), parênteses e referências a contas. Não há uso de eval().
+
+# Tokens: códigos de conta (ex: 001, 001.01.02), operadores e parênteses. Qualquer outro caractere é erro.
+FORMULA_TOKEN_PATTERN = re.compile(r'\s*(?:(\d+(?:\.\d+)*)|([-+*/()])|(\S))')
+
+class ErroFormula(ValueError):
+    """Erro de análise de uma fórmula de conta 'calculo'."""
+
+
+class FormulaCompilada:
+    """
+    Fórmula de conta 'calculo' já analisada.
+    - texto: a fórmula original (ex: "001 - 002")
+    - codigos: códigos das contas referenciadas, sem repetição, na ordem em que aparecem. A posição de
+      cada código nesta tupla é o "slot" usado pela árvore da expressão.
+    - avaliar(valores): avalia com um valor por slot (floats). Divisão por zero gera ZeroDivisionError.
+    - avaliar_vetorial(valores): avalia com um vetor NumPy por slot; retorna (vetor, mascara_de_erro),
+      onde a máscara marca os períodos com divisão por zero.
+    """
+    __slots__ = ("texto", "codigos", "arvore", "avaliar", "avaliar_vetorial")
+
+    def __init__(self, texto, codigos, arvore):
+        self.texto = texto
+        self.codigos = codigos
+        self.arvore = arvore
+        self.avaliar = _montar_avaliador_escalar(arvore)
+        self.avaliar_vetorial = _montar_avaliador_vetorial(arvore)
+
+    def __repr__(self):
+        return f"FormulaCompilada({self.texto!r})"
+
+    def __reduce__(self):
+        # Os avaliadores são closures (não serializáveis): ao desserializar (ex: em outro processo) são montados de novo
+        return (FormulaCompilada, (self.texto, self.codigos, self.arvore))
+
+
+def _tokenizar_formula(formula):
+    tokens = []
+    pos = 0
+    texto = formula.rstrip()
+    while pos < len(texto):
+        match = FORMULA_TOKEN_PATTERN.match(texto, pos)
+        codigo, operador, invalido = match.groups()
+        if invalido is not None:
+            raise ErroFormula(f"caractere inválido '{invalido}' na posição {match.start(3) + 1}")
+        tokens.append(("ref", codigo) if codigo is not None else ("op", operador))
+        pos = match.end()
+    return tokens
+
+def compilar_formula(formula):
+    """
+    Analisa uma fórmula (ex: "001 - (002 + 003) / 004") e retorna uma FormulaCompilada.
+    Precedência e associatividade iguais às do Python: unário > * / > + -, da esquerda para a direita.
+    Lança ErroFormula se a fórmula for inválida.
+    """
+    tokens = _tokenizar_formula(formula)
+    if not tokens:
+        raise ErroFormula("fórmula vazia")
+    codigos = []
+    slots = {}
+    pos = 0
+
+    def atual():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def expressao():
+        nonlocal pos
+        node = termo()
+        while atual() in (("op", "+"), ("op", "-")):
+            op = tokens[pos][1]
+            pos += 1
+            node = (op, node, termo())
+        return node
+
+    def termo():
+        nonlocal pos
+        node = fator()
+        while atual() in (("op", "*"), ("op", "/")):
+            op = tokens[pos][1]
+            pos += 1
+            node = (op, node, fator())
+        return node
+
+    def fator():
+        nonlocal pos
+        tipo, valor = atual()
+        if tipo == "op" and valor in ("+", "-"):
+            pos += 1
+            return ("neg" if valor == "-" else "pos", fator())
+        if tipo == "op" and valor == "(":
+            pos += 1
+            node = expressao()
+            if atual() != ("op", ")"):
+                raise ErroFormula("parêntese não fechado")
+            pos += 1
+            return node
+        if tipo == "ref":
+            pos += 1
+            if valor not in slots:
+                slots[valor] = len(codigos)
+                codigos.append(valor)
+            return ("ref", slots[valor])
+        if tipo is None:
+            raise ErroFormula("fim inesperado da fórmula")
+        raise ErroFormula(f"token inesperado '{valor}'")
+
+    arvore = expressao()
+    if pos < len(tokens):
+        raise ErroFormula(f"token inesperado '{tokens[pos][1]}'")
+    return FormulaCompilada(formula, tuple(codigos), arvore)
+
+def _montar_avaliador_escalar(node):
+    """Transforma a árvore em funções aninhadas (closures) que avaliam a fórmula sobre floats."""
+    tipo = node[0]
+    if tipo == "ref":
+        slot = node[1]
+        return lambda valores: valores[slot]
+    if tipo == "neg":
+        operando = _montar_avaliador_escalar(node[1])
+        return lambda valores: -operando(valores)
+    if tipo == "pos":
+        operando = _montar_avaliador_escalar(node[1])
+        return lambda valores: +operando(valores)
+    esquerda = _montar_avaliador_escalar(node[1])
+    direita = _montar_avaliador_escalar(node[2])
+    if tipo == "+":
+        return lambda valores: esquerda(valores) + direita(valores)
+    if tipo == "-":
+        return lambda valores: esquerda(valores) - direita(valores)
+    if tipo == "*":
+        return lambda valores: esquerda(valores) * direita(valores)
+    return lambda valores: esquerda(valores) / direita(valores)
+
+def _montar_avaliador_vetorial(node):
+    """
+    Versão vetorial do avaliador: cada função retorna (vetor, mascara_de_erro), onde a máscara marca
+    os períodos em que alguma divisão teve denominador zero (o equivalente à ZeroDivisionError escalar).
+    """
+    tipo = node[0]
+    if tipo == "ref":
+        slot = node[1]
+        return lambda valores: (valores[slot], False)
+    if tipo in ("neg", "pos"):
+        operando = _montar_avaliador_vetorial(node[1])
+        if tipo == "pos":
+            return operando
+        def negativo(valores):
+            vetor, erro = operando(valores)
+            return -vetor, erro
+        return negativo
+    esquerda = _montar_avaliador_vetorial(node[1])
+    direita = _montar_avaliador_vetorial(node[2])
+    op = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}[tipo]
+    def binario(valores):
+        a, erro_a = esquerda(valores)
+        b, erro_b = direita(valores)
+        erro = erro_a | erro_b
+        if tipo == "/":
+            erro = erro | (b == 0.0)
+        with np.errstate(all='ignore'):
+            return op(a, b), erro
+    return binario
+
+def compilar_formulas_do_plano(accounts_list, plan_name):
+    """
+    Compila (uma única vez) as fórmulas das contas 'calculo' de um plano, guardando o resultado em
+    account["formula_compilada"]. Erros são informados uma vez por conta; essas contas valem 0.0.
+    """
+    codigos_do_plano = {account["codigo"] for account in accounts_list}
+    for account in accounts_list:
+        account["formula_compilada"] = None
+        formula = account.get("formula")
+        if not formula or not account["tipo"].lower().startswith("calculo"):
+            continue
+        try:
+            account["formula_compilada"] = compilar_formula(formula)
+        except ErroFormula as e:
+            print(f"Aviso: Fórmula inválida na conta '{account['codigo']}' do plano '{plan_name}' ('{formula}'): {e}. A conta terá valor 0.0.")
+            continue
+        inexistentes = [codigo for codigo in account["formula_compilada"].codigos if codigo not in codigos_do_plano]
+        if inexistentes:
+            print(f"Aviso: A fórmula da conta '{account['codigo']}' do plano '{plan_name}' referencia contas inexistentes no plano (valem 0.0): {inexistentes}")
+
+def get_calculated_value(account_code, period, account_dict, children_map, raw_data_info, ds_name, calculation_cache, estatisticas=None):
     """
     Função recursiva para obter ou calcular o valor de uma conta para um período,
-    usando dados de um DataSource específico.
-    Usa o cache global (que é limpo por combinação Plano-DataSource) para memoização.
+    usando dados de um DataSource específico (raw_data_info, ver ler_aba_dados).
+    calculation_cache: dicionário de memoização, um por combinação Plano-DataSource.
+    estatisticas: contadores opcionais (ver novas_estatisticas_visao) de acertos/faltas no cache e avaliações de fórmula.
     """
     # Chave para o cache: (código da conta, período, nome do data source)
     cache_key = (account_code, period, ds_name)
     if cache_key in calculation_cache:
+        if estatisticas is not None:
+            estatisticas["acertos_cache"] += 1
         return calculation_cache[cache_key]
+    if estatisticas is not None:
+        estatisticas["faltas_cache"] += 1
 
     account = account_dict.get(account_code)
     if not account:
@@ -101,22 +414,22 @@ def get_calculated_value(account_code, period, account_dict, children_map, raw_d
     if account["tipo"].lower() == "analitica":
         # Para analíticas, buscamos e SOMAMOS os valores dos códigos brutos vinculados no data source atual
         data_code_mapping_str = account["data_sources"].get(ds_name) # string como 'COD1; COD2' ou 'COD1'
+        raw_index = raw_data_info["indice_codigos"] if raw_data_info else None
 
-        if data_code_mapping_str and raw_data_for_ds_dict: # Verifica se há mapeamento para este DS e se o DataSource tem dados
+        if data_code_mapping_str and raw_index: # Verifica se há mapeamento para este DS e se o DataSource tem dados
             # Divide a string por ';' e limpa espaços, filtrando strings vazias
             linked_raw_codes = [code.strip() for code in str(data_code_mapping_str).split(';') if code.strip()]
+            # Coluna do período na matriz de valores brutos deste DataSource
+            period_column = raw_data_info["indice_periodos"].get(period)
 
             total_analitica_value = 0.0
             for raw_code in linked_raw_codes:
-                # Busca o dado bruto correspondente no dicionário pré-carregado deste DataSource
-                raw_data_entry = raw_data_for_ds_dict.get(raw_code)
-
-                if raw_data_entry and raw_data_entry.get("valores"):
-                    # Busca o valor bruto para o período específico
-                    raw_value = raw_data_entry["valores"].get(period)
-                    # Tenta converter o valor bruto para float, trata None/NaN/erros como 0.0
-                    numeric_raw_value = safe_float_conversion(raw_value)
-                    total_analitica_value += numeric_raw_value
+                # Busca a linha do dado bruto correspondente na matriz pré-carregada deste DataSource
+                raw_row = raw_index.get(raw_code)
+
+                if raw_row is not None and period_column is not None:
+                    # Valor bruto já convertido na leitura (None/NaN/textos não numéricos -> 0.0)
+                    total_analitica_value += float(raw_data_info["matriz"][raw_row, period_column])
                 else:
                     # Aviso se um dos códigos brutos vinculados não foi encontrado no DataSource
                     pass
@@ -133,7 +446,7 @@ def get_calculated_value(account_code, period, account_dict, children_map, raw_d
         total_sum = 0.0
         for child_code in direct_children_codes:
             # Recursivamente calcula o valor do filho para o mesmo período e DataSource
-            child_value = get_calculated_value(child_code, period, account_dict, children_map, raw_data_for_ds_dict, ds_name)
+            child_value = get_calculated_value(child_code, period, account_dict, children_map, raw_data_info, ds_name, calculation_cache, estatisticas)
             # Garante que o valor do filho é numérico antes de somar
             total_sum += safe_float_conversion(child_value)
 
@@ -141,267 +454,1862 @@ def get_calculated_value(account_code, period, account_dict, children_map, raw_d
 
     # ALTERAÇÃO CRÍTICA: Verifica se 'tipo' começa com 'calculo' E se a 'formula' foi extraída
     elif account["tipo"].lower().startswith("calculo") and account.get("formula"):
-        # Para contas de cálculo, avaliamos a fórmula (que já foi extraída na leitura do plano)
-        formula = account["formula"]
-        try:
-            # Encontra todos os códigos de contas mencionados na fórmula
-            # Procura por padrões de código (ex: 001, 001.01.02) que são números e pontos
-            referenced_codes = re.findall(r'(\d+(\.\d+)*)', formula)
-
-            # Cria um ambiente local para a avaliação da fórmula, mapeando códigos para seus valores calculados
-            local_vars = {}
-            for ref_code_tuple in referenced_codes:
-                ref_code = ref_code_tuple[0] # O código completo (ex: '001.01.02')
-                # Recursivamente obtém o valor calculado da conta referenciada
-                # Passa o account_dict, children_map, raw_data_for_ds_dict e ds_name adiante
-                ref_value = get_calculated_value(ref_code, period, account_dict, children_map, raw_data_for_ds_dict, ds_name)
-                # Adiciona ao ambiente local com um nome de variável válido (sanitiza códigos)
-                var_name = f"v_{ref_code.replace('.', '_').replace('-', '_')}" # ex: v_001_01_02
-                local_vars[var_name] = safe_float_conversion(ref_value) # Usa 0.0 se o valor referenciado não for numérico
-
-            # Substitui os códigos na fórmula pelos nomes das variáveis no ambiente local
-            eval_formula = formula
-            # Substitui os códigos mais longos primeiro para evitar substituir partes de códigos mais curtos
-            referenced_codes.sort(key=lambda x: len(x[0]), reverse=True)
-            for ref_code_tuple in referenced_codes:
-                ref_code = ref_code_tuple[0]
-                var_name = f"v_{ref_code.replace('.', '_').replace('-', '_')}"
-                # Usa regex para substituir apenas o código completo e não partes dele (usa word boundary \b)
-                eval_formula = re.sub(r'\b' + re.escape(ref_code) + r'\b', var_name, eval_formula)
-            
-            # Avalia a expressão usando eval().
-            value = eval(eval_formula, {}, local_vars)
-
-            # Garantir que o resultado da avaliação seja numérico
-            value = safe_float_conversion(value)
-
-        except Exception as e:
-            # print(f"Erro CRÍTICO ao avaliar fórmula '{formula}' (após subst: '{eval_formula}') para conta '{account_code}' no DataSource '{ds_name}', período '{period}': {e}")
-            value = 0.0 # Em caso de erro na fórmula, o valor é 0
-
+        # Para contas de cálculo, avaliamos a fórmula (já extraída e compilada na leitura do plano, ver compilar_formulas_do_plano)
+        formula_compilada = account.get("formula_compilada")
+        if formula_compilada is not None:
+            # Recursivamente obtém o valor calculado de cada conta referenciada (um valor por slot da fórmula)
+            ref_values = [
+                safe_float_conversion(get_calculated_value(ref_code, period, account_dict, children_map, raw_data_info, ds_name, calculation_cache, estatisticas))
+                for ref_code in formula_compilada.codigos
+            ]
+            try:
+                resultado = formula_compilada.avaliar(ref_values)
+                value = safe_float_conversion(resultado)
+                falhou = math.isnan(resultado) # Resultado não numérico (ex: inf - inf) vale 0.0
+            except ZeroDivisionError:
+                value = 0.0 # Divisão por zero neste período: o valor é 0
+                falhou = True
+            if estatisticas is not None:
+                estatisticas["avaliacoes_formula"] += 1
+                estatisticas["falhas_formula"] += falhou
 
     # Armazena o resultado no cache para esta combinação Plano-DataSource e período
     calculation_cache[cache_key] = value
     return value
 
 
-def processar_planilha_integrado(caminho_excel='DADOS.xlsx'):
+# --- Motor de cálculo vetorizado (NumPy) ---
+# Motores de cálculo disponíveis: 'vetorizado' calcula cada conta como um vetor com todos os períodos
+# do DataSource de uma vez; 'recursivo' é o motor original, conta a conta e período a período; 'linear'
+# compila o plano num operador esparso (ver "Motor linear" abaixo).
+ENGINES = ("vetorizado", "recursivo", "linear")
+DEFAULT_ENGINE = "vetorizado"
+
+def _nan_to_zero(vector):
+    """Equivalente vetorial de safe_float_conversion aplicado a valores já calculados (NaN -> 0.0)."""
+    return np.where(np.isnan(vector), 0.0, vector)
+
+def calcular_valores_vetorizados(account_dict, children_map, dependency_graph, raw_matrix, raw_index, ds_name, num_periodos, estatisticas=None,
+                                 ordem=None, vectors=None):
     """
-    Processa a planilha Excel para extrair dados, planos, vincular, calcular
-    e estruturar em um objeto JSON de visões calculadas.
+    Calcula os valores de todas as contas de um plano para um DataSource, com uma conta por vez
+    representada como um vetor com todos os períodos. Retorna {codigo_conta: vetor}.
+    Mesma semântica de get_calculated_value, mas sem chamadas por período nem recursão: as contas são
+    avaliadas na ordem topológica do grafo de dependências, então tudo de que uma conta depende já foi
+    calculado quando ela é avaliada. Contas em referência circular valem 0.0.
+    estatisticas: contadores opcionais (ver novas_estatisticas_visao). Aqui o "cache" é o dicionário de vetores:
+    cada conta calculada conta como uma falta e cada dependência encontrada já calculada, como um acerto;
+    avaliações e falhas de fórmula são contadas por período, como no motor recursivo.
+    ordem / vectors: para recalcular só parte do plano (ver ModeloCalculo), as contas a calcular, em ordem de
+    avaliação, e o dicionário (ou mapeamento) que recebe os vetores e já tem os das demais contas.
     """
-    all_raw_data = {} # Armazena dados brutos por DataSource: {ds_name: {periodos:[], data:{codigo:{descricao, valores:{periodo:valor}}}}}
-    all_plans = {} # Armazena definições de planos por nome de plano: {plan_name: {"accounts_list":[{codigo, descricao, tipo, formula, data_sources}], "linked_data_sources":[]}}
-    calculated_views = [] # Lista final de visões calculadas
+    vectors = {} if vectors is None else vectors
+    zeros = np.zeros(num_periodos)
+    contas_em_ciclo = dependency_graph["contas_em_ciclo"]
+
+    for account_code in dependency_graph["ordem"] if ordem is None else ordem:
+        account = account_dict[account_code]
+        tipo = account["tipo"].lower()
+        value = np.zeros(num_periodos)
+
+        if account_code in contas_em_ciclo:
+            pass # Referência circular: valor é 0
+
+        elif tipo == "analitica":
+            # Soma das linhas da matriz bruta vinculadas a esta conta no DataSource atual
+            data_code_mapping_str = account["data_sources"].get(ds_name)
+            if data_code_mapping_str and raw_index:
+                for raw_code in (code.strip() for code in str(data_code_mapping_str).split(';')):
+                    row = raw_index.get(raw_code) if raw_code else None
+                    if row is not None:
+                        value += raw_matrix[row]
+
+        elif tipo == "sintetica":
+            # Soma vetorial dos filhos diretos (já calculados)
+            for child_code in children_map.get(account_code, []):
+                value += _nan_to_zero(vectors[child_code])
+            if estatisticas is not None:
+                estatisticas["acertos_cache"] += len(children_map.get(account_code, []))
+
+        elif tipo.startswith("calculo") and account.get("formula"):
+            formula_compilada = account.get("formula_compilada")
+            if formula_compilada is not None:
+                # Contas referenciadas que não existem no plano valem 0
+                ref_vectors = [_nan_to_zero(vectors.get(ref_code, zeros)) for ref_code in formula_compilada.codigos]
+                resultado, erro = formula_compilada.avaliar_vetorial(ref_vectors)
+                # Períodos com divisão por zero ou resultado não numérico (NaN) valem 0.0
+                falhas = erro | np.isnan(resultado)
+                value = np.where(falhas, 0.0, resultado)
+                if estatisticas is not None:
+                    estatisticas["acertos_cache"] += sum(1 for ref_code in formula_compilada.codigos if ref_code in vectors)
+                    estatisticas["avaliacoes_formula"] += num_periodos
+                    estatisticas["falhas_formula"] += int(np.count_nonzero(falhas))
+
+        vectors[account_code] = value
+    if estatisticas is not None:
+        estatisticas["faltas_cache"] += len(vectors)
+    return vectors
+
+
+class _VetoresDaMatriz:
+    """Mapeamento {codigo_conta: vetor de períodos} sobre as linhas de uma matriz (contas x períodos)."""
+    __slots__ = ("matriz", "linha_da_conta")
+
+    def __init__(self, matriz, linha_da_conta):
+        self.matriz = matriz
+        self.linha_da_conta = linha_da_conta
+
+    def __getitem__(self, codigo):
+        return self.matriz[self.linha_da_conta[codigo]]
+
+    def __setitem__(self, codigo, vetor):
+        self.matriz[self.linha_da_conta[codigo]] = vetor
+
+    def __contains__(self, codigo):
+        return codigo in self.linha_da_conta
+
+    def __len__(self):
+        return len(self.linha_da_conta)
+
+    def get(self, codigo, default=None):
+        linha = self.linha_da_conta.get(codigo)
+        return default if linha is None else self.matriz[linha]
+
+
+# --- Motor linear (operador esparso por plano) ---
+# Analíticas são somas de linhas brutas, sintéticas são somas dos filhos e a maioria das fórmulas só soma e
+# subtrai contas: o plano é, quase todo, uma aplicação linear das linhas brutas vinculadas nas contas. O motor
+# 'linear' compila essa aplicação uma vez por plano e coluna de vínculo numa matriz esparsa e calcula a visão
+# inteira com um único produto (matriz esparsa x valores brutos), para todos os períodos de uma vez.
+# As contas que não são lineares (fórmulas com * ou /) e as que acumulariam termos demais viram "bases":
+# são calculadas antes, uma a uma, pelo motor vetorizado, e entram no produto como colunas extras.
+# Precisão: a ordem das somas muda, então os valores NÃO são idênticos aos do motor vetorizado. A diferença de
+# uma conta fica em torno de n x 1e-16 x (soma dos valores absolutos dos n termos brutos que ela combina), e não
+# relativa ao valor da conta: nas fórmulas que subtraem contas grandes e quase iguais (ex: 005 - 007 + 015), o
+# resultado é pequeno perto dos termos e o erro relativo cresce na mesma proporção (já se viu 1e-11 numa conta
+# de 2,5 milhões, e diferenças absolutas de 5e-12 na DADOS.xlsx). Use o motor vetorizado quando os valores
+# precisarem ser reproduzidos exatamente (conferências, comparação com execuções anteriores).
+# Requer o pacote scipy.
+LIMITE_TERMOS_OPERADOR = 256 # Termos por conta acima dos quais ela vira base (mantém a matriz esparsa)
+
+def scipy_disponivel():
+    """Indica se o pacote scipy (matrizes esparsas do motor 'linear') está instalado."""
+    return importlib.util.find_spec("scipy") is not None
+
+def _expandir_formula_linear(node, codigos, termos_da_conta):
+    """
+    Expande a árvore de uma fórmula compilada em {coluna: coeficiente} quando ela só tem + e - (binários ou
+    unários) e referências; retorna None se a fórmula não for linear. termos_da_conta(codigo) dá os termos
+    de cada conta referenciada.
+    """
+    tipo = node[0]
+    if tipo == "ref":
+        return dict(termos_da_conta(codigos[node[1]]))
+    if tipo in ("neg", "pos"):
+        termos = _expandir_formula_linear(node[1], codigos, termos_da_conta)
+        if termos is None or tipo == "pos":
+            return termos
+        return {coluna: -coeficiente for coluna, coeficiente in termos.items()}
+    if tipo in ("+", "-"):
+        termos = _expandir_formula_linear(node[1], codigos, termos_da_conta)
+        direita = _expandir_formula_linear(node[2], codigos, termos_da_conta)
+        if termos is None or direita is None:
+            return None
+        sinal = 1.0 if tipo == "+" else -1.0
+        for coluna, coeficiente in direita.items():
+            termos[coluna] = termos.get(coluna, 0.0) + sinal * coeficiente
+        return termos
+    return None # '*' e '/'
+
+class OperadorLinear:
+    """
+    Plano compilado para uma coluna de vínculo: valores das contas = matriz @ [linhas brutas; valores das bases].
+    - codigos_brutos: os códigos brutos das primeiras colunas da matriz, na ordem das colunas
+    - bases: as contas calculadas à parte, em ordem de avaliação (colunas seguintes, na mesma ordem)
+    - matriz: scipy.sparse.csr_matrix (uma linha por conta do plano, ver linha_da_conta)
+    """
+    __slots__ = ("codigos_brutos", "bases", "indice_base", "matriz", "linha_da_conta")
 
-    try:
-        xls = pd.ExcelFile(caminho_excel, engine='openpyxl')
-    except FileNotFoundError:
-        print(f"Erro: Arquivo '{caminho_excel}' não encontrado.")
-        return None
-    except Exception as e:
-        print(f"Erro ao ler o arquivo Excel: {e}")
-        print("Por favor, verifique se o arquivo Excel está salvo em um formato compatível (.xlsx ou .xls) e não está corrompido.")
+    def __init__(self, codigos_brutos, bases, matriz, linha_da_conta):
+        self.codigos_brutos = codigos_brutos
+        self.bases = bases
+        self.indice_base = {codigo: len(codigos_brutos) + i for i, codigo in enumerate(bases)}
+        self.matriz = matriz
+        self.linha_da_conta = linha_da_conta
+
+def compilar_operador_linear(account_dict, children_map, dependency_graph, ds_name):
+    """
+    Compila o plano, para a coluna de vínculo do DataSource ds_name, num OperadorLinear. As contas são
+    expandidas na ordem topológica em termos {coluna: coeficiente} sobre os códigos brutos vinculados (e as bases).
+    """
+    from scipy import sparse
+
+    coluna_bruta = {} # {codigo_bruto: coluna}
+    bases = []
+    termos = {} # {codigo_conta: {coluna: coeficiente}}; bases usam colunas negativas até a matriz ser montada
+    contas_em_ciclo = dependency_graph["contas_em_ciclo"]
+    vazio = {}
+
+    for account_code in dependency_graph["ordem"]:
+        account = account_dict[account_code]
+        tipo = account["tipo"].lower()
+        expr = {}
+
+        if account_code in contas_em_ciclo:
+            pass # Referência circular: valor é 0
+
+        elif tipo == "analitica":
+            data_code_mapping_str = account["data_sources"].get(ds_name)
+            if data_code_mapping_str:
+                for raw_code in (code.strip() for code in str(data_code_mapping_str).split(';')):
+                    if raw_code:
+                        coluna = coluna_bruta.setdefault(raw_code, len(coluna_bruta))
+                        expr[coluna] = expr.get(coluna, 0.0) + 1.0
+
+        elif tipo == "sintetica":
+            for child_code in children_map.get(account_code, []):
+                for coluna, coeficiente in termos[child_code].items():
+                    expr[coluna] = expr.get(coluna, 0.0) + coeficiente
+
+        elif tipo.startswith("calculo") and account.get("formula"):
+            formula_compilada = account.get("formula_compilada")
+            if formula_compilada is not None:
+                # Contas referenciadas que não existem no plano valem 0 (nenhum termo)
+                expr = _expandir_formula_linear(formula_compilada.arvore, formula_compilada.codigos,
+                                                lambda ref_code: termos.get(ref_code, vazio))
+
+        if expr is None or len(expr) > LIMITE_TERMOS_OPERADOR:
+            bases.append(account_code)
+            expr = {-len(bases): 1.0}
+        termos[account_code] = expr
+
+    num_brutas = len(coluna_bruta)
+    linha_da_conta = {codigo: linha for linha, codigo in enumerate(account_dict)}
+    linhas, colunas, coeficientes = [], [], []
+    for account_code, linha in linha_da_conta.items():
+        for coluna, coeficiente in termos[account_code].items():
+            linhas.append(linha)
+            colunas.append(coluna if coluna >= 0 else num_brutas - coluna - 1)
+            coeficientes.append(coeficiente)
+    matriz = sparse.csr_matrix((np.array(coeficientes, dtype=np.float64), (np.array(linhas, dtype=np.int64), np.array(colunas, dtype=np.int64))),
+                               shape=(len(linha_da_conta), num_brutas + len(bases)))
+    return OperadorLinear(list(coluna_bruta), bases, matriz, linha_da_conta)
+
+class _VetoresDoOperador:
+    """
+    Mapeamento {codigo_conta: vetor} usado no cálculo das bases: cada conta é obtida da sua linha do operador
+    sobre os valores já conhecidos (linhas brutas e bases já calculadas), e cada base calculada é guardada neles.
+    """
+    __slots__ = ("operador", "valores")
+
+    def __init__(self, operador, valores):
+        self.operador = operador
+        self.valores = valores
+
+    def get(self, codigo, default=None):
+        linha = self.operador.linha_da_conta.get(codigo)
+        if linha is None:
+            return default
+        matriz = self.operador.matriz
+        inicio, fim = matriz.indptr[linha], matriz.indptr[linha + 1]
+        return matriz.data[inicio:fim] @ self.valores[matriz.indices[inicio:fim]]
+
+    def __getitem__(self, codigo):
+        vetor = self.get(codigo)
+        if vetor is None:
+            raise KeyError(codigo)
+        return vetor
+
+    def __setitem__(self, codigo, vetor):
+        self.valores[self.operador.indice_base[codigo]] = vetor
+
+    def __contains__(self, codigo):
+        return codigo in self.operador.linha_da_conta
+
+    def __len__(self):
+        return len(self.operador.linha_da_conta)
+
+def calcular_valores_lineares(account_dict, children_map, dependency_graph, raw_matrix, raw_index, ds_name, num_periodos, estatisticas=None):
+    """
+    Equivalente a calcular_valores_vetorizados com o operador linear do plano. O operador de cada coluna de
+    vínculo é compilado na primeira visão que precisar dele e guardado em dependency_graph["operadores_lineares"],
+    então é reaproveitado pelos outros DataSources do plano com os mesmos vínculos. Retorna um mapeamento
+    {codigo_conta: vetor}.
+    """
+    vinculos = tuple(account["data_sources"].get(ds_name) for account in account_dict.values() if account["tipo"].lower() == "analitica")
+    operadores = dependency_graph.setdefault("operadores_lineares", {})
+    operador = operadores.get(vinculos)
+    if operador is None:
+        operador = operadores[vinculos] = compilar_operador_linear(account_dict, children_map, dependency_graph, ds_name)
+
+    # Valores conhecidos: as linhas brutas vinculadas (códigos ausentes no DataSource valem 0) e, depois, as bases
+    num_brutas = len(operador.codigos_brutos)
+    valores = np.zeros((num_brutas + len(operador.bases), num_periodos))
+    if raw_index:
+        posicoes = [(coluna, raw_index[codigo]) for coluna, codigo in enumerate(operador.codigos_brutos) if codigo in raw_index]
+        if posicoes:
+            colunas, linhas = zip(*posicoes)
+            valores[list(colunas)] = raw_matrix[list(linhas)]
+    if operador.bases:
+        calcular_valores_vetorizados(account_dict, children_map, dependency_graph, raw_matrix, raw_index, ds_name, num_periodos, estatisticas,
+                                     ordem=operador.bases, vectors=_VetoresDoOperador(operador, valores))
+    return _VetoresDaMatriz(np.asarray(operador.matriz @ valores), operador.linha_da_conta)
+
+
+# --- Leitores de planilha Excel (backends plugáveis) ---
+# Todos entregam as abas com a mesma convenção de pd.ExcelFile.parse (cabeçalho na 1ª linha): DataFrames, ou
+# TabelaDaAba no leitor 'leve', que não importa o pandas.
+# - 'openpyxl': caminho original (pd.ExcelFile com engine openpyxl, um objeto de célula por valor)
+# - 'openpyxl-streaming': openpyxl em modo read_only lendo apenas valores (values_only), sem objetos de célula
+# - 'calamine': leitor nativo (python-calamine), bem mais rápido, quando instalado
+# - 'leve': as mesmas células do 'calamine' (ou do 'openpyxl-streaming', sem python-calamine), sem pandas
+# - 'auto': calamine se estiver instalado, senão openpyxl-streaming
+EXCEL_READERS = ("auto", "leve", "openpyxl", "openpyxl-streaming", "calamine")
+DEFAULT_EXCEL_READER = "auto"
+# Pacotes pesados, importados só quando um recurso precisa deles (pandas: leitores 'openpyxl'/'calamine'/
+# 'openpyxl-streaming' e CSV sem pyarrow; scipy: engine 'linear'; pyarrow: --dados). As métricas listam os carregados.
+# O numpy fica de fora: é usado em todo o cálculo e importado no início do módulo.
+DEPENDENCIAS_PESADAS = ("pandas", "openpyxl", "python_calamine", "scipy", "pyarrow")
+
+def calamine_disponivel():
+    """Indica se o pacote python-calamine (leitor nativo) está instalado."""
+    return importlib.util.find_spec("python_calamine") is not None
+
+class LeitorExcel:
+    """Interface comum dos leitores: sheet_names, parse(sheet_name) -> DataFrame (ou TabelaDaAba) e close()."""
+    nome = None
+
+    def __init__(self, caminho_excel):
+        self.caminho_excel = caminho_excel
+        self.sheet_names = []
+
+    def parse(self, sheet_name):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class LeitorPandasExcel(LeitorExcel):
+    """Leitura via pd.ExcelFile com o engine indicado ('openpyxl' ou 'calamine')."""
+
+    def __init__(self, caminho_excel, engine):
+        import pandas as pd
+
+        super().__init__(caminho_excel)
+        self.nome = engine
+        self.xls = pd.ExcelFile(caminho_excel, engine=engine)
+        self.sheet_names = self.xls.sheet_names
+
+    def parse(self, sheet_name):
+        return self.xls.parse(sheet_name)
+
+    def close(self):
+        self.xls.close()
+
+class LeitorOpenpyxlStreaming(LeitorExcel):
+    """
+    Leitura com openpyxl em modo read_only, percorrendo apenas os valores das linhas (values_only).
+    Converte as células como o leitor openpyxl do pandas (vazias -> "", floats inteiros -> int, erros -> NaN)
+    e usa o mesmo TextParser do pandas para montar o DataFrame, então o resultado é o mesmo do caminho
+    original. Como values_only não informa o tipo da célula, textos iguais a códigos de erro do Excel
+    (ex: '#N/A') também viram NaN.
+    """
+    nome = "openpyxl-streaming"
+
+    def __init__(self, caminho_excel):
+        super().__init__(caminho_excel)
+        from openpyxl import load_workbook
+        self.book = load_workbook(caminho_excel, read_only=True, data_only=True, keep_links=False)
+        self.sheet_names = self.book.sheetnames
+
+    def _sheet_data(self, sheet):
+        from openpyxl.cell.cell import ERROR_CODES
+
+        sheet.reset_dimensions()
+        data = []
+        last_row_with_data = -1
+        for row_number, row in enumerate(sheet.iter_rows(values_only=True)):
+            converted_row = []
+            for value in row:
+                if value is None:
+                    value = ""
+                elif isinstance(value, float):
+                    if value.is_integer():
+                        value = int(value)
+                elif isinstance(value, str) and value in ERROR_CODES:
+                    value = np.nan
+                converted_row.append(value)
+            while converted_row and converted_row[-1] == "":
+                converted_row.pop() # Remove células vazias no fim da linha
+            if converted_row:
+                last_row_with_data = row_number
+            data.append(converted_row)
+
+        # Remove linhas vazias no fim e completa as linhas até a largura máxima
+        data = data[:last_row_with_data + 1]
+        if data:
+            max_width = max(len(data_row) for data_row in data)
+            data = [data_row + [""] * (max_width - len(data_row)) for data_row in data]
+        return data
+
+    def parse(self, sheet_name):
+        import pandas as pd
+        from pandas.io.parsers import TextParser
+
+        data = self._sheet_data(self.book[sheet_name])
+        if not data:
+            return pd.DataFrame()
+        return TextParser(data, header=0, skip_blank_lines=False).read()
+
+    def close(self):
+        self.book.close()
+
+# --- Leitor 'leve': as abas sem pandas (opcional, --reader leve) ---
+# O import do pandas é a parte mais demorada da partida do script. O leitor 'leve' lê as mesmas células dos
+# leitores 'calamine' e 'openpyxl-streaming' e repete só o que o TextParser do pandas faz com elas e que muda o
+# resultado de ler_aba_plano/ler_aba_dados (os valores dos períodos passam depois por safe_float_conversion):
+# - colunas sem nome viram 'Unnamed: N' e nomes repetidos ganham '.1', '.2'...
+# - textos como '', 'NA', '#N/A' e 'null' (os na_values padrão do pandas) viram células vazias
+# - colunas só de números ou textos numéricos viram int64/float64 (o código '0101' vira '101' e, numa coluna
+#   com células vazias, '101.0'), e colunas só de True/False, bool
+# Diferenças conhecidas, em casos raros: textos numéricos com mais de 17 dígitos (a última casa do float pode
+# mudar), inteiros fora do int64, colunas só de durações e linhas de cabeçalho só de datas ou só de números com
+# algum float. tests/test_leitor_leve.py compara o leitor com os leitores do pandas.
+TEXTOS_AUSENTES = frozenset({"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"})
+TEXTOS_VERDADEIROS = frozenset({"True", "TRUE", "true"})
+TEXTOS_FALSOS = frozenset({"False", "FALSE", "false"})
+_TEXTOS_INFINITOS = frozenset({"inf", "+inf", "-inf", "infinity", "+infinity", "-infinity"})
+_NUMERO_EM_TEXTO = re.compile(r'[ \t\n\v\f\r]*[+-]?([0-9]*)(\.[0-9]*)?([eE][+-]?[0-9]+)?[ \t\n\v\f\r]*\Z')
+_INT64_MIN, _INT64_MAX = -2**63, 2**63 - 1
+_DTYPE_INT64, _DTYPE_FLOAT64 = np.dtype(np.int64), np.dtype(np.float64)
+_DTYPE_BOOL, _DTYPE_OBJECT = np.dtype(bool), np.dtype(object)
+
+class TabelaDaAba:
+    """
+    Aba lida pelo leitor 'leve': os nomes das colunas (columns), o tipo que o pandas daria a cada coluna
+    (dtypes) e os valores de cada coluna (colunas), em listas com None nas células vazias.
+    """
+    def __init__(self, columns, dtypes, colunas):
+        self.columns = columns
+        self.dtypes = dtypes
+        self.colunas = colunas
+
+    def __len__(self):
+        return len(self.colunas[0]) if self.colunas else 0
+
+    def linhas(self, indices):
+        """Nova tabela só com as linhas indicadas, mantendo os tipos das colunas (como o dropna do pandas)."""
+        return TabelaDaAba(self.columns, self.dtypes, [[coluna[i] for i in indices] for coluna in self.colunas])
+
+def _numero_do_texto(texto):
+    """Número de um texto que o parser do pandas leria como número: int (sem ponto nem expoente), float ou None."""
+    if texto.lower() in _TEXTOS_INFINITOS:
+        return float(texto)
+    match = _NUMERO_EM_TEXTO.match(texto)
+    if match is None or not (match.group(1) or len(match.group(2) or "") > 1):
         return None
+    if match.group(2) is None and match.group(3) is None:
+        return int(texto)
+    return float(texto)
 
-    print("\n--- Lendo dados brutos (abas 'dados') ---")
-    for sheet_name in xls.sheet_names:
-        # Ignorar arquivos temporários do Excel e abas que não começam com 'dados'
-        if sheet_name.startswith('~$') or not sheet_name.lower().startswith("dados"):
+def _coluna_numerica(valores):
+    """
+    Converte a coluna como o pandas quando todos os valores são números, booleanos, textos numéricos ou células
+    vazias: retorna (dtype, valores) ou None se a coluna não for numérica.
+    """
+    flutuantes, inteiros = [], []
+    ausente = flutuante = inteiro = booleano = False
+    for valor in valores:
+        valor_float = None
+        if isinstance(valor, str):
+            if valor in TEXTOS_AUSENTES:
+                valor = math.nan
+            else:
+                texto, valor = valor, _numero_do_texto(valor)
+                if valor is None:
+                    return None
+                valor_float = float(texto) # '-0' é 0 nos inteiros, mas -0.0 se a coluna virar float
+        if isinstance(valor, bool):
+            booleano = True
+        elif isinstance(valor, float):
+            if valor != valor:
+                ausente = True
+                valor = None
+            else:
+                flutuante = True
+            flutuantes.append(valor)
+            inteiros.append(None)
             continue
+        elif not isinstance(valor, int):
+            return None # Datas, horas e outros objetos: coluna de objetos
+        elif not _INT64_MIN <= valor <= _INT64_MAX:
+            return None # Inteiros fora do int64 ficam como objetos
+        else:
+            inteiro = True
+        flutuantes.append(float(valor) if valor_float is None else valor_float)
+        inteiros.append(valor)
+    if ausente or flutuante:
+        return _DTYPE_FLOAT64, flutuantes
+    if inteiro:
+        return _DTYPE_INT64, [int(valor) for valor in inteiros]
+    if booleano:
+        return _DTYPE_BOOL, inteiros
+    return _DTYPE_INT64, inteiros # Coluna sem linhas
+
+def _converter_coluna(valores):
+    """
+    Tipo (dtype) e valores de uma coluna como o TextParser do pandas os deixaria, com None nas células vazias.
+    Colunas que não são numéricas ficam como objetos, com os valores como vieram; se todos forem True/False
+    (booleanos ou os textos 'True', 'FALSE'...), viram booleanos. Valores iguais de tipos diferentes (1, 1.0 e True)
+    ficam todos como o primeiro que aparece, como no pandas.
+    """
+    numerica = _coluna_numerica(valores)
+    if numerica is not None:
+        return numerica
+    valores = [None if (isinstance(valor, str) and valor in TEXTOS_AUSENTES) or (isinstance(valor, float) and valor != valor) else valor
+               for valor in valores]
+    presentes = [valor for valor in valores if valor is not None]
+    # O pandas só tenta booleanos se o primeiro valor não for um inteiro (bool inclusive)
+    if not isinstance(valores[0], int) and all(isinstance(valor, bool) or valor in TEXTOS_VERDADEIROS or valor in TEXTOS_FALSOS
+                                               for valor in presentes):
+        booleanos = [None if valor is None else (valor if isinstance(valor, bool) else valor in TEXTOS_VERDADEIROS) for valor in valores]
+        return (_DTYPE_OBJECT if len(presentes) < len(valores) else _DTYPE_BOOL), booleanos
+    primeiros = {}
+    return _DTYPE_OBJECT, [primeiros.setdefault(valor, valor) for valor in valores]
+
+def _nomes_das_colunas(cabecalho):
+    """Nomes das colunas como o TextParser do pandas: vazias viram 'Unnamed: N' e repetidas ganham '.1', '.2'..."""
+    nomes = [f"Unnamed: {i}" if nome == "" else nome for i, nome in enumerate(cabecalho)]
+    sem_nome = [i for i, nome in enumerate(cabecalho) if nome == ""]
+    contagens = defaultdict(int)
+    # As colunas com nome são renomeadas antes das sem nome, como no pandas
+    for i in [i for i in range(len(nomes)) if i not in sem_nome] + sem_nome:
+        nome = nome_original = nomes[i]
+        contagem = contagens[nome]
+        while contagem > 0:
+            contagens[nome_original] = contagem + 1
+            nome = f"{nome_original}.{contagem}"
+            if nome in nomes:
+                contagem += 1
+            else:
+                contagem = contagens[nome]
+        nomes[i] = nome
+        contagens[nome] = contagem + 1
+    return nomes
+
+def tabela_da_aba(linhas):
+    """Monta a TabelaDaAba de uma aba a partir das linhas de células (a primeira é o cabeçalho), sem pandas."""
+    if not linhas:
+        return TabelaDaAba([], [], [])
+    columns = _nomes_das_colunas(linhas[0])
+    dtypes, colunas = [], []
+    for valores in zip(*linhas[1:]) if len(linhas) > 1 else [() for _ in columns]:
+        dtype, valores = _converter_coluna(list(valores)) if valores else (_DTYPE_OBJECT, [])
+        dtypes.append(dtype)
+        colunas.append(valores)
+    return TabelaDaAba(columns, dtypes, colunas)
+
+def _celula_calamine(valor):
+    """Converte uma célula do python-calamine como o leitor calamine do pandas (floats inteiros -> int, datas -> datetime)."""
+    if isinstance(valor, float):
+        inteiro = int(valor)
+        return inteiro if inteiro == valor else valor
+    if isinstance(valor, datetime.date) and not isinstance(valor, datetime.datetime):
+        return datetime.datetime(valor.year, valor.month, valor.day)
+    return valor
+
+class LeitorLeve(LeitorExcel):
+    """
+    Leitura sem pandas: as linhas vêm do python-calamine, quando instalado, ou do openpyxl em modo read_only,
+    com as mesmas conversões de célula dos leitores 'calamine' e 'openpyxl-streaming', e cada aba vira uma
+    TabelaDaAba (ver tabela_da_aba) com o mesmo conteúdo do DataFrame que esses leitores entregariam.
+    """
+    nome = "leve"
+
+    def __init__(self, caminho_excel):
+        super().__init__(caminho_excel)
+        self.streaming = None
+        if calamine_disponivel():
+            from python_calamine import CalamineWorkbook, SheetTypeEnum
+            self.book = CalamineWorkbook.from_path(caminho_excel)
+            self.sheet_names = [sheet.name for sheet in self.book.sheets_metadata if sheet.typ == SheetTypeEnum.WorkSheet]
+        else:
+            self.streaming = LeitorOpenpyxlStreaming(caminho_excel)
+            self.book = self.streaming.book
+            self.sheet_names = self.streaming.sheet_names
 
-        ds_name = get_name_in_parentheses(sheet_name)
-        if not ds_name:
-            ds_name = sheet_name.strip()
-        print(f"Processando aba de Dados brutos: '{sheet_name}' -> Nome: '{ds_name}'")
-        try:
-            df_dados = xls.parse(sheet_name)
-            colunas_dados_raw = df_dados.columns.tolist()
-            if len(colunas_dados_raw) < 3:
-                 print(f"Aviso: A aba '{sheet_name}' de dados não tem colunas de dados/períodos suficientes. Ignorando.")
-                 continue
-
-            coluna_codigo_raw = colunas_dados_raw[0]
-            coluna_descricao_raw = colunas_dados_raw[1]
-            colunas_periodos_raw = colunas_dados_raw[2:]
-
-            # Limpar linhas sem código na primeira coluna
-            df_dados.dropna(subset=[coluna_codigo_raw], inplace=True)
-            # Tentar limpar a primeira linha (cabeçalho) caso seja um DataFrame multi-indexado ou com lixo inicial
-            if not df_dados.empty and str(df_dados.iloc[0][coluna_codigo_raw]).strip().lower() == str(coluna_codigo_raw).strip().lower():
-                df_dados = df_dados.iloc[1:].copy()
-                df_dados.reset_index(drop=True, inplace=True)
-                colunas_dados_raw = df_dados.columns.tolist()
-                coluna_codigo_raw = colunas_dados_raw[0]
-                coluna_descricao_raw = colunas_dados_raw[1]
-                colunas_periodos_raw = colunas_dados_raw[2:]
-                print(" - Primeira linha removida, parece ser cabeçalho repetido.")
-
-
-            registros_dados = []
-            periodos_ds = [] # Coleta os períodos deste DataSource
-
-            # Processa cabeçalhos de período para obter a lista de períodos formatados
-            for periodo_header_raw in colunas_periodos_raw:
-                if isinstance(periodo_header_raw, pd.Timestamp):
-                    # Formata datas como 'MMM/AAAA'
-                    formatted_header = periodo_header_raw.strftime('%Y-%m-%d %H:%M:%S') # Mantém o formato original de timestamp
+    def parse(self, sheet_name):
+        if self.streaming is not None:
+            linhas = self.streaming._sheet_data(self.book[sheet_name])
+        else:
+            linhas = [[_celula_calamine(valor) for valor in linha]
+                      for linha in self.book.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)]
+        return tabela_da_aba(linhas)
+
+    def close(self):
+        self.book.close()
+
+def resolver_leitor_excel(reader=DEFAULT_EXCEL_READER):
+    """Retorna o nome do leitor concreto que será usado para 'reader' ('auto' escolhe o mais rápido disponível)."""
+    if reader not in EXCEL_READERS:
+        raise ValueError(f"Leitor de planilha desconhecido: '{reader}'. Opções: {', '.join(EXCEL_READERS)}")
+    if reader == "auto":
+        return "calamine" if calamine_disponivel() else "openpyxl-streaming"
+    return reader
+
+def abrir_leitor_excel(caminho_excel, reader=DEFAULT_EXCEL_READER):
+    """Abre a planilha com o leitor escolhido (ver EXCEL_READERS) e retorna um LeitorExcel."""
+    reader = resolver_leitor_excel(reader)
+    if reader == "calamine":
+        if not calamine_disponivel():
+            raise ValueError("O leitor 'calamine' requer o pacote python-calamine (pip install python-calamine).")
+        return LeitorPandasExcel(caminho_excel, "calamine")
+    if reader == "openpyxl":
+        return LeitorPandasExcel(caminho_excel, "openpyxl")
+    if reader == "leve":
+        return LeitorLeve(caminho_excel)
+    return LeitorOpenpyxlStreaming(caminho_excel)
+
+
+# --- Cache incremental em disco ---
+# Abas lidas e visões calculadas ficam guardadas em disco, endereçadas pelo hash do conteúdo de cada aba.
+# Numa nova execução, só são relidas as abas que mudaram e só são recalculadas as visões (plano x DataSource)
+# cujo plano ou DataSource mudou.
+DEFAULT_CACHE_DIR = ".cache_processar_dados"
+DEFAULT_CACHE_LIMIT_MB = 200
+# Incrementar sempre que a leitura das abas, o cálculo ou o formato das visões mudar, para invalidar caches antigos
+CACHE_VERSION = 3
+
+_XLSX_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_XLSX_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_XLSX_NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Célula de texto compartilhado (t="s") e o índice do texto em sharedStrings
+_XLSX_SHARED_STRING_CELL = re.compile(rb'<(?:\w+:)?c\b[^>]*?\bt=["\']s["\'][^>]*>\s*<(?:\w+:)?v>(\d+)</(?:\w+:)?v>')
+
+def calcular_hashes_das_abas(caminho_excel):
+    """
+    Calcula um hash do conteúdo de cada aba de um .xlsx direto do pacote zip, sem abrir a planilha.
+    O hash de cada aba combina o XML da própria aba, os textos compartilhados (sharedStrings) que ela usa,
+    os estilos (formatos de data) e o sistema de datas 1904. Editar uma aba no Excel não muda o hash
+    das outras, a menos que a formatação da pasta de trabalho mude.
+    Retorna {nome_da_aba: hash} ou None se o arquivo não for um .xlsx legível (ex: .xls).
+    """
+    try:
+        with zipfile.ZipFile(caminho_excel) as pacote:
+            workbook = ElementTree.fromstring(pacote.read("xl/workbook.xml"))
+            relacoes = ElementTree.fromstring(pacote.read("xl/_rels/workbook.xml.rels"))
+
+            def caminho_da_parte(alvo):
+                # Alvos relativos são resolvidos a partir de 'xl/'; absolutos começam com '/'
+                return alvo.lstrip("/") if alvo.startswith("/") else posixpath.normpath(posixpath.join("xl", alvo))
+
+            alvos = {}
+            textos_compartilhados = []
+            hash_comum = hashlib.sha256()
+            propriedades = workbook.find(f"{_XLSX_NS_MAIN}workbookPr")
+            hash_comum.update(repr(propriedades.get("date1904") if propriedades is not None else None).encode())
+            for relacao in relacoes.iter(f"{_XLSX_NS_PKG}Relationship"):
+                alvos[relacao.get("Id")] = relacao.get("Target")
+                tipo = relacao.get("Type", "")
+                if tipo.endswith("/styles"):
+                    hash_comum.update(pacote.read(caminho_da_parte(relacao.get("Target"))))
+                elif tipo.endswith("/sharedStrings"):
+                    tabela = ElementTree.fromstring(pacote.read(caminho_da_parte(relacao.get("Target"))))
+                    textos_compartilhados = ["".join(t.text or "" for t in si.iter(f"{_XLSX_NS_MAIN}t"))
+                                             for si in tabela.iter(f"{_XLSX_NS_MAIN}si")]
+
+            hashes = {}
+            for sheet in workbook.iter(f"{_XLSX_NS_MAIN}sheet"):
+                xml_aba = pacote.read(caminho_da_parte(alvos[sheet.get(f"{_XLSX_NS_REL}id")]))
+                hash_aba = hash_comum.copy()
+                hash_aba.update(xml_aba)
+                total_celulas_texto = xml_aba.count(b't="s"') + xml_aba.count(b"t='s'")
+                indices = _XLSX_SHARED_STRING_CELL.findall(xml_aba) if total_celulas_texto else []
+                if len(indices) == total_celulas_texto:
+                    # Só os textos usados por esta aba, na ordem em que aparecem
+                    for indice in indices:
+                        hash_aba.update(repr(textos_compartilhados[int(indice)]).encode("utf-8"))
                 else:
-                    # Mantém como string e limpa espaços
-                    formatted_header = str(periodo_header_raw).strip()
-                periodos_ds.append(formatted_header)
+                    # Formato de célula não reconhecido: considera a tabela de textos inteira
+                    hash_aba.update(repr(textos_compartilhados).encode("utf-8"))
+                hashes[sheet.get("name")] = hash_aba.hexdigest()
+            return hashes or None
+    except (zipfile.BadZipFile, KeyError, IndexError, ElementTree.ParseError):
+        return None
 
-            # Processa as linhas de dados
-            for index, row in df_dados.iterrows():
-                # Pega o código e descrição da linha
-                codigo_dado = str(row[coluna_codigo_raw]).strip() if pd.notnull(row[coluna_codigo_raw]) else None
-                descricao_dado = str(row[coluna_descricao_raw]).strip() if pd.notnull(row[coluna_descricao_raw]) else None
+def calcular_hash_arquivo(caminho_arquivo):
+    """Hash SHA-256 do arquivo inteiro (usado quando não é possível separar o conteúdo por aba)."""
+    hash_arquivo = hashlib.sha256()
+    with open(caminho_arquivo, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+            hash_arquivo.update(bloco)
+    return hash_arquivo.hexdigest()
 
-                if not codigo_dado: # Pula linhas sem código na coluna de código
-                    continue
+class CacheIncremental:
+    """
+    Cache em disco com uma entrada (pickle) por chave, separadas em categorias ('dados', 'planos', 'visoes').
+    Registra o que foi reutilizado e o que foi recalculado, e remove as entradas usadas há mais tempo
+    quando o tamanho total passa do limite.
+    rebuild=True ignora as entradas existentes (tudo é recalculado e gravado de novo).
+    """
 
-                valores_por_periodo = {}
-                # Itera sobre as colunas de período para coletar os valores
-                for i, periodo_header_raw in enumerate(colunas_periodos_raw):
-                    periodo_formatted = periodos_ds[i] # Usa o cabeçalho formatado/limpo
-                    valor = row[periodo_header_raw]
-
-                    # Aqui NÃO fazemos conversão forte para float, apenas armazenamos o valor como lido
-                    # A conversão numérica e tratamento de None/NaN/erros é feita na função get_calculated_value
-                    if pd.isna(valor):
-                        valor = None # Armazena None para NaN
-
-                    valores_por_periodo[periodo_formatted] = valor
-
-                registros_dados.append({
-                    "codigo": codigo_dado,
-                    "descricao": descricao_dado,
-                    "valores": valores_por_periodo
-                })
-
-            # Armazena os dados brutos deste DS como um dicionário {codigo: {...}} para lookup rápido
-            if registros_dados:
-                all_raw_data[ds_name] = {
-                    "periodos": periodos_ds,
-                    "data": {item["codigo"]: item for item in registros_dados if item["codigo"] is not None}
-                }
-                print(f" - {len(registros_dados)} registros de dados brutos extraídos e indexados por código para '{ds_name}' com {len(periodos_ds)} períodos.")
+    def __init__(self, diretorio=DEFAULT_CACHE_DIR, limite_mb=DEFAULT_CACHE_LIMIT_MB, rebuild=False):
+        self.diretorio = diretorio
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self.rebuild = rebuild
+        self.reutilizados = defaultdict(list) # {categoria: [descrições]}
+        self.recalculados = defaultdict(list)
+
+    @staticmethod
+    def chave(*partes):
+        """Monta a chave de uma entrada a partir das partes que determinam o seu conteúdo."""
+        return hashlib.sha256(repr((CACHE_VERSION,) + partes).encode("utf-8")).hexdigest()
+
+    def _caminho(self, categoria, chave):
+        return os.path.join(self.diretorio, categoria, chave + ".pkl")
+
+    def carregar(self, categoria, chave, descricao):
+        """Retorna (True, valor) se a entrada existir no cache, senão (False, None)."""
+        caminho = self._caminho(categoria, chave)
+        if not self.rebuild and os.path.exists(caminho):
+            try:
+                with open(caminho, "rb") as arquivo:
+                    valor = pickle.load(arquivo)
+                os.utime(caminho) # Marca a entrada como usada recentemente (para a remoção por limite)
+                self.reutilizados[categoria].append(descricao)
+                return True, valor
+            except Exception as e:
+                print(f"Aviso: Entrada de cache ilegível '{caminho}' ({e}). Recalculando.")
+        self.recalculados[categoria].append(descricao)
+        return False, None
+
+    def salvar(self, categoria, chave, valor):
+        """Grava a entrada de forma atômica (arquivo temporário + os.replace)."""
+        caminho = self._caminho(categoria, chave)
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            caminho_temporario = f"{caminho}.{os.getpid()}.tmp"
+            with open(caminho_temporario, "wb") as arquivo:
+                pickle.dump(valor, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(caminho_temporario, caminho)
+        except OSError as e:
+            print(f"Aviso: Não foi possível gravar no cache '{caminho}': {e}")
+
+    def aplicar_limite(self):
+        """Remove as entradas usadas há mais tempo até o cache caber no limite de tamanho."""
+        entradas = []
+        for pasta, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                caminho = os.path.join(pasta, nome)
+                try:
+                    info = os.stat(caminho)
+                except OSError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        removidas = 0
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.limite_bytes:
+                break
+            try:
+                os.remove(caminho)
+            except OSError:
+                continue
+            total -= tamanho
+            removidas += 1
+        if removidas:
+            print(f"Cache: {removidas} entradas antigas removidas para respeitar o limite de {self.limite_bytes / (1024 * 1024):g} MB.")
+
+    def imprimir_relatorio(self):
+        """Mostra, por categoria, o que foi reutilizado do cache e o que foi recalculado."""
+        print(f"\n--- Cache incremental ('{self.diretorio}'{', reconstruído' if self.rebuild else ''}) ---")
+        for categoria in ("dados", "planos", "visoes"):
+            reutilizados = self.reutilizados.get(categoria, [])
+            recalculados = self.recalculados.get(categoria, [])
+            if not reutilizados and not recalculados:
+                continue
+            print(f" - {categoria}: {len(reutilizados)} reutilizados, {len(recalculados)} recalculados")
+            if recalculados:
+                print(f"   Recalculados: {recalculados}")
+
+
+# --- Leitura das abas (vetorizada, coluna a coluna) ---
+
+def _iterrows_dtype(df):
+    """
+    Tipo (dtype) que DataFrame.iterrows() daria a cada linha: se todas as colunas forem numéricas a linha
+    é convertida para o tipo comum (ex: códigos inteiros viram float), senão os valores são mantidos
+    como objetos. A leitura coluna a coluna usa o mesmo tipo para preservar a conversão para texto.
+    """
+    dtypes = list(df.dtypes)
+    if dtypes and all(isinstance(dtype, np.dtype) and dtype.kind in 'iuf' for dtype in dtypes):
+        return np.result_type(*dtypes)
+    return np.dtype(object)
+
+def _valor_como_texto(valor, row_dtype):
+    """Texto de um valor (não vazio) de uma TabelaDaAba depois da conversão para o tipo da linha (ver _iterrows_dtype)."""
+    if row_dtype.kind == 'f':
+        return str(float(valor))
+    if row_dtype.kind in 'iu':
+        return str(int(valor))
+    return str(valor)
+
+def _column_as_text(df, position, row_dtype):
+    """Valores de uma coluna como texto sem espaços nas bordas (None para NaN), como na leitura linha a linha."""
+    if isinstance(df, TabelaDaAba):
+        return [None if valor is None else _valor_como_texto(valor, row_dtype).strip() for valor in df.colunas[position]]
+    import pandas as pd
+
+    values = df.iloc[:, position].to_numpy(dtype=row_dtype)
+    not_null = pd.notnull(values)
+    return [str(value).strip() if ok else None for value, ok in zip(values.tolist(), not_null.tolist())]
+
+def _columns_as_float_matrix(df, first_position):
+    """
+    Converte as colunas a partir de first_position em uma matriz float64 (linhas x colunas), com a mesma
+    regra de safe_float_conversion: NaN/None e textos não numéricos viram 0.0.
+    Colunas numéricas são convertidas de uma vez; só colunas de texto/mistas passam valor a valor.
+    """
+    if isinstance(df, TabelaDaAba):
+        matrix = np.empty((len(df), len(df.colunas) - first_position), dtype=np.float64)
+        for j, (dtype, column) in enumerate(zip(df.dtypes[first_position:], df.colunas[first_position:])):
+            if dtype.kind in 'iufb':
+                matrix[:, j] = np.array(column, dtype=np.float64) # None (célula vazia) -> NaN
+            else:
+                matrix[:, j] = [safe_float_conversion(value) for value in column]
+        matrix[np.isnan(matrix)] = 0.0
+        return matrix
+    columns = df.iloc[:, first_position:]
+    if all(isinstance(dtype, np.dtype) and dtype.kind in 'iufb' for dtype in columns.dtypes):
+        matrix = columns.to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    else:
+        matrix = np.empty(columns.shape, dtype=np.float64)
+        for j in range(columns.shape[1]):
+            column = columns.iloc[:, j]
+            if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iufb':
+                matrix[:, j] = column.to_numpy(dtype=np.float64, na_value=np.nan)
             else:
-                print(f" - Nenhuns registros de dados brutos válidos encontrados na aba '{sheet_name}'.")
+                matrix[:, j] = [safe_float_conversion(value) for value in column.to_numpy(dtype=object).tolist()]
+    matrix[np.isnan(matrix)] = 0.0 # NaN (célula vazia) -> None -> 0.0
+    return matrix
+
+def _remover_linhas_sem_codigo(df, coluna_codigo_raw):
+    """
+    Descarta as linhas sem código na primeira coluna e, se a primeira linha restante repetir o cabeçalho dessa
+    coluna (DataFrame multi-indexado ou com lixo inicial), também ela. Aceita DataFrame ou TabelaDaAba.
+    """
+    if isinstance(df, TabelaDaAba):
+        df = df.linhas([i for i, codigo in enumerate(df.colunas[0]) if codigo is not None])
+        primeiro_codigo = _valor_como_texto(df.colunas[0][0], _iterrows_dtype(df)) if len(df) else None
+        if primeiro_codigo is not None and primeiro_codigo.strip().lower() == str(coluna_codigo_raw).strip().lower():
+            df = df.linhas(range(1, len(df)))
+            print(" - Primeira linha removida, parece ser cabeçalho repetido.")
+        return df
+    df = df.dropna(subset=[coluna_codigo_raw])
+    if not df.empty and str(df.iloc[0][coluna_codigo_raw]).strip().lower() == str(coluna_codigo_raw).strip().lower():
+        df = df.iloc[1:].reset_index(drop=True)
+        print(" - Primeira linha removida, parece ser cabeçalho repetido.")
+    return df
+
+def format_period_header(periodo_header_raw):
+    """Formata o cabeçalho de uma coluna de período como é usado nas chaves de 'valores'."""
+    pd = sys.modules.get("pandas") # Sem o pandas carregado (leitor 'leve') não existe pd.Timestamp
+    if pd is not None and isinstance(periodo_header_raw, pd.Timestamp):
+        return periodo_header_raw.strftime('%Y-%m-%d %H:%M:%S') # Mantém o formato original de timestamp
+    # Mantém como string e limpa espaços
+    return str(periodo_header_raw).strip()
+
+def ler_aba_dados(df_dados, sheet_name):
+    """
+    Lê uma aba de dados brutos (Código, Descrição, Períodos...) já carregada em um DataFrame (ou TabelaDaAba).
+    Os valores de todos os períodos viram uma única matriz float64 (uma linha por código), com as mesmas
+    conversões do motor recursivo (NaN/None e textos não numéricos -> 0.0). Retorna None se a aba não
+    tiver dados válidos, ou o dicionário:
+    - "periodos": cabeçalhos de período formatados, na ordem das colunas
+    - "codigos" / "descricoes": código e descrição de cada linha da matriz
+    - "matriz": array (linhas x períodos) de valores numéricos
+    - "indice_codigos": {codigo: linha} (em códigos repetidos vale a última linha, como antes)
+    - "indice_periodos": {periodo: coluna}
+    """
+    colunas_dados_raw = list(df_dados.columns) if isinstance(df_dados, TabelaDaAba) else df_dados.columns.tolist()
+    if len(colunas_dados_raw) < 3:
+        print(f"Aviso: A aba '{sheet_name}' de dados não tem colunas de dados/períodos suficientes. Ignorando.")
+        return None
+
+    coluna_codigo_raw = colunas_dados_raw[0]
+
+    # Limpar linhas sem código na primeira coluna (e o cabeçalho repetido)
+    df_dados = _remover_linhas_sem_codigo(df_dados, coluna_codigo_raw)
+
+    # Processa cabeçalhos de período para obter a lista de períodos formatados
+    periodos_ds = [format_period_header(periodo_header_raw) for periodo_header_raw in colunas_dados_raw[2:]]
+
+    row_dtype = _iterrows_dtype(df_dados)
+    codigos = _column_as_text(df_dados, 0, row_dtype)
+    descricoes = _column_as_text(df_dados, 1, row_dtype)
+    matriz = _columns_as_float_matrix(df_dados, 2)
+    return montar_dados_brutos(periodos_ds, codigos, descricoes, matriz, f"na aba '{sheet_name}'")
+
+def montar_dados_brutos(periodos_ds, codigos, descricoes, matriz, origem):
+    """
+    Monta o dicionário de dados brutos de um DataSource (ver ler_aba_dados) a partir das colunas já lidas:
+    códigos e descrições como texto (None se vazios) e a matriz float64 (linhas x períodos).
+    Linhas sem código são descartadas; retorna None se não sobrar nenhuma. origem: de onde vieram os dados, para o aviso (ex: "na aba 'X'").
+    """
+    # Pula linhas sem código na coluna de código
+    linhas_validas = [i for i, codigo in enumerate(codigos) if codigo]
+    if not linhas_validas:
+        print(f" - Nenhuns registros de dados brutos válidos encontrados {origem}.")
+        return None
+    if len(linhas_validas) < len(codigos):
+        codigos = [codigos[i] for i in linhas_validas]
+        descricoes = [descricoes[i] for i in linhas_validas]
+        matriz = matriz[linhas_validas]
+
+    return {
+        "periodos": periodos_ds,
+        "codigos": codigos,
+        "descricoes": descricoes,
+        "matriz": np.ascontiguousarray(matriz),
+        "indice_codigos": {codigo: linha for linha, codigo in enumerate(codigos)},
+        "indice_periodos": {periodo: coluna for coluna, periodo in enumerate(periodos_ds)},
+    }
+
+def ler_aba_plano(df_plano, sheet_name):
+    """
+    Lê uma aba de plano de contas (Código, Descrição, Tipo, vínculos por DataSource...) já carregada em um
+    DataFrame (ou TabelaDaAba), extraindo cada coluna de uma vez. Retorna (accounts_list, linked_data_sources_in_plan), ou
+    None se a aba não tiver as colunas básicas.
+    """
+    colunas_plano_raw = list(df_plano.columns) if isinstance(df_plano, TabelaDaAba) else df_plano.columns.tolist()
+    if len(colunas_plano_raw) < 3: # Mínimo: Código, Descrição, Tipo
+        print(f"Aviso: A aba '{sheet_name}' de plano não tem as 3 colunas básicas esperadas. Ignorando.")
+        return None
 
+    coluna_codigo_raw = colunas_plano_raw[0]
 
-        except Exception as e:
-            print(f"Erro ao processar a aba '{sheet_name}': {e}")
-            print("Verifique as colunas ('Código', 'Descrição', Períodos...) e o formato dos dados.")
+    data_source_columns = [] # Colunas de vínculo: [(posição da coluna, nome do DataSource entre parênteses)]
+    linked_data_sources_in_plan = set() # Rastreia quais DataSources este plano *referencia* nas colunas de vínculo
+    # Itera sobre as colunas a partir da 4ª para identificar os DataSources vinculados
+    for position, col_header_raw in enumerate(colunas_plano_raw[3:], start=3):
+        ds_name_from_col = get_name_in_parentheses(col_header_raw)
+        if ds_name_from_col:
+            data_source_columns.append((position, ds_name_from_col))
+            linked_data_sources_in_plan.add(ds_name_from_col)
+        else:
+            print(f"Aviso: Cabeçalho da coluna '{col_header_raw}' na aba '{sheet_name}' não tem nome de data source entre parênteses. Ignorando esta coluna para vínculos.")
+
+    df_plano = _remover_linhas_sem_codigo(df_plano, coluna_codigo_raw)
+
+    row_dtype = _iterrows_dtype(df_plano)
+    codigos = _column_as_text(df_plano, 0, row_dtype)
+    descricoes = _column_as_text(df_plano, 1, row_dtype)
+    tipos = _column_as_text(df_plano, 2, row_dtype)
+
+    # Vínculos {ds_name: codigo_bruto_referenciado_string} por conta; colunas posteriores do mesmo DataSource prevalecem
+    data_sources_maps = [{} for _ in codigos]
+    for position, ds_name_mapped in data_source_columns:
+        for i, vinculo in enumerate(_column_as_text(df_plano, position, row_dtype)):
+            if vinculo is not None:
+                # Armazena a string bruta do vínculo, incluindo ';' se houver
+                data_sources_maps[i][ds_name_mapped] = vinculo
+
+    accounts_list = []
+    for codigo, descricao, tipo_excel_value, data_sources_map in zip(codigos, descricoes, tipos, data_sources_maps):
+        # Mantém o valor do tipo_excel_value exatamente como no Excel para armazenamento
+        tipo_to_store = tipo_excel_value
+
+        # Tenta extrair a fórmula do campo 'Tipo' se ele começar com "calculo"
+        # (até o último ')', para manter os parênteses da própria fórmula, ex: "calculo (001 - (002 + 003))")
+        extracted_formula = None
+        if tipo_excel_value and tipo_excel_value.lower().startswith("calculo"):
+            match_formula_in_type = re.search(r'calculo\s*\((.*)\)', tipo_excel_value, re.IGNORECASE)
+            if match_formula_in_type:
+                extracted_formula = match_formula_in_type.group(1).strip()
+
+        # Fallback para o tipo se o valor do Excel estiver vazio
+        if not tipo_to_store:
+            print(f"Aviso: Tipo de conta inválido ou ausente para o código {codigo}. Usando 'sintetica' como padrão.")
+            tipo_to_store = "sintetica"
+
+        accounts_list.append({
+            "codigo": codigo,
+            "descricao": descricao,
+            "tipo": tipo_to_store,  # Armazena o texto completo, ex: "calculo (001 - 002)"
+            "formula": extracted_formula, # Armazena apenas a fórmula extraída, ex: "001 - 002"
+            "data_sources": data_sources_map,
+            "valores": {} # Inicializa o dicionário de valores
+        })
+
+    # Ordenar as contas pelo código para manter a hierarquia visual no JSON (opcional, mas recomendado)
+    accounts_list.sort(key=lambda x: x['codigo'])
+    return accounts_list, linked_data_sources_in_plan
+
+
+# --- Fontes de dados brutos em arquivos (CSV e Parquet) ---
+# Os DataSources também podem vir de arquivos exportados pelo ERP (--dados), sem passar pelo Excel, com a
+# mesma convenção das abas 'dados': Código, Descrição e uma coluna por período. O nome do DataSource vem do
+# nome do arquivo, como nas abas: 'dados (DS01).csv' -> 'DS01'; sem parênteses, vale o nome sem extensão
+# ('DS01.parquet' -> 'DS01'). Os planos continuam na planilha, e um arquivo substitui a aba do mesmo DataSource.
+# - CSV: separador ';' ou ',' detectado pelo cabeçalho; com ';' o separador decimal é a vírgula (como o Excel
+#   em português exporta). Texto em UTF-8 ou, se não for UTF-8 válido, Latin-1. Lido pelo leitor do pyarrow
+#   quando ele está instalado, senão pelo do pandas.
+# - Parquet (requer pyarrow): lido em memória mapeada e convertido coluna a coluna direto para a matriz.
+# Nos dois formatos valem as conversões das abas: células vazias e textos não numéricos valem 0.0.
+EXTENSOES_DADOS = (".csv", ".parquet")
+
+def pyarrow_disponivel():
+    """Indica se o pacote pyarrow (leitura de Parquet e leitura rápida de CSV) está instalado."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+def nome_da_fonte_de_dados(caminho):
+    """Nome do DataSource de um arquivo: o texto entre parênteses no nome do arquivo, ou o nome sem extensão."""
+    base = os.path.splitext(os.path.basename(caminho))[0]
+    return get_name_in_parentheses(base) or base.strip()
+
+def listar_fontes_de_dados(entradas):
+    """
+    Expande as entradas do --dados (pastas, arquivos ou padrões glob como 'erp/*.parquet') em {ds_name: caminho},
+    na ordem das entradas. Nas pastas entram os arquivos .csv e .parquet, em ordem alfabética. Se dois arquivos
+    tiverem o mesmo DataSource, vale o último.
+    """
+    import glob
 
+    fontes = {}
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            encontrados = [os.path.join(entrada, nome) for nome in sorted(os.listdir(entrada))
+                           if nome.lower().endswith(EXTENSOES_DADOS)]
+        else:
+            encontrados = sorted(glob.glob(entrada)) or ([entrada] if os.path.exists(entrada) else [])
+            if not encontrados:
+                print(f"Aviso: Nenhum arquivo de dados encontrado para '{entrada}'.")
+        for caminho in encontrados:
+            if not os.path.isfile(caminho):
+                continue
+            if not caminho.lower().endswith(EXTENSOES_DADOS):
+                print(f"Aviso: '{caminho}' não é um arquivo .csv ou .parquet. Ignorando.")
+                continue
+            ds_name = nome_da_fonte_de_dados(caminho)
+            if ds_name in fontes and fontes[ds_name] != caminho:
+                print(f"Aviso: O DataSource '{ds_name}' aparece em '{fontes[ds_name]}' e em '{caminho}'. Usando '{caminho}'.")
+            fontes[ds_name] = caminho
+    return fontes
+
+def _cabecalho_csv(caminho):
+    """
+    (nomes das colunas, separador, separador decimal, separador de milhares, codificação provável) lidos da primeira
+    linha do CSV. Com ';' o CSV é o do Excel em português: vírgula decimal e ponto nos milhares (ex: 1.234,56).
+    """
+    import csv
 
-    print("\n--- Lendo Planos de Contas (abas 'plano') ---")
-    for sheet_name in xls.sheet_names:
-        # Ignorar arquivos temporários do Excel e abas que não começam com 'plano'
-        if sheet_name.startswith('~$') or not sheet_name.lower().startswith("plano"):
+    try:
+        with open(caminho, encoding="utf-8-sig", newline="") as f:
+            primeira_linha = f.readline()
+            f.read(1 << 20) # Confere a codificação também no começo dos dados
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        with open(caminho, encoding="latin-1", newline="") as f:
+            primeira_linha = f.readline()
+        encoding = "latin-1"
+    separador, decimal, milhares = (";", ",", ".") if primeira_linha.count(";") > primeira_linha.count(",") else (",", ".", None)
+    nomes = next(csv.reader([primeira_linha.rstrip("\r\n")], delimiter=separador), [])
+    return nomes, separador, decimal, milhares, encoding
+
+def _numeros_de_coluna_de_texto(valores, decimal, milhares, periodo, origem):
+    """
+    Valores de uma coluna de período lida como texto (ou mista) de um arquivo de dados, como floats: os separadores
+    de milhares são removidos antes de trocar o separador decimal por ponto. Células vazias viram NaN; as que não são
+    números valem 0.0, com um aviso por coluna (em vez de sumirem sem aviso).
+    """
+    numeros, invalidos = [], []
+    for valor in valores:
+        if isinstance(valor, str):
+            texto = valor.strip()
+            if milhares:
+                texto = texto.replace(milhares, "")
+            if decimal != ".":
+                texto = texto.replace(decimal, ".")
+            valor = texto or None
+        if valor_ausente(valor):
+            numeros.append(math.nan)
             continue
+        try:
+            numeros.append(float(valor))
+        except (ValueError, TypeError):
+            invalidos.append(valor)
+            numeros.append(0.0)
+    if invalidos:
+        print(f"Aviso: {len(invalidos)} valor(es) não numérico(s) na coluna '{periodo}' {origem} (ex: '{invalidos[0]}'). Usando 0.0.")
+    return numeros
+
+def _dados_da_tabela_arrow(tabela, origem, decimal=".", milhares=None):
+    """
+    Dados brutos (ver montar_dados_brutos) de uma tabela do pyarrow: Código, Descrição e uma coluna por período.
+    decimal, milhares: separadores dos textos das colunas que o pyarrow não conseguiu ler como números.
+    """
+    import pyarrow as pa
+
+    if tabela.num_columns < 3:
+        print(f"Aviso: O arquivo {origem} não tem colunas de dados/períodos suficientes. Ignorando.")
+        return None
+    periodos_ds = [format_period_header(nome) for nome in tabela.column_names[2:]]
+    codigos, descricoes = ([str(valor).strip() if valor is not None else None for valor in tabela.column(posicao).to_pylist()]
+                           for posicao in (0, 1))
+
+    # Preenchida coluna a coluna (ordem Fortran); montar_dados_brutos a devolve contígua por linhas
+    matriz = np.empty((tabela.num_rows, len(periodos_ds)), dtype=np.float64, order="F")
+    for j in range(len(periodos_ds)):
+        coluna = tabela.column(j + 2)
+        tipo = coluna.type
+        if pa.types.is_integer(tipo) or pa.types.is_floating(tipo) or pa.types.is_decimal(tipo) or pa.types.is_boolean(tipo) or pa.types.is_null(tipo):
+            matriz[:, j] = coluna.cast(pa.float64()).to_numpy() # Nulos viram NaN
+        else:
+            # Coluna de texto (ou mista, ou com separador de milhares): valor a valor
+            matriz[:, j] = _numeros_de_coluna_de_texto(coluna.to_pylist(), decimal, milhares, periodos_ds[j], f"do arquivo {origem}")
+    matriz[np.isnan(matriz)] = 0.0
+    return montar_dados_brutos(periodos_ds, codigos, descricoes, matriz, f"no arquivo {origem}")
+
+def ler_csv_dados(caminho):
+    """Lê um CSV de dados brutos (Código, Descrição, Períodos...). Retorna o dicionário de ler_aba_dados, ou None."""
+    nomes, separador, decimal, milhares, encoding = _cabecalho_csv(caminho)
+    if len(nomes) < 3:
+        print(f"Aviso: O arquivo '{caminho}' não tem colunas de dados/períodos suficientes. Ignorando.")
+        return None
+
+    def ler(encoding):
+        if pyarrow_disponivel():
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+
+            # Os nomes das colunas vêm do cabeçalho já lido (sem BOM), numerados para que nomes repetidos
+            # não se confundam; Código e Descrição são sempre lidos como texto
+            nomes_unicos = [f"{posicao}:{nome}" for posicao, nome in enumerate(nomes)]
+            tabela = pa_csv.read_csv(
+                caminho,
+                read_options=pa_csv.ReadOptions(column_names=nomes_unicos, skip_rows=1, encoding="utf-8" if encoding == "utf-8-sig" else encoding),
+                parse_options=pa_csv.ParseOptions(delimiter=separador),
+                convert_options=pa_csv.ConvertOptions(column_types={nomes_unicos[0]: pa.string(), nomes_unicos[1]: pa.string()},
+                                                      decimal_point=decimal, strings_can_be_null=True),
+            )
+            return _dados_da_tabela_arrow(tabela.rename_columns(nomes), f"'{caminho}'", decimal, milhares)
+
+        import pandas as pd
+
+        df_dados = pd.read_csv(caminho, sep=separador, decimal=decimal, thousands=milhares, encoding=encoding,
+                               dtype={nomes[0]: str, nomes[1]: str}, keep_default_na=False, na_values=[""])
+        # Colunas que o pandas não conseguiu ler como números ficam em texto: valor a valor, como no pyarrow
+        for posicao in range(2, df_dados.shape[1]):
+            if not pd.api.types.is_numeric_dtype(df_dados.iloc[:, posicao]):
+                df_dados.isetitem(posicao, _numeros_de_coluna_de_texto(df_dados.iloc[:, posicao].tolist(), decimal, milhares,
+                                                                       format_period_header(df_dados.columns[posicao]), f"do arquivo '{caminho}'"))
+        return ler_aba_dados(df_dados, caminho)
+
+    try:
+        return ler(encoding)
+    except (UnicodeDecodeError, ValueError): # Texto inválido em UTF-8 depois do começo (o ArrowInvalid do pyarrow é um ValueError)
+        if encoding == "latin-1":
+            raise
+        return ler("latin-1")
+
+def ler_parquet_dados(caminho):
+    """
+    Lê um Parquet de dados brutos (Código, Descrição, Períodos...) em memória mapeada, com pyarrow.
+    Retorna o dicionário de ler_aba_dados, ou None.
+    """
+    if not pyarrow_disponivel():
+        raise ValueError("A leitura de arquivos Parquet requer o pacote pyarrow (pip install pyarrow).")
+    import pyarrow.parquet as pq
+
+    return _dados_da_tabela_arrow(pq.read_table(caminho, memory_map=True), f"'{caminho}'")
+
+def ler_fonte_de_dados(caminho):
+    """Lê um arquivo de dados brutos (.csv ou .parquet); retorna o dicionário de ler_aba_dados, ou None."""
+    if caminho.lower().endswith(".parquet"):
+        return ler_parquet_dados(caminho)
+    return ler_csv_dados(caminho)
+
+
+# --- Métricas de execução (--metrics-json / --profile) ---
+# Tempo e pico de memória por etapa, por aba e por visão, contadores do cálculo e tamanho da saída,
+# gravados num relatório JSON. A memória é a alocada pelo Python/NumPy, medida com tracemalloc quando
+# ele está ativo (o que deixa a execução mais lenta); sem tracemalloc, só os tempos são medidos.
+FORMATO_METRICAS = 1 # Versão do formato do relatório de métricas
+_BYTES_POR_MB = 1024 * 1024
+_picos_externos = [] # Pico de memória de cada medição em andamento, guardado antes de uma medição interna reiniciá-lo
 
-        plan_name = get_name_in_parentheses(sheet_name)
-        if not plan_name:
-             plan_name = sheet_name.strip()
-        print(f"Processando aba de Plano: '{sheet_name}' -> Nome: '{plan_name}'")
+@contextlib.contextmanager
+def medir_recursos(medidas):
+    """
+    Mede o bloco e grava em 'medidas' os segundos e, com o tracemalloc ativo, o pico de memória alocada
+    (pico_memoria_mb) e quanto ele passou da memória do início do bloco (memoria_adicional_mb).
+    Medições podem ser aninhadas: a interna não apaga o pico já atingido na externa.
+    """
+    rastreando = tracemalloc.is_tracing()
+    if rastreando:
+        memoria_inicial, pico = tracemalloc.get_traced_memory()
+        _picos_externos[:] = [max(pico_externo, pico) for pico_externo in _picos_externos]
+        _picos_externos.append(0)
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    try:
+        yield medidas
+    finally:
+        medidas["segundos"] = round(time.perf_counter() - inicio, 6)
+        if rastreando:
+            _, pico = tracemalloc.get_traced_memory()
+            pico = max(pico, _picos_externos.pop())
+            _picos_externos[:] = [max(pico_externo, pico) for pico_externo in _picos_externos]
+            medidas["pico_memoria_mb"] = round(pico / _BYTES_POR_MB, 3)
+            medidas["memoria_adicional_mb"] = round((pico - memoria_inicial) / _BYTES_POR_MB, 3)
+
+def novas_estatisticas_visao():
+    """Contadores preenchidos durante o cálculo de uma visão (ver calcular_visao)."""
+    return {"acertos_cache": 0, "faltas_cache": 0, "entradas_cache": 0,
+            "avaliacoes_formula": 0, "falhas_formula": 0, "formulas_invalidas": 0, "contas_em_ciclo": 0}
+
+def pico_rss_mb():
+    """Pico de memória residente (RSS) do processo em MB, ou None onde não há o módulo resource (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return round(pico / (_BYTES_POR_MB if sys.platform == "darwin" else 1024), 3)
+
+class MetricasExecucao:
+    """
+    Coleta as métricas de uma execução: etapas, abas lidas, planos, visões (calculadas ou do cache) e arquivos
+    de saída. caminho_perfil: se informado, a etapa de cálculo roda sob o cProfile e o perfil é gravado nesse arquivo.
+    """
+
+    def __init__(self, caminho_perfil=None):
+        self.inicio = datetime.datetime.now().astimezone()
+        self.caminho_perfil = caminho_perfil
+        self.etapas = []
+        self.abas = []
+        self.planos = []
+        self.visoes = []
+        self.saida = []
+        self.informacoes = {} # Dados livres da execução (planilha, opções, cache em disco...)
+        self.perfil = None # Funções mais demoradas do cProfile, depois de gravar_perfil
+
+    @contextlib.contextmanager
+    def etapa(self, nome, perfilar=False):
+        """Mede uma etapa; com perfilar=True e caminho_perfil definido, a etapa também roda sob o cProfile."""
+        medidas = {"etapa": nome}
+        perfilador = None
+        if perfilar and self.caminho_perfil:
+            import cProfile
+            perfilador = cProfile.Profile()
+        with medir_recursos(medidas):
+            if perfilador is not None:
+                perfilador.enable()
+            try:
+                yield medidas
+            finally:
+                if perfilador is not None:
+                    perfilador.disable()
+        self.etapas.append(medidas)
+        if perfilador is not None:
+            self.gravar_perfil(perfilador)
+
+    def gravar_perfil(self, perfilador, quantidade=15):
+        """Grava o perfil (abrir com pstats ou snakeviz) e guarda as funções com maior tempo acumulado."""
+        import pstats
+        perfilador.dump_stats(self.caminho_perfil)
+        estatisticas = pstats.Stats(perfilador)
+        funcoes = sorted(estatisticas.stats.items(), key=lambda item: item[1][3], reverse=True)[:quantidade]
+        self.perfil = {
+            "arquivo": self.caminho_perfil,
+            "funcoes": [{"funcao": f"{os.path.basename(arquivo)}:{linha}({nome})", "chamadas": chamadas,
+                         "tempo_proprio": round(tempo_proprio, 6), "tempo_acumulado": round(tempo_acumulado, 6)}
+                        for (arquivo, linha, nome), (_, chamadas, tempo_proprio, tempo_acumulado, _) in funcoes],
+        }
+
+    def registrar_aba(self, sheet_name, categoria, origem, medidas):
+        """origem: 'planilha' ou 'arquivo' (lida agora, da planilha ou de um arquivo CSV/Parquet) ou 'cache' (reutilizada do cache em disco)."""
+        self.abas.append({"aba": sheet_name, "categoria": categoria, "origem": origem, **medidas})
+
+    def registrar_plano(self, plan_name, num_contas, medidas_hierarquia):
+        self.planos.append({"plano": plan_name, "contas": num_contas, "hierarquia": medidas_hierarquia})
+
+    def registrar_visao(self, view, origem, estatisticas=None):
+        """origem: 'calculada' ou 'cache'; estatisticas: medidas e contadores do cálculo, se houver."""
+        self.visoes.append({"plano": view["plan_name"], "data_source": view["data_source_name"], "origem": origem,
+                            "contas_na_saida": len(view["accounts"]), "periodos": len(view["periodos"]),
+                            **(estatisticas or {})})
+
+    def registrar_saida(self, caminho, descricao):
+        """Registra um arquivo gerado e o seu tamanho."""
         try:
-            df_plano = xls.parse(sheet_name)
+            tamanho = os.path.getsize(caminho)
+        except OSError:
+            tamanho = None
+        self.saida.append({"arquivo": caminho, "descricao": descricao, "bytes": tamanho})
+
+    def relatorio(self):
+        """Dicionário com todas as métricas coletadas (o conteúdo do --metrics-json)."""
+        contadores = novas_estatisticas_visao()
+        for visao in self.visoes:
+            for chave in contadores:
+                contadores[chave] += visao.get(chave, 0)
+        return {
+            "formato": FORMATO_METRICAS,
+            "inicio": self.inicio.isoformat(),
+            **self.informacoes,
+            "pico_rss_mb": pico_rss_mb(),
+            "etapas": self.etapas,
+            "abas": self.abas,
+            "planos": self.planos,
+            "visoes": self.visoes,
+            "totais_calculo": contadores,
+            "saida": self.saida,
+            "bytes_saida": sum(arquivo["bytes"] or 0 for arquivo in self.saida),
+            "perfil": self.perfil,
+        }
+
+    def gravar(self, caminho):
+        """Grava o relatório em JSON de forma atômica (arquivo temporário + os.replace)."""
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(diretorio, exist_ok=True)
+        with open(caminho + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.relatorio(), f, ensure_ascii=False, indent=2)
+        os.replace(caminho + ".tmp", caminho)
+
+    def imprimir_resumo(self, quantidade=5):
+        """Mostra o tempo das etapas, as visões mais demoradas e os contadores do cálculo."""
+        print("\n--- Métricas da execução ---")
+        for medidas in self.etapas:
+            memoria = f", pico {medidas['pico_memoria_mb']:.1f} MB" if "pico_memoria_mb" in medidas else ""
+            print(f" - {medidas['etapa']}: {medidas['segundos']:.3f}s{memoria}")
+        calculadas = sorted((visao for visao in self.visoes if "segundos" in visao), key=lambda visao: visao["segundos"], reverse=True)
+        if calculadas:
+            print("Visões mais demoradas:")
+            for visao in calculadas[:quantidade]:
+                print(f" - '{visao['plano']}' x '{visao['data_source']}': {visao['segundos']:.3f}s, "
+                      f"{visao['avaliacoes_formula']} avaliações de fórmula ({visao['falhas_formula']} com falha)")
+        totais = self.relatorio()["totais_calculo"]
+        print(f"Cache de cálculo: {totais['acertos_cache']} acertos, {totais['faltas_cache']} faltas, {totais['entradas_cache']} entradas. "
+              f"Fórmulas: {totais['avaliacoes_formula']} avaliações, {totais['falhas_formula']} com falha (valem 0.0), "
+              f"{totais['formulas_invalidas']} inválidas.")
+        if "dependencias_carregadas" in self.informacoes:
+            print(f"Dependências carregadas: {', '.join(self.informacoes['dependencias_carregadas'])}.")
+        if self.perfil is not None:
+            print(f"Perfil do cálculo gravado em '{self.perfil['arquivo']}'. Funções com maior tempo acumulado:")
+            for funcao in self.perfil["funcoes"][:quantidade]:
+                print(f" - {funcao['funcao']}: {funcao['tempo_acumulado']:.3f}s ({funcao['chamadas']} chamadas)")
+
+
+# --- Visões compactas (valores numa matriz, dados das contas compartilhados) ---
+# Uma visão não guarda um dicionário por conta com outro dicionário {período: valor}: os valores ficam numa
+# única matriz float64 (contas da visão x períodos) e o código, a descrição, o tipo, a fórmula e o nível de
+# cada conta vêm dos MetadadosDoPlano, um objeto por plano compartilhado por todas as visões dele. As contas no
+# formato do index.html só são montadas, uma de cada vez, quando lidas (view["accounts"][i]) ou gravadas no
+# JSON (ver _json_default).
+
+class MetadadosDoPlano:
+    """
+    Dados de saída das contas de um plano, na ordem de accounts_list:
+    - codigos: código de cada conta
+    - campos: pares (chave, valor) de cada conta como vão para o JSON (sem 'data_sources' e 'formula_compilada')
+    - niveis: nível hierárquico de cada conta
+    - filtrar_zeros: True nas contas sintéticas e analíticas, que ficam fora da visão se todos os valores forem 0.0
+    """
+    __slots__ = ("codigos", "campos", "niveis", "filtrar_zeros")
+
+    def __init__(self, accounts_list, level_map):
+        self.codigos = [account["codigo"] for account in accounts_list]
+        self.campos = [tuple((chave, valor) for chave, valor in account.items() if chave not in ("data_sources", "formula_compilada"))
+                       for account in accounts_list]
+        self.niveis = [level_map.get(codigo, 1) for codigo in self.codigos]
+        self.filtrar_zeros = np.array([account["tipo"].lower() in ("sintetica", "analitica") for account in accounts_list], dtype=bool)
+
+def metadados_do_plano(accounts_list, hierarchy):
+    """MetadadosDoPlano do plano, criados na primeira visão e guardados no grafo de dependências da hierarquia."""
+    _, _, level_map, dependency_graph = hierarchy
+    metadados = dependency_graph.get("metadados_saida")
+    if metadados is None:
+        metadados = dependency_graph["metadados_saida"] = MetadadosDoPlano(accounts_list, level_map)
+    return metadados
+
+class VisaoCalculada(Mapping):
+    """
+    Visão calculada (Plano x DataSource) em forma compacta, lida como o dicionário da visão: view["plan_name"],
+    view["data_source_name"], view["periodos"], view["accounts"] (sequência de contas, cada uma montada quando
+    acessada) e, conforme a saída escolhida, "formato", "decimais", "delta" e "agregacoes".
+    - metadados / linhas: MetadadosDoPlano do plano e a posição nele de cada conta da visão
+    - valores: matriz float64 (contas da visão x períodos)
+    - formato / decimais / delta: codificação dos valores na saída (None = formato dicionário; ver converter_visao_colunar)
+    - agregacoes / agregados: layout e totais por modo {modo: matriz (contas da visão x períodos agregados)}
+      de adicionar_agregacoes, codificados como os valores
+    """
+    __slots__ = ("plan_name", "data_source_name", "periodos", "metadados", "linhas", "valores",
+                 "formato", "decimais", "delta", "agregacoes", "agregados")
+
+    def __init__(self, plan_name, data_source_name, periodos, metadados, linhas, valores):
+        self.plan_name = plan_name
+        self.data_source_name = data_source_name
+        self.periodos = periodos
+        self.metadados = metadados
+        self.linhas = linhas
+        self.valores = valores
+        self.formato = None
+        self.decimais = None
+        self.delta = False
+        self.agregacoes = None
+        self.agregados = None
+
+    def _chaves(self):
+        chaves = ["plan_name", "data_source_name", "periodos"]
+        if self.formato == "colunar":
+            chaves.extend(["formato", "decimais", "delta"] if self.decimais is not None else ["formato", "delta"])
+        chaves.append("accounts")
+        if self.agregacoes is not None:
+            chaves.append("agregacoes")
+        return chaves
+
+    def __getitem__(self, chave):
+        if chave not in self._chaves():
+            raise KeyError(chave)
+        return _ContasDaVisao(self) if chave == "accounts" else getattr(self, chave)
+
+    def __iter__(self):
+        return iter(self._chaves())
+
+    def __len__(self):
+        return len(self._chaves())
+
+    def conta(self, indice):
+        """Conta de posição 'indice' na visão, como dicionário no formato em que vai para o JSON."""
+        linha = int(self.linhas[indice])
+        campos = self.metadados.campos[linha]
+        valores = self.valores[indice].tolist()
+        sem_delta = False
+        if self.formato == "colunar":
+            conta = {chave: valor for chave, valor in campos if chave != "valores"}
+            conta["nivel"] = self.metadados.niveis[linha]
+            valores, delta_aplicado = _codificar_valores(valores, self.decimais, self.delta)
+            sem_delta = self.delta and not delta_aplicado
+            if sem_delta:
+                conta["sem_delta"] = True
+            conta["valores"] = valores
+        else:
+            conta = dict(campos)
+            conta["valores"] = dict(zip(self.periodos, valores))
+            conta["nivel"] = self.metadados.niveis[linha]
+        if self.agregados is not None:
+            conta["agregados"] = {mode: _codificar_valores(somas[indice].tolist(), self.decimais, self.delta and not sem_delta)[0]
+                                  for mode, somas in self.agregados.items()}
+        return conta
+
+    def como_dicionario(self):
+        """A visão inteira como dicionário comum (todas as contas montadas)."""
+        return {chave: list(valor) if chave == "accounts" else valor for chave, valor in self.items()}
+
+class _ContasDaVisao(Sequence):
+    """Sequência das contas de uma VisaoCalculada; cada conta é montada (VisaoCalculada.conta) ao ser acessada."""
+    __slots__ = ("visao",)
+
+    def __init__(self, visao):
+        self.visao = visao
+
+    def __len__(self):
+        return len(self.visao.linhas)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self.visao.conta(i) for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("índice de conta fora da visão")
+        return self.visao.conta(indice)
+
+    def __eq__(self, other):
+        return isinstance(other, (list, _ContasDaVisao)) and list(self) == list(other)
+
+def _json_default(objeto):
+    """'default' do json.dumps: grava as visões compactas montando as contas de uma visão por vez."""
+    if isinstance(objeto, VisaoCalculada):
+        return dict(objeto)
+    if isinstance(objeto, _ContasDaVisao):
+        return list(objeto)
+    raise TypeError(f"Object of type {type(objeto).__name__} is not JSON serializable")
+
+
+# --- Cálculo de uma visão (Plano x DataSource) e execução em paralelo ---
+def calcular_visao(plan_name, ds_name, accounts_list, hierarchy, raw_data_info, engine=DEFAULT_ENGINE, estatisticas=None):
+    """
+    Calcula a visão de um plano com um DataSource e retorna o dicionário da visão
+    (plan_name, data_source_name, periodos, accounts). Não depende de estado global,
+    então pode rodar em outro processo.
+    hierarchy: resultado de build_account_hierarchy(accounts_list).
+    raw_data_info: dados do DataSource (ver ler_aba_dados); usa periodos, matriz, indice_codigos e indice_periodos.
+    estatisticas: dicionário opcional de novas_estatisticas_visao(), preenchido com os contadores do cálculo.
+    """
+    account_dict, children_map, level_map, dependency_graph = hierarchy
+    periodos_ds = raw_data_info["periodos"]
 
-            colunas_plano_raw = df_plano.columns.tolist()
-            if len(colunas_plano_raw) < 3: # Mínimo: Código, Descrição, Tipo
-                 print(f"Aviso: A aba '{sheet_name}' de plano não tem as 3 colunas básicas esperadas. Ignorando.")
-                 continue
+    # Cache de cálculo próprio desta combinação (Plano + DataSource)
+    calculation_cache = {}
 
-            coluna_codigo_raw = colunas_plano_raw[0]
-            coluna_descricao_raw = colunas_plano_raw[1]
-            coluna_tipo_raw = colunas_plano_raw[2]
-            colunas_vinculo_raw = colunas_plano_raw[3:] # Da 4ª coluna em diante
-
-            data_source_columns_map = {} # Mapeamento de cabeçalho de coluna -> Nome DataSource (do parênteses)
-            linked_data_sources_in_plan = set() # Rastreia quais DataSources este plano *referencia* nas colunas de vínculo
-            # Itera sobre as colunas a partir da 4ª para identificar os DataSources vinculados
-            for col_header_raw in colunas_vinculo_raw:
-                ds_name_from_col = get_name_in_parentheses(col_header_raw)
-                if ds_name_from_col:
-                    # Mapeia o cabeçalho original da coluna para o nome do DataSource extraído
-                    data_source_columns_map[col_header_raw] = ds_name_from_col
-                    # Adiciona o nome do DataSource ao conjunto de DataSources referenciados por este plano
-                    linked_data_sources_in_plan.add(ds_name_from_col)
+    if engine == "linear":
+        # Todas as contas de uma vez, como o produto do operador esparso do plano pelos dados brutos
+        account_vectors = calcular_valores_lineares(account_dict, children_map, dependency_graph, raw_data_info["matriz"], raw_data_info["indice_codigos"], ds_name, len(periodos_ds), estatisticas)
+    else:
+        # Uma linha por conta do plano; o motor vetorizado grava cada conta direto na sua linha
+        account_vectors = _VetoresDaMatriz(np.zeros((len(account_dict), len(periodos_ds))),
+                                           {codigo: linha for linha, codigo in enumerate(account_dict)})
+    if engine == "vetorizado":
+        # Calcula todas as contas do plano de uma vez, cada uma como um vetor de períodos
+        calcular_valores_vetorizados(account_dict, children_map, dependency_graph, raw_data_info["matriz"], raw_data_info["indice_codigos"], ds_name, len(periodos_ds), estatisticas,
+                                     vectors=account_vectors)
+    elif engine == "recursivo":
+        # Contas em referência circular valem 0.0 em todos os períodos
+        for account_codigo in dependency_graph["contas_em_ciclo"]:
+            for period in periodos_ds:
+                calculation_cache[(account_codigo, period, ds_name)] = 0.0
+        # Preenche o cache na ordem topológica: cada chamada encontra as dependências já calculadas,
+        # então a recursão de get_calculated_value nunca passa de um nível
+        for account_codigo in dependency_graph["ordem"]:
+            for period in periodos_ds:
+                get_calculated_value(account_codigo, period, account_dict, children_map, raw_data_info, ds_name, calculation_cache, estatisticas)
+
+        for account in accounts_list:
+            # Chama a função de cálculo para obter o valor da conta em cada período, usando os dados deste DataSource
+            account_vectors[account["codigo"]] = [
+                get_calculated_value(account["codigo"], period, account_dict, children_map, raw_data_info, ds_name, calculation_cache, estatisticas)
+                for period in periodos_ds
+            ]
+
+    calculated_view = montar_visao(plan_name, ds_name, metadados_do_plano(accounts_list, hierarchy), periodos_ds, account_vectors)
+
+    if estatisticas is not None:
+        estatisticas["entradas_cache"] += len(calculation_cache) if engine == "recursivo" else len(account_vectors)
+        estatisticas["contas_em_ciclo"] += len(dependency_graph["contas_em_ciclo"])
+        # Contas 'calculo' cuja fórmula não compilou (valem 0.0 sem nenhuma avaliação)
+        estatisticas["formulas_invalidas"] += sum(1 for account in accounts_list
+                                                  if account["tipo"].lower().startswith("calculo") and account.get("formula")
+                                                  and account.get("formula_compilada") is None)
+    return calculated_view
+
+def montar_visao(plan_name, ds_name, metadados, periodos_ds, account_vectors):
+    """
+    Monta a VisaoCalculada a partir dos valores já calculados: account_vectors é um _VetoresDaMatriz com a
+    linha de cada conta do plano. Contas sintéticas e analíticas com todos os valores 0.0 ficam fora da visão
+    (se houver *qualquer* valor diferente de zero, a conta é mantida).
+    """
+    linha_da_conta = account_vectors.linha_da_conta
+    valores = account_vectors.matriz[[linha_da_conta[codigo] for codigo in metadados.codigos]]
+    manter = ~(metadados.filtrar_zeros & np.all(valores == 0.0, axis=1))
+    linhas = np.flatnonzero(manter).astype(np.int32)
+    if len(linhas) < len(valores):
+        valores = valores[linhas]
+    # Visão calculada completa (Plano, DataSource, Períodos, Contas com Valores)
+    return VisaoCalculada(plan_name, ds_name, periodos_ds, metadados, linhas, valores)
+
+def _compartilhar_dados_brutos(raw_data_info):
+    """
+    Copia a matriz de valores de um DataSource para um bloco de memória compartilhada.
+    Retorna (bloco, descrição serializável para os processos de cálculo); o bloco deve ser
+    fechado e liberado (close/unlink) por quem o criou.
+    """
+    from multiprocessing import shared_memory
+
+    matriz = raw_data_info["matriz"]
+    bloco = shared_memory.SharedMemory(create=True, size=max(matriz.nbytes, 1))
+    np.ndarray(matriz.shape, dtype=matriz.dtype, buffer=bloco.buf)[...] = matriz
+    descricao = {
+        "periodos": raw_data_info["periodos"],
+        "indice_codigos": raw_data_info["indice_codigos"],
+        "indice_periodos": raw_data_info["indice_periodos"],
+        "memoria": (bloco.name, matriz.shape, matriz.dtype.str),
+    }
+    return bloco, descricao
+
+def _calcular_visao_medida(plan_name, ds_name, accounts_list, hierarchy, raw_data_info, engine):
+    """Executa calcular_visao medindo tempo, memória e contadores; retorna (visão, estatísticas)."""
+    estatisticas = {"contas": len(accounts_list), **novas_estatisticas_visao()}
+    with medir_recursos(estatisticas):
+        view = calcular_visao(plan_name, ds_name, accounts_list, hierarchy, raw_data_info, engine, estatisticas)
+    return view, estatisticas
+
+def _calcular_visao_em_processo(plan_name, ds_name, accounts_list, hierarchy, dados_compartilhados, engine, medir=None):
+    """
+    Executa calcular_visao num processo de cálculo, lendo a matriz do DataSource da memória compartilhada.
+    medir: None (retorna só a visão), "tempo" ou "memoria" (retorna (visão, estatísticas); com "memoria"
+    o tracemalloc é ligado neste processo durante o cálculo).
+    """
+    from multiprocessing import shared_memory
+
+    nome, formato, dtype = dados_compartilhados["memoria"]
+    bloco = shared_memory.SharedMemory(name=nome)
+    ligou_tracemalloc = medir == "memoria" and not tracemalloc.is_tracing()
+    try:
+        raw_data_info = dict(dados_compartilhados)
+        raw_data_info["matriz"] = np.ndarray(formato, dtype=np.dtype(dtype), buffer=bloco.buf)
+        if medir is None:
+            resultado = calcular_visao(plan_name, ds_name, accounts_list, hierarchy, raw_data_info, engine)
+        else:
+            if ligou_tracemalloc:
+                tracemalloc.start()
+            resultado = _calcular_visao_medida(plan_name, ds_name, accounts_list, hierarchy, raw_data_info, engine)
+        del raw_data_info # A visão só tem valores copiados; nenhuma referência ao bloco pode sobrar antes do close
+        return resultado
+    finally:
+        if ligou_tracemalloc:
+            tracemalloc.stop()
+        bloco.close()
+
+def calcular_visoes(tarefas, all_raw_data, engine=DEFAULT_ENGINE, workers=1, estatisticas=None):
+    """
+    Calcula as visões descritas em 'tarefas' (lista de (plan_name, ds_name, accounts_list, hierarchy))
+    e retorna a lista de visões na mesma ordem das tarefas.
+    Com workers > 1 as visões são distribuídas num pool de processos; a matriz de cada DataSource
+    é enviada uma única vez, por memória compartilhada.
+    estatisticas: lista opcional que recebe, na ordem das tarefas, tempo, memória e contadores de cada visão
+    (nos processos de cálculo, a memória é medida com um tracemalloc próprio, se o deste processo estiver ativo).
+    """
+    workers = min(workers, len(tarefas))
+    if workers <= 1:
+        if estatisticas is None:
+            return [calcular_visao(plan_name, ds_name, accounts_list, hierarchy, all_raw_data[ds_name], engine)
+                    for plan_name, ds_name, accounts_list, hierarchy in tarefas]
+        views = []
+        for plan_name, ds_name, accounts_list, hierarchy in tarefas:
+            view, estatisticas_visao = _calcular_visao_medida(plan_name, ds_name, accounts_list, hierarchy, all_raw_data[ds_name], engine)
+            views.append(view)
+            estatisticas.append(estatisticas_visao)
+        return views
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    blocos = {} # {ds_name: (bloco de memória compartilhada, descrição)}
+    try:
+        for _, ds_name, _, _ in tarefas:
+            if ds_name not in blocos:
+                blocos[ds_name] = _compartilhar_dados_brutos(all_raw_data[ds_name])
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            medir = None if estatisticas is None else ("memoria" if tracemalloc.is_tracing() else "tempo")
+            futures = [executor.submit(_calcular_visao_em_processo, plan_name, ds_name, accounts_list, hierarchy, blocos[ds_name][1], engine, medir)
+                       for plan_name, ds_name, accounts_list, hierarchy in tarefas]
+            views = []
+            for future, (_, _, accounts_list, hierarchy) in zip(futures, tarefas):
+                if estatisticas is None:
+                    view = future.result()
                 else:
-                    print(f"Aviso: Cabeçalho da coluna '{col_header_raw}' na aba '{sheet_name}' não tem nome de data source entre parênteses. Ignorando esta coluna para vínculos.")
-
-
-            df_plano.dropna(subset=[coluna_codigo_raw], inplace=True)
-            # Tentar limpar a primeira linha (cabeçalho) caso seja um DataFrame multi-indexado ou com lixo inicial
-            if not df_plano.empty and str(df_plano.iloc[0][coluna_codigo_raw]).strip().lower() == str(coluna_codigo_raw).strip().lower():
-                df_plano = df_plano.iloc[1:].copy()
-                df_plano.reset_index(drop=True, inplace=True)
-                print(" - Primeira linha removida, parece ser cabeçalho repetido.")
-
-
-            accounts_list = []
-            for index, row in df_plano.iterrows():
-                # Pega os dados básicos da conta
-                codigo = str(row[coluna_codigo_raw]).strip() if pd.notnull(row[coluna_codigo_raw]) else None
-                descricao = str(row[coluna_descricao_raw]).strip() if pd.notnull(row[coluna_descricao_raw]) else None
-                tipo_excel_value = str(row[coluna_tipo_raw]).strip() if pd.notnull(row[coluna_tipo_raw]) else None
-
-                # Mantém o valor do tipo_excel_value exatamente como no Excel para armazenamento
-                tipo_to_store = tipo_excel_value
-
-                # Tenta extrair a fórmula do campo 'Tipo' se ele começar com "calculo"
-                extracted_formula = None
-                if tipo_excel_value and tipo_excel_value.lower().startswith("calculo"):
-                    match_formula_in_type = re.search(r'calculo\s*\((.*?)\)', tipo_excel_value, re.IGNORECASE)
-                    if match_formula_in_type:
-                        extracted_formula = match_formula_in_type.group(1).strip()
-                
-                # Fallback para o tipo se o valor do Excel estiver vazio
-                if not tipo_to_store:
-                    print(f"Aviso: Tipo de conta inválido ou ausente para o código {codigo}. Usando 'sintetica' como padrão.")
-                    tipo_to_store = "sintetica"
-
-                data_sources_map = {} # Dicionário {ds_name: codigo_bruto_referenciado_string}
-                # Itera sobre as colunas de vínculo identificadas para esta linha/conta
-                for col_raw, ds_name_mapped in data_source_columns_map.items():
-                    data_code_in_plan_cell = row[col_raw] # O valor da célula (pode ser 'COD1; COD2')
-                    if pd.notnull(data_code_in_plan_cell):
-                         # Armazena a string bruta do vínculo, incluindo ';' se houver, no mapeamento
-                        data_sources_map[ds_name_mapped] = str(data_code_in_plan_cell).strip()
-
-
-                accounts_list.append({
-                    "codigo": codigo,
-                    "descricao": descricao,
-                    "tipo": tipo_to_store,  # Armazena o texto completo, ex: "calculo (001 - 002)"
-                    "formula": extracted_formula, # Armazena apenas a fórmula extraída, ex: "001 - 002"
-                    "data_sources": data_sources_map,
-                    "valores": {} # Inicializa o dicionário de valores
-                })
-
-            # Ordenar as contas pelo código para manter a hierarquia visual no JSON (opcional, mas recomendado)
-            accounts_list.sort(key=lambda x: x['codigo'])
-
-            if accounts_list:
-                # Armazena as informações do plano, incluindo os DataSources que ele referencia
-                all_plans[plan_name] = {
-                    "accounts_list": accounts_list,
-                    "linked_data_sources": sorted(list(linked_data_sources_in_plan.intersection(all_raw_data.keys())))
-                }
-                print(f" - {len(accounts_list)} contas de plano extraídas e mapeadas para '{plan_name}'.")
-                print(f" - Este plano referencia os DataSources encontrados: {all_plans[plan_name]['linked_data_sources']}")
-            else:
-                print(f" - Nenhuma conta válida encontrada na aba '{sheet_name}'.")
+                    view, estatisticas_visao = future.result()
+                    estatisticas.append(estatisticas_visao)
+                # Cada visão volta do processo com a sua cópia dos metadados; as do mesmo plano passam a compartilhar uma só
+                view.metadados = metadados_do_plano(accounts_list, hierarchy)
+                views.append(view)
+            return views
+    finally:
+        for bloco, _ in blocos.values():
+            bloco.close()
+            bloco.unlink()
+
+
+def processar_planilha_integrado(caminho_excel='DADOS.xlsx', engine=DEFAULT_ENGINE, reader=DEFAULT_EXCEL_READER, cache=None, workers=1, metricas=None,
+                                 fontes_dados=None):
+    """
+    Processa a planilha Excel para extrair dados, planos, vincular, calcular
+    e estruturar em um objeto JSON de visões calculadas.
+    engine: 'vetorizado' (padrão) ou 'recursivo' (motor original, mantido para comparação).
+    reader: leitor da planilha (ver EXCEL_READERS); 'auto' usa o mais rápido disponível.
+    cache: CacheIncremental opcional; abas e visões cujo conteúdo não mudou são reutilizadas dele.
+    workers: número de processos para calcular as visões (1 = no próprio processo).
+    metricas: MetricasExecucao opcional, que recebe tempo e memória das etapas, abas, planos e visões.
+    fontes_dados: {ds_name: caminho} opcional de DataSources lidos de arquivos CSV/Parquet (ver listar_fontes_de_dados),
+    que substituem as abas 'dados' de mesmo nome.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de cálculo desconhecido: '{engine}'. Opções: {', '.join(ENGINES)}")
+    if engine == "linear" and not scipy_disponivel():
+        raise ValueError("O motor 'linear' requer o pacote scipy (pip install scipy).")
+    reader = resolver_leitor_excel(reader)
+
+    all_raw_data = {} # Armazena dados brutos por DataSource: {ds_name: {periodos:[], codigos:[], matriz: array(codigos x periodos), ...}} (ver ler_aba_dados)
+    all_plans = {} # Armazena definições de planos por nome de plano: {plan_name: {"accounts_list":[{codigo, descricao, tipo, formula, data_sources}], "linked_data_sources":[]}}
+    calculated_views = [] # Lista final de visões calculadas
+
+    def medir_etapa(nome, perfilar=False):
+        return metricas.etapa(nome, perfilar) if metricas is not None else contextlib.nullcontext()
+
+    # Com cache, a planilha só é aberta se alguma aba não estiver no cache
+    xls = None
+    sheet_hashes = None # {sheet_name: hash do conteúdo da aba}
+    try:
+        if cache is not None:
+            if not os.path.exists(caminho_excel):
+                raise FileNotFoundError(caminho_excel)
+            with medir_etapa("hashes_das_abas"):
+                sheet_hashes = calcular_hashes_das_abas(caminho_excel)
+        if sheet_hashes is None:
+            with medir_etapa("abertura_planilha"):
+                xls = abrir_leitor_excel(caminho_excel, reader)
+            if cache is not None:
+                # Formato sem partes separadas por aba (ex: .xls): o hash do arquivo inteiro vale para todas as abas
+                file_hash = calcular_hash_arquivo(caminho_excel)
+                sheet_hashes = {sheet_name: CacheIncremental.chave(file_hash, sheet_name) for sheet_name in xls.sheet_names}
+    except FileNotFoundError:
+        print(f"Erro: Arquivo '{caminho_excel}' não encontrado.")
+        return None
+    except Exception as e:
+        print(f"Erro ao ler o arquivo Excel: {e}")
+        print("Por favor, verifique se o arquivo Excel está salvo em um formato compatível (.xlsx ou .xls) e não está corrompido.")
+        return None
+    sheet_names = list(sheet_hashes) if sheet_hashes is not None else xls.sheet_names
+
+    def ler_aba_em_cache(categoria, sheet_name, ler_aba):
+        """Retorna o resultado de ler_aba(DataFrame da aba), reutilizando o cache quando a aba não mudou."""
+        nonlocal xls
+        medidas = {}
+        with medir_recursos(medidas):
+            found = False
+            if cache is not None:
+                key = CacheIncremental.chave(categoria, reader, sheet_hashes[sheet_name])
+                found, result = cache.carregar(categoria, key, sheet_name)
+            if not found:
+                if xls is None:
+                    xls = abrir_leitor_excel(caminho_excel, reader)
+                result = ler_aba(xls.parse(sheet_name), sheet_name)
+                if cache is not None:
+                    cache.salvar(categoria, key, result)
+        if metricas is not None:
+            metricas.registrar_aba(sheet_name, categoria, "cache" if found else "planilha", medidas)
+        return result
+
+    def ler_arquivo_em_cache(caminho):
+        """Como ler_aba_em_cache, para um arquivo de dados (CSV/Parquet); retorna (resultado, hash do arquivo ou None)."""
+        medidas = {}
+        file_hash = None
+        with medir_recursos(medidas):
+            found = False
+            if cache is not None:
+                file_hash = calcular_hash_arquivo(caminho)
+                key = CacheIncremental.chave("dados", "arquivo", os.path.splitext(caminho)[1].lower(), file_hash)
+                found, result = cache.carregar("dados", key, caminho)
+            if not found:
+                result = ler_fonte_de_dados(caminho)
+                if cache is not None:
+                    cache.salvar("dados", key, result)
+        if metricas is not None:
+            metricas.registrar_aba(caminho, "dados", "cache" if found else "arquivo", medidas)
+        return result, file_hash
+
+    print(f"Leitor de planilha: '{reader}'")
+    try:
+        # Os planos são lidos primeiro para saber quais DataSources são referenciados;
+        # abas de Dados que nenhum plano usa não são carregadas.
+        print("\n--- Lendo Planos de Contas (abas 'plano') ---")
+        plan_data_sources = {} # {plan_name: conjunto de DataSources referenciados nos cabeçalhos de vínculo}
+        data_source_hashes = {} # {ds_name: hash do conteúdo da aba de Dados}, usado nas chaves das visões em cache
+        with medir_etapa("leitura_planos"):
+            for sheet_name in sheet_names:
+                # Ignorar arquivos temporários do Excel e abas que não começam com 'plano'
+                if sheet_name.startswith('~$') or not sheet_name.lower().startswith("plano"):
+                    continue
 
+                plan_name = get_name_in_parentheses(sheet_name)
+                if not plan_name:
+                     plan_name = sheet_name.strip()
+                print(f"Processando aba de Plano: '{sheet_name}' -> Nome: '{plan_name}'")
+                try:
+                    plano_lido = ler_aba_em_cache("planos", sheet_name, ler_aba_plano)
+                    if plano_lido is None:
+                        continue
+                    accounts_list, linked_data_sources_in_plan = plano_lido
+                    # Compila as fórmulas das contas 'calculo' uma única vez por plano
+                    # (planos reutilizados do cache em memória do modo --watch já vêm compilados)
+                    if any("formula_compilada" not in account for account in accounts_list):
+                        compilar_formulas_do_plano(accounts_list, plan_name)
+
+                    if accounts_list:
+                        all_plans[plan_name] = {"accounts_list": accounts_list,
+                                                "hash": sheet_hashes[sheet_name] if sheet_hashes is not None else None}
+                        plan_data_sources[plan_name] = linked_data_sources_in_plan
+                        print(f" - {len(accounts_list)} contas de plano extraídas e mapeadas para '{plan_name}'.")
+                    else:
+                        print(f" - Nenhuma conta válida encontrada na aba '{sheet_name}'.")
+
+
+                except Exception as e:
+                    print(f"Erro ao processar a aba '{sheet_name}': {e}")
+                    print("Verifique as colunas ('Código', 'Descrição', 'Tipo') e os cabeçalhos/códigos das colunas de vínculo.")
+
+        referenced_data_sources = set().union(*plan_data_sources.values())
+
+        print("\n--- Lendo dados brutos (abas 'dados') ---")
+        with medir_etapa("leitura_dados"):
+            for sheet_name in sheet_names:
+                # Ignorar arquivos temporários do Excel e abas que não começam com 'dados'
+                if sheet_name.startswith('~$') or not sheet_name.lower().startswith("dados"):
+                    continue
 
-        except Exception as e:
-            print(f"Erro ao processar a aba '{sheet_name}': {e}")
-            print("Verifique as colunas ('Código', 'Descrição', 'Tipo') e os cabeçalhos/códigos das colunas de vínculo.")
+                ds_name = get_name_in_parentheses(sheet_name)
+                if not ds_name:
+                    ds_name = sheet_name.strip()
+                if ds_name not in referenced_data_sources:
+                    print(f"Ignorando aba de Dados '{sheet_name}' -> Nome: '{ds_name}': nenhum plano referencia este DataSource.")
+                    continue
+                if fontes_dados and ds_name in fontes_dados:
+                    print(f"Ignorando aba de Dados '{sheet_name}' -> Nome: '{ds_name}': o DataSource vem do arquivo '{fontes_dados[ds_name]}'.")
+                    continue
+                print(f"Processando aba de Dados brutos: '{sheet_name}' -> Nome: '{ds_name}'")
+                try:
+                    raw_data_info = ler_aba_em_cache("dados", sheet_name, ler_aba_dados)
+                    if raw_data_info is not None:
+                        all_raw_data[ds_name] = raw_data_info
+                        data_source_hashes[ds_name] = sheet_hashes[sheet_name] if sheet_hashes is not None else None
+                        print(f" - {len(raw_data_info['codigos'])} registros de dados brutos extraídos e indexados por código para '{ds_name}' com {len(raw_data_info['periodos'])} períodos.")
+
+                except Exception as e:
+                    print(f"Erro ao processar a aba '{sheet_name}': {e}")
+                    print("Verifique as colunas ('Código', 'Descrição', Períodos...) e o formato dos dados.")
+
+        if fontes_dados:
+            print("\n--- Lendo dados brutos de arquivos (CSV/Parquet) ---")
+            with medir_etapa("leitura_dados_arquivos"):
+                for ds_name, caminho in fontes_dados.items():
+                    if ds_name not in referenced_data_sources:
+                        print(f"Ignorando arquivo de dados '{caminho}' -> Nome: '{ds_name}': nenhum plano referencia este DataSource.")
+                        continue
+                    print(f"Processando arquivo de dados brutos: '{caminho}' -> Nome: '{ds_name}'")
+                    try:
+                        raw_data_info, file_hash = ler_arquivo_em_cache(caminho)
+                        if raw_data_info is not None:
+                            all_raw_data[ds_name] = raw_data_info
+                            data_source_hashes[ds_name] = file_hash
+                            print(f" - {len(raw_data_info['codigos'])} registros de dados brutos extraídos e indexados por código para '{ds_name}' com {len(raw_data_info['periodos'])} períodos.")
+                    except Exception as e:
+                        print(f"Erro ao processar o arquivo '{caminho}': {e}")
+                        print("Verifique as colunas ('Código', 'Descrição', Períodos...) e o formato dos dados.")
+    finally:
+        if xls is not None:
+            xls.close()
+
+    # Vincula cada plano aos DataSources que ele referencia e que foram encontrados
+    for plan_name, plan_info in all_plans.items():
+        plan_info["linked_data_sources"] = sorted(list(plan_data_sources[plan_name].intersection(all_raw_data.keys())))
+        print(f" - Plano '{plan_name}' referencia os DataSources encontrados: {plan_info['linked_data_sources']}")
 
     # --- Etapa de Cálculo e Geração de Visões Integradas ---
-    print("\n--- Realizando Cálculos e Gerando Visões Integradas ---")
-    global calculation_cache 
+    print(f"\n--- Realizando Cálculos e Gerando Visões Integradas (motor '{engine}') ---")
+
+    # Primeiro decide, na ordem final, o que vem do cache e o que precisa ser calculado;
+    # depois calcula as pendentes (em paralelo com workers > 1) e monta a lista na mesma ordem.
+    view_slots = [] # Um item por visão: ("cache", visão) ou ("calcular", índice em tarefas, chave do cache)
+    tarefas = [] # (plan_name, ds_name, accounts_list, hierarchy)
 
     # Itera por cada plano que foi lido com sucesso
     for plan_name, plan_info in all_plans.items():
@@ -414,154 +2322,1051 @@ def processar_planilha_integrado(caminho_excel='DADOS.xlsx'):
 
         print(f"Calculando visões para o plano '{plan_name}'...")
 
-        # Constrói a hierarquia para este plano (uma vez por plano)
-        account_dict, children_map, level_map = build_account_hierarchy(accounts_list)
+        # A hierarquia é construída uma vez por plano, na primeira visão que precisar ser calculada
+        hierarchy = None
 
         # Para cada DataSource que este plano referencia E foi lido com sucesso
         for ds_name in sorted(linked_data_sources): 
-            # print(f" - Gerando visão calculada para '{plan_name}' usando DataSource '{ds_name}'...") 
-
             raw_data_info = all_raw_data[ds_name] 
-            raw_data_for_ds_dict = raw_data_info["data"] 
             periodos_ds = raw_data_info["periodos"] 
 
             if not periodos_ds:
                  print(f" - DataSource '{ds_name}' não tem períodos. Pulando cálculo para esta combinação.")
                  continue
 
-            # Limpa o cache de cálculo para a NOVA COMBINAÇÃO (Plano + DataSource)
-            calculation_cache = {}
-
-            # Lista para armazenar as contas deste plano COM OS VALORES CALCULADOS para este DataSource
-            calculated_accounts_for_view = []
-
-            # Itera por cada conta do plano para calcular seus valores para todos os períodos deste DataSource
-            for account in accounts_list:
-                account_codigo = account["codigo"]
-                # Dicionário para armazenar os valores calculados/obtidos desta conta para todos os períodos deste DataSource
-                account_calculated_values = {}
-  
-                # Itera por cada período deste DataSource
-                for period in periodos_ds:
-                    # Chama a função de cálculo para obter o valor da conta neste período, usando os dados deste DataSource
-                    value = get_calculated_value(account_codigo, period, account_dict, children_map, raw_data_for_ds_dict, ds_name)
-                    account_calculated_values[period] = value
-  
-                # Cria uma cópia da conta original do plano
-                calculated_account = account.copy()
-                # Adiciona o dicionário de valores calculados/obtidos para este DataSource
-                calculated_account["valores"] = account_calculated_values
-                # Adiciona o nível hierárquico
-                calculated_account["nivel"] = level_map.get(account_codigo, 1)
-                # Remove o mapeamento bruto para os DataSources para a saída final do JSON, se presente
-                if "data_sources" in calculated_account:
-                    del calculated_account["data_sources"]
-                
-                # Mantém o campo 'formula' na saída JSON se ele tiver sido preenchido
-                # Não há necessidade de 'del' se o get("formula") for None, ele simplesmente não será incluído.
-  
-                # --- INÍCIO DA NOVA LÓGICA: FILTRAR CONTAS SINTÉTICAS COM VALOR ZERO ---
-                should_add_account = True
-                # Verifica se a conta é sintética e se todos os seus valores são zero
-                if calculated_account["tipo"].lower() in ["sintetica", "analitica"]:
-                    # Verifica se todos os valores para esta conta sintética ou analitica são 0.0
-                    # Isso garante que se houver *qualquer* valor diferente de zero, a conta seja mantida.
-                    all_values_are_zero = all(val == 0.0 for val in calculated_account["valores"].values())
-                    if all_values_are_zero:
-                        should_add_account = False
-                
-                if should_add_account:
-                    calculated_accounts_for_view.append(calculated_account)
-                # --- FIM DA NOVA LÓGICA ---
-
-            # Adiciona a visão calculada completa (Plano, DataSource, Períodos, Contas com Valores) à lista final de visões
-            calculated_views.append({
-                "plan_name": plan_name,
-                "data_source_name": ds_name,
-                "periodos": periodos_ds, # Inclui os períodos usados por este DataSource (já ordenado)
-                "accounts": calculated_accounts_for_view # Lista de contas deste plano com valores calculados para este DataSource
-            })
-            print(f" - Visão calculada gerada para '{plan_name}' com '{ds_name}'. ({len(calculated_accounts_for_view)} contas)")
+            # A visão só depende do conteúdo do plano, do conteúdo do DataSource e do motor de cálculo
+            view_key = None
+            if cache is not None:
+                view_key = CacheIncremental.chave("visoes", engine, reader, plan_name, plan_info["hash"], ds_name, data_source_hashes[ds_name])
+                found, cached_view = cache.carregar("visoes", view_key, f"{plan_name} x {ds_name}")
+                if found:
+                    view_slots.append(("cache", cached_view))
+                    continue
+
+            if hierarchy is None:
+                medidas_hierarquia = {}
+                with medir_recursos(medidas_hierarquia):
+                    hierarchy = build_account_hierarchy(accounts_list)
+                    # Referências circulares são informadas uma vez por plano, antes de qualquer cálculo
+                    report_dependency_cycles(hierarchy[3], plan_name)
+                if metricas is not None:
+                    metricas.registrar_plano(plan_name, len(accounts_list), medidas_hierarquia)
+            view_slots.append(("calcular", len(tarefas), view_key))
+            tarefas.append((plan_name, ds_name, accounts_list, hierarchy))
+
+    if workers > 1 and len(tarefas) > 1:
+        print(f"Calculando {len(tarefas)} visões com até {min(workers, len(tarefas))} processos...")
+    estatisticas_visoes = [] if metricas is not None else None
+    with medir_etapa("calculo", perfilar=True):
+        computed_views = calcular_visoes(tarefas, all_raw_data, engine, workers, estatisticas_visoes)
+
+    for slot in view_slots:
+        if slot[0] == "cache":
+            calculated_view = slot[1]
+            print(f" - Visão reutilizada do cache para '{calculated_view['plan_name']}' com '{calculated_view['data_source_name']}'. ({len(calculated_view['accounts'])} contas)")
+            if metricas is not None:
+                metricas.registrar_visao(calculated_view, "cache")
+        else:
+            _, task_index, view_key = slot
+            calculated_view = computed_views[task_index]
+            if cache is not None:
+                cache.salvar("visoes", view_key, calculated_view)
+            print(f" - Visão calculada gerada para '{calculated_view['plan_name']}' com '{calculated_view['data_source_name']}'. ({len(calculated_view['accounts'])} contas)")
+            if metricas is not None:
+                metricas.registrar_visao(calculated_view, "calculada", estatisticas_visoes[task_index])
+        calculated_views.append(calculated_view)
+
+    if cache is not None:
+        cache.aplicar_limite()
+        cache.imprimir_relatorio()
+        if metricas is not None:
+            metricas.informacoes["cache_disco"] = {categoria: {"reutilizados": len(cache.reutilizados.get(categoria, [])),
+                                                               "recalculados": len(cache.recalculados.get(categoria, []))}
+                                                   for categoria in ("dados", "planos", "visoes")}
     # Retorna o dicionário final contendo a lista de todas as visões calculadas
     return {"calculated_views": calculated_views}
 
 
-def update_index_html_with_json(caminho_html='index.html', dados_json={}):
+# --- Modelo de cálculo importável (simulações "what-if") ---
+# Para cenários interativos (ex: orçamento) sem reprocessar a planilha: um ModeloCalculo mantém os valores de
+# todas as contas de um plano em cada DataSource e, a cada edição (valor bruto ou fórmula), recalcula só as
+# contas afetadas, isto é, as que dependem do que mudou direta ou indiretamente pelas dependências
+# reversas do grafo (filhos -> sintéticas, referências -> contas 'calculo'). Exemplo:
+#     import processar_dados
+#     modelo = processar_dados.carregar_modelos("DADOS.xlsx")["PLANO01"]
+#     modelo.set_raw("DS01", "R0001", "2025-01-01 00:00:00", 1500.0)
+#     modelo.set_formula("010", "001 - 002") # Só códigos de conta: cada número da fórmula é uma conta
+#     modelo.value("010", "2025-01-01 00:00:00", "DS01")
+
+class ModeloCalculo:
     """
-    Lê o arquivo index.html, encontra a definição da variável JS alvo e a substitui/injeta
-    o JSON calculado. Preserva o restante do HTML.
+    Modelo de um plano de contas com os DataSources vinculados, com os mesmos valores do motor vetorizado.
+    - value(account, period, ds): valor atual de uma conta num período de um DataSource
+    - set_raw(ds, raw_code, period, value): altera um valor bruto e recalcula as contas afetadas, nos períodos
+      desse DataSource
+    - set_formula(account, formula): transforma a conta em 'calculo (formula)' e recalcula as contas afetadas
+      em todos os DataSources
+    - view(ds): a visão no formato de calcular_visao, com os valores atuais
+    As contas e as matrizes de dados brutos recebidas são copiadas, então as edições não as alteram. Os valores
+    de um DataSource são calculados, de uma vez, no primeiro acesso a ele.
     """
-    js_variable_name = 'calculatedViewsData'
-    pattern = r'(const|let|var)\s+' + re.escape(js_variable_name) + r'\s*=\s*({.*?});'
 
-    html_content = None
+    def __init__(self, plan_name, accounts_list, raw_data_by_ds):
+        """
+        accounts_list: contas do plano (ver ler_aba_plano); raw_data_by_ds: {ds_name: dados do DataSource}
+        (ver ler_aba_dados), apenas os DataSources que o modelo deve oferecer.
+        """
+        self.plan_name = plan_name
+        self.accounts_list = []
+        for account in accounts_list:
+            copia = account.copy()
+            copia["data_sources"] = dict(account.get("data_sources", {}))
+            self.accounts_list.append(copia)
+        if any("formula_compilada" not in account for account in self.accounts_list):
+            compilar_formulas_do_plano(self.accounts_list, plan_name)
+        self.account_dict, self.children_map, self.level_map, self.dependency_graph = build_account_hierarchy(self.accounts_list)
+        report_dependency_cycles(self.dependency_graph, plan_name)
+        self.linha_da_conta = {codigo: linha for linha, codigo in enumerate(self.account_dict)}
+        self.raw_data_by_ds = dict(raw_data_by_ds)
+        self._estados = {} # {ds_name: estado do DataSource já calculado (ver _estado)}
+        self._ordem_valida = True # False depois de set_formula: a ordem de avaliação do grafo precisa ser refeita
+
+    @property
+    def data_sources(self):
+        return sorted(self.raw_data_by_ds)
+
+    def periods(self, ds):
+        """Períodos do DataSource, no formato das chaves de 'valores' das visões."""
+        return list(self._estado(ds)["periodos"])
+
+    def _estado(self, ds):
+        """Dados brutos (copiados) e valores calculados de um DataSource, calculados no primeiro acesso."""
+        estado = self._estados.get(ds)
+        if estado is not None:
+            return estado
+        raw_data_info = self.raw_data_by_ds.get(ds)
+        if raw_data_info is None:
+            raise KeyError(f"DataSource '{ds}' não está no modelo do plano '{self.plan_name}'. Disponíveis: {self.data_sources}")
+        # Contas analíticas por código bruto vinculado, para saber quem é afetado por set_raw
+        analiticas_por_codigo = defaultdict(list)
+        for codigo, account in self.account_dict.items():
+            data_code_mapping_str = account["data_sources"].get(ds)
+            if account["tipo"].lower() == "analitica" and data_code_mapping_str:
+                for raw_code in dict.fromkeys(code.strip() for code in str(data_code_mapping_str).split(';')):
+                    if raw_code:
+                        analiticas_por_codigo[raw_code].append(codigo)
+        periodos = list(raw_data_info["periodos"])
+        estado = {
+            "periodos": periodos,
+            "indice_periodos": dict(raw_data_info["indice_periodos"]),
+            "matriz": np.array(raw_data_info["matriz"], dtype=np.float64),
+            "indice_codigos": dict(raw_data_info["indice_codigos"]),
+            "analiticas_por_codigo": analiticas_por_codigo,
+            "valores": np.zeros((len(self.linha_da_conta), len(periodos))), # Uma linha por conta (ver linha_da_conta)
+        }
+        if not self._ordem_valida:
+            self._refazer_grafo()
+        self._recalcular(ds, estado, self.dependency_graph["ordem"])
+        self._estados[ds] = estado
+        return estado
+
+    def _recalcular(self, ds, estado, ordem):
+        """Recalcula as contas de 'ordem' (em ordem de avaliação) com o motor vetorizado, direto na matriz de valores."""
+        calcular_valores_vetorizados(self.account_dict, self.children_map, self.dependency_graph, estado["matriz"], estado["indice_codigos"],
+                                     ds, len(estado["periodos"]), ordem=ordem,
+                                     vectors=_VetoresDaMatriz(estado["valores"], self.linha_da_conta))
+
+    def _refazer_grafo(self):
+        self.dependency_graph = build_dependency_graph(self.account_dict, self.children_map)
+        report_dependency_cycles(self.dependency_graph, self.plan_name)
+        self._ordem_valida = True
+
+    def _afetadas(self, origens):
+        """
+        As contas 'origens' e todas as que dependem delas, direta ou indiretamente, em ordem de avaliação
+        (pós-ordem invertida de uma busca em profundidade sobre as dependências reversas, sem recursão).
+        """
+        dependentes = self.dependency_graph["dependentes"]
+        visitadas = set()
+        pos_ordem = []
+        for origem in origens:
+            if origem in visitadas:
+                continue
+            visitadas.add(origem)
+            trabalho = [(origem, iter(dependentes.get(origem, ())))]
+            while trabalho:
+                codigo, restantes = trabalho[-1]
+                for dependente in restantes:
+                    if dependente not in visitadas:
+                        visitadas.add(dependente)
+                        trabalho.append((dependente, iter(dependentes.get(dependente, ()))))
+                        break
+                else:
+                    trabalho.pop()
+                    pos_ordem.append(codigo)
+        pos_ordem.reverse()
+        return pos_ordem
+
+    def _linha(self, account):
+        linha = self.linha_da_conta.get(account)
+        if linha is None:
+            raise KeyError(f"Conta '{account}' não existe no plano '{self.plan_name}'.")
+        return linha
+
+    def _coluna(self, estado, period, ds):
+        coluna = estado["indice_periodos"].get(format_period_header(period))
+        if coluna is None:
+            raise KeyError(f"Período '{period}' não existe no DataSource '{ds}'.")
+        return coluna
+
+    def value(self, account, period, ds):
+        """Valor atual da conta 'account' no período 'period' (texto como nas visões, ou datetime) do DataSource 'ds'."""
+        estado = self._estado(ds)
+        return float(estado["valores"][self._linha(account), self._coluna(estado, period, ds)])
+
+    def set_raw(self, ds, raw_code, period, value):
+        """
+        Altera o valor bruto do código 'raw_code' no período 'period' do DataSource 'ds' (com as conversões da
+        leitura: valores ausentes ou não numéricos valem 0.0). Um código que não existe na aba de dados é criado.
+        Recalcula só as analíticas vinculadas ao código e as contas que dependem delas; retorna os códigos das
+        contas recalculadas, em ordem de avaliação.
+        """
+        estado = self._estado(ds)
+        coluna = self._coluna(estado, period, ds)
+        raw_code = str(raw_code).strip()
+        linha = estado["indice_codigos"].get(raw_code)
+        if linha is None:
+            linha = len(estado["matriz"])
+            estado["matriz"] = np.vstack([estado["matriz"], np.zeros((1, len(estado["periodos"])))])
+            estado["indice_codigos"][raw_code] = linha
+        estado["matriz"][linha, coluna] = safe_float_conversion(value)
+        afetadas = self._afetadas(estado["analiticas_por_codigo"].get(raw_code, ()))
+        self._recalcular(ds, estado, afetadas)
+        return afetadas
+
+    def set_formula(self, account, formula):
+        """
+        Troca a conta 'account' por 'calculo (formula)' (ex: "001 - 002 / 003"). Lança ErroFormula se a fórmula
+        for inválida, sem alterar o modelo; contas referenciadas que não existem no plano valem 0.0.
+        Recalcula a conta e as que dependem dela em todos os DataSources já calculados; retorna os códigos das
+        contas recalculadas. Se a edição criar ou desfizer uma referência circular, o grafo é refeito e o
+        plano é recalculado inteiro.
+        """
+        self._linha(account)
+        formula = str(formula).strip()
+        formula_compilada = compilar_formula(formula)
+        conta = self.account_dict[account]
+        conta["tipo"] = f"calculo ({formula})"
+        conta["formula"] = formula
+        conta["formula_compilada"] = formula_compilada
+
+        # Atualiza as arestas da conta no grafo (dependências e dependências reversas)
+        dependencias = self.dependency_graph["dependencias"]
+        dependentes = self.dependency_graph["dependentes"]
+        for dep in dependencias[account]:
+            dependentes[dep].remove(account)
+        novas = [dep for dep in dict.fromkeys(formula_compilada.codigos) if dep in self.account_dict]
+        dependencias[account] = novas
+        for dep in novas:
+            dependentes.setdefault(dep, []).append(account)
+
+        afetadas = self._afetadas([account])
+        if account in self.dependency_graph["contas_em_ciclo"] or not set(novas).isdisjoint(afetadas):
+            # A conta estava num ciclo ou passou a referenciar algo que depende dela
+            self._refazer_grafo()
+            afetadas = list(self.dependency_graph["ordem"])
+        else:
+            # A ordem de avaliação global só é usada ao calcular um DataSource novo; é refeita nesse momento
+            self._ordem_valida = False
+        for ds, estado in self._estados.items():
+            self._recalcular(ds, estado, afetadas)
+        return afetadas
+
+    def view(self, ds):
+        """Visão do plano com o DataSource 'ds' no formato de calcular_visao, com os valores atuais."""
+        estado = self._estado(ds)
+        periodos, valores = estado["periodos"], estado["valores"]
+        # Os metadados são refeitos a cada visão: set_formula muda o tipo e a fórmula das contas
+        return montar_visao(self.plan_name, ds, MetadadosDoPlano(self.accounts_list, self.level_map), periodos,
+                            _VetoresDaMatriz(valores, self.linha_da_conta))
+
+
+def carregar_modelos(caminho_excel='DADOS.xlsx', reader=DEFAULT_EXCEL_READER, fontes_dados=None):
+    """
+    Lê a planilha (abas 'plano' e 'dados', com as mesmas regras de processar_planilha_integrado) e retorna
+    {plan_name: ModeloCalculo}, cada modelo com os DataSources que o plano referencia e que foram encontrados.
+    fontes_dados: {ds_name: caminho} opcional de DataSources em arquivos CSV/Parquet (ver listar_fontes_de_dados).
+    """
+    fontes_dados = fontes_dados or {}
+    xls = abrir_leitor_excel(caminho_excel, resolver_leitor_excel(reader))
+    planos = {} # {plan_name: (accounts_list, DataSources referenciados)}
+    dados = {} # {ds_name: dados do DataSource}
     try:
-        with open(caminho_html, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        print(f"Arquivo '{caminho_html}' encontrado. Lendo conteúdo existente.")
+        abas = [sheet_name for sheet_name in xls.sheet_names if not sheet_name.startswith('~$')]
+        for sheet_name in abas:
+            if sheet_name.lower().startswith("plano"):
+                plano_lido = ler_aba_plano(xls.parse(sheet_name), sheet_name)
+                if plano_lido is not None and plano_lido[0]:
+                    planos[get_name_in_parentheses(sheet_name) or sheet_name.strip()] = plano_lido
+        referenciados = set().union(*(linked for _, linked in planos.values()))
+        for sheet_name in abas:
+            ds_name = get_name_in_parentheses(sheet_name) or sheet_name.strip()
+            if sheet_name.lower().startswith("dados") and ds_name in referenciados and ds_name not in fontes_dados:
+                raw_data_info = ler_aba_dados(xls.parse(sheet_name), sheet_name)
+                if raw_data_info is not None:
+                    dados[ds_name] = raw_data_info
+    finally:
+        xls.close()
+    for ds_name, caminho in fontes_dados.items():
+        if ds_name in referenciados:
+            raw_data_info = ler_fonte_de_dados(caminho)
+            if raw_data_info is not None:
+                dados[ds_name] = raw_data_info
+    return {plan_name: ModeloCalculo(plan_name, accounts_list, {ds: dados[ds] for ds in sorted(linked & dados.keys())})
+            for plan_name, (accounts_list, linked) in planos.items()}
+
+
+# --- Injeção dos dados no index.html ---
+# O JSON fica entre dois marcadores (comentários JS) na definição da variável do index.html:
+#     const calculatedViewsData = /*<dados>*/{...}/*</dados>*/;
+# O arquivo é lido e gravado em blocos: o que vem antes do marcador de início é copiado, o JSON novo é gerado
+# uma conta por vez, os dados antigos são pulados até o marcador de fim e o restante é copiado. Tudo vai para um
+# arquivo temporário ao lado do index.html, que só substitui o original (os.replace) depois de gravado por inteiro.
+# Nos textos do JSON, '</' é gravado como '<\/', por isso nem o marcador de fim nem um '</script>' aparecem nos dados.
+JS_VARIABLE_NAME = 'calculatedViewsData'
+MARCADOR_INICIO_DADOS = b"/*<dados>*/"
+MARCADOR_FIM_DADOS = b"/*</dados>*/"
+TAMANHO_BLOCO_HTML = 1 << 20 # Bytes lidos do index.html por vez
+
+def _json_compacto(valor):
+    """valor em JSON compacto (sem espaços), com '</' escapado."""
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'), default=_json_default).replace("</", "<\\/")
+
+def _pedacos_json(valor, nivel=0):
+    """
+    Gera o JSON compacto de valor em pedaços: o objeto da raiz, a lista de visões e as visões compactas são
+    percorridos item a item, e cada conta de uma visão compacta é montada e serializada sozinha.
+    """
+    if isinstance(valor, VisaoCalculada) or (nivel == 0 and isinstance(valor, dict)):
+        yield "{"
+        for posicao, (chave, item) in enumerate(valor.items()):
+            yield ("," if posicao else "") + _json_compacto(chave) + ":"
+            yield from _pedacos_json(item, nivel + 1)
+        yield "}"
+    elif isinstance(valor, _ContasDaVisao) or (nivel == 1 and isinstance(valor, list)):
+        yield "["
+        for posicao, item in enumerate(valor):
+            if posicao:
+                yield ","
+            yield from _pedacos_json(item, nivel + 1)
+        yield "]"
+    else:
+        yield _json_compacto(valor)
+
+def escrever_json_compacto(destino, dados_json):
+    """Grava dados_json em JSON compacto (UTF-8) no arquivo binário destino, em pedaços. Retorna os bytes gravados."""
+    total = 0
+    for pedaco in _pedacos_json(dados_json):
+        dados = pedaco.encode("utf-8")
+        destino.write(dados)
+        total += len(dados)
+    return total
+
+def _copiar_ate_marcador(origem, marcador, destino=None, lido=b""):
+    """
+    Lê o arquivo binário origem em blocos (começando por 'lido', já lido dele) até encontrar marcador,
+    copiando para destino, se houver, o que vem antes do marcador. Retorna o que foi lido depois do marcador,
+    ou None se o arquivo acabou sem ele. Só um bloco fica em memória.
+    """
+    buffer = lido
+    while True:
+        posicao = buffer.find(marcador)
+        if posicao >= 0:
+            if destino is not None:
+                destino.write(buffer[:posicao])
+            return buffer[posicao + len(marcador):]
+        # Guarda o final do bloco: o marcador pode estar dividido entre dois blocos
+        corte = max(len(buffer) - len(marcador) + 1, 0)
+        if destino is not None:
+            destino.write(buffer[:corte])
+        bloco = origem.read(TAMANHO_BLOCO_HTML)
+        if not bloco:
+            return None
+        buffer = buffer[corte:] + bloco
+
+def _html_com_marcadores(html_content, caminho_html):
+    """
+    index.html sem os marcadores (gerado por versões anteriores do script ou editado à mão): divide o texto em
+    (antes dos dados, depois dos dados), com a definição da variável ou a posição onde injetá-la. O fim do
+    objeto antigo é encontrado pelo decodificador de JSON, não por expressão regular. Retorna None se não houver onde injetar.
+    """
+    match = re.search(r'(const|let|var)\s+' + re.escape(JS_VARIABLE_NAME) + r'\s*=\s*', html_content)
+    if match:
+        try:
+            _, fim = json.JSONDecoder().raw_decode(html_content, match.end())
+        except ValueError:
+            fim = None
+        if fim is not None:
+            print(f"Padrão '{match.group(1)} {JS_VARIABLE_NAME} = ...;' encontrado no arquivo '{caminho_html}' (sem marcadores). Substituindo dados e incluindo os marcadores...")
+            return html_content[:match.end()], html_content[fim:]
+        print(f"Aviso: Os dados de '{match.group(1)} {JS_VARIABLE_NAME} = ...' no arquivo '{caminho_html}' não são um JSON válido.")
+
+    print(f"Padrão '{JS_VARIABLE_NAME} = ...;' NÃO encontrado no arquivo '{caminho_html}'. Tentando injetar a definição completa da variável antes de </script>...")
+    match_script_end = re.search(r'</script>', html_content)
+    if not match_script_end:
+        print(f"Erro: Não foi possível encontrar o padrão '{JS_VARIABLE_NAME} = ...;' nem a tag </script> no arquivo '{caminho_html}'. Não foi possível injetar os dados.")
+        return None
+    print("Definição completa da variável JSON injetada dentro da tag <script>.")
+    return (html_content[:match_script_end.start()] + f"\n\n        // Dados injetados pelo script Python:\n        const {JS_VARIABLE_NAME} = ",
+            ";\n\n        " + html_content[match_script_end.start():])
+
+def update_index_html_with_json(caminho_html='index.html', dados_json={}):
+    """
+    Substitui os dados entre os marcadores do index.html (ver MARCADOR_INICIO_DADOS) pelo JSON compacto de
+    dados_json, preservando o restante do HTML. O arquivo é lido e gravado em blocos e trocado de uma vez
+    (os.replace), de modo que uma falha no meio não deixa o index.html pela metade. Um index.html sem os
+    marcadores é lido inteiro uma vez e gravado já com eles.
+    Retorna o tamanho em bytes do JSON gravado, ou None se o arquivo não foi atualizado.
+    """
+    import shutil
 
+    caminho_temporario = caminho_html + ".tmp"
+    try:
+        origem = open(caminho_html, 'rb')
     except FileNotFoundError:
         print(f"Erro: Arquivo '{caminho_html}' não encontrado.")
         print("Não é possível atualizar um arquivo que não existe. Por favor, crie o arquivo index.html com a estrutura básica e a variável JavaScript alvo.")
-        return False 
+        return None
 
-    json_data_str = json.dumps(dados_json, indent=4, ensure_ascii=False, sort_keys=False, separators=(',', ': '))
-    full_json_definition_line = f"const {js_variable_name} = {json_data_str};"
+    try:
+        with origem, open(caminho_temporario, 'wb') as destino:
+            print(f"Arquivo '{caminho_html}' encontrado. Lendo conteúdo existente.")
+            lido = _copiar_ate_marcador(origem, MARCADOR_INICIO_DADOS, destino)
+            if lido is not None:
+                print(f"Marcadores de '{JS_VARIABLE_NAME}' encontrados no arquivo '{caminho_html}'. Substituindo dados...")
+                destino.write(MARCADOR_INICIO_DADOS)
+                tamanho_json = escrever_json_compacto(destino, dados_json)
+                lido = _copiar_ate_marcador(origem, MARCADOR_FIM_DADOS, None, lido)
+                if lido is None:
+                    print(f"Erro: O marcador de fim dos dados ({MARCADOR_FIM_DADOS.decode()}) não foi encontrado no arquivo '{caminho_html}'. Não foi possível injetar os dados.")
+                    return None
+                destino.write(MARCADOR_FIM_DADOS + lido)
+                shutil.copyfileobj(origem, destino, TAMANHO_BLOCO_HTML)
+            else:
+                origem.seek(0)
+                partes = _html_com_marcadores(origem.read().decode("utf-8"), caminho_html)
+                if partes is None:
+                    return None
+                antes, depois = partes
+                destino.seek(0)
+                destino.truncate()
+                destino.write(antes.encode("utf-8") + MARCADOR_INICIO_DADOS)
+                tamanho_json = escrever_json_compacto(destino, dados_json)
+                destino.write(MARCADOR_FIM_DADOS + depois.encode("utf-8"))
+            destino.flush()
+            os.fsync(destino.fileno())
+        shutil.copymode(caminho_html, caminho_temporario)
+        os.replace(caminho_temporario, caminho_html)
+        print(f"Arquivo '{caminho_html}' atualizado com sucesso!")
+        return tamanho_json
+    except Exception as e:
+        print(f"Erro ao escrever no arquivo '{caminho_html}': {e}")
+        return None
+    finally:
+        if os.path.exists(caminho_temporario):
+            os.remove(caminho_temporario)
 
-    match = re.search(pattern, html_content, re.DOTALL)
 
-    if match:
-        print(f"Padrão '{match.group(1)} {js_variable_name} = ...;' encontrado no arquivo '{caminho_html}'. Substituindo dados...")
-        novo_html_content = html_content[:match.start(2)] + json_data_str + html_content[match.end(2):]
+# --- Formato colunar das visões ---
+# 'dicionario' (padrão): cada conta traz valores como {período: valor}.
+# 'colunar': os períodos aparecem uma vez por visão e cada conta traz um array de valores alinhado a eles;
+# opcionalmente com arredondamento fixo (decimais) e codificação em deltas de inteiros (delta).
+VIEW_FORMATS = ("dicionario", "colunar")
+DEFAULT_VIEW_FORMAT = "dicionario"
 
-    else:
-        print(f"Padrão '{js_variable_name} = ...;' NÃO encontrado no arquivo '{caminho_html}'. Tentando injetar a definição completa da variável antes de </script>...")
-        script_end_tag_pattern = r'</script>'
-        match_script_end = re.search(script_end_tag_pattern, html_content, re.DOTALL)
-
-        if match_script_end:
-            injection_string = f"\n\n        // Dados injetados pelo script Python:\n        {full_json_definition_line}\n\n        " 
-            novo_html_content = html_content[:match_script_end.start()] + injection_string + html_content[match_script_end.start():]
-            print("Definição completa da variável JSON injetada dentro da tag <script>.")
+def _codificar_valores(valores, decimais=None, delta=False):
+    """
+    Codifica uma lista de valores como no formato colunar (ver converter_visao_colunar).
+    Retorna (valores codificados, delta aplicado?); valores não finitos impedem o arredondamento e o delta.
+    """
+    if decimais is None or not all(math.isfinite(value) for value in valores):
+        return list(valores), False
+    scale = 10 ** decimais
+    inteiros = [round(value * scale) for value in valores]
+    if delta:
+        return ([inteiros[0]] + [atual - anterior for anterior, atual in zip(inteiros, inteiros[1:])] if inteiros else []), True
+    return ([inteiro / scale for inteiro in inteiros] if decimais > 0 else inteiros), False
+
+def converter_visao_colunar(view, decimais=None, delta=False):
+    """
+    Converte uma visão calculada para o formato colunar (lido pelo decodeView do index.html).
+    - decimais: arredonda cada valor para esse número de casas (round(valor * 10^decimais) / 10^decimais).
+    - delta (exige decimais): cada conta guarda inteiros valor * 10^decimais, o primeiro absoluto e os
+      seguintes como diferença para o anterior; a decodificação (soma acumulada / 10^decimais) é exata.
+      Contas com valores não finitos são gravadas sem delta ("sem_delta": true).
+    """
+    if delta and decimais is None:
+        raise ValueError("A codificação em deltas exige um número fixo de decimais.")
+    if isinstance(view, VisaoCalculada):
+        # Visão compacta: só registra a codificação; os valores são codificados conta a conta ao gravar o JSON
+        colunar_view = copy.copy(view)
+        colunar_view.formato, colunar_view.decimais, colunar_view.delta = "colunar", decimais, bool(delta)
+        return colunar_view
+    periodos = view["periodos"]
+    accounts = []
+    for account in view["accounts"]:
+        colunar_account = {key: value for key, value in account.items() if key != "valores"}
+        valores, delta_aplicado = _codificar_valores([account["valores"][period] for period in periodos], decimais, delta)
+        if delta and not delta_aplicado:
+            colunar_account["sem_delta"] = True
+        colunar_account["valores"] = valores
+        accounts.append(colunar_account)
+
+    colunar_view = {key: value for key, value in view.items() if key != "accounts"}
+    colunar_view["formato"] = "colunar"
+    if decimais is not None:
+        colunar_view["decimais"] = decimais
+    colunar_view["delta"] = bool(delta)
+    colunar_view["accounts"] = accounts
+    return colunar_view
+
+
+# --- Agregações por período pré-calculadas ---
+# Mesmas regras do index.html (aggregateDataByPeriod e prepareComparisonData): trimestres, semestres e anos
+# são somados na ordem dos períodos e o modo comparação coloca o mesmo período de cada ano lado a lado.
+# Só é feito quando todos os períodos estão no formato 'AAAA-MM-DD HH:MM:SS' (o gerado a partir das datas
+# do Excel), para o qual o navegador interpreta ano e mês exatamente como aqui; nos demais casos o
+# index.html agrega sozinho.
+PERIOD_MODES = ("monthly", "quarterly", "semiannual", "annual")
+MESES_ABREVIADOS = ("jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez")
+_PERIODO_DATA_HORA = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+def _chave_agregada(data, period, mode):
+    """Chave do período agregado, como em aggregateDataByPeriod (ex: '2025-Q1', '2025-S1', '2025')."""
+    if mode == "quarterly":
+        return f"{data.year}-Q{(data.month - 1) // 3 + 1}"
+    if mode == "semiannual":
+        return f"{data.year}-S{1 if data.month <= 6 else 2}"
+    if mode == "annual":
+        return str(data.year)
+    return period
+
+def _layout_comparacao(chaves, datas_por_chave):
+    """Cabeçalhos do modo comparação e, para cada um, a posição do valor em 'chaves' (-1 = sem dados, vale 0)."""
+    anos = []
+    tipos = []
+    for chave in chaves:
+        if "-Q" in chave or "-S" in chave:
+            ano, tipo = chave.split("-")
+        elif len(chave) == 4 and chave.isdigit():
+            ano, tipo = chave, "Total"
+        else:
+            data = datas_por_chave[chave]
+            ano, tipo = str(data.year), MESES_ABREVIADOS[data.month - 1]
+        if ano not in anos:
+            anos.append(ano)
+        if tipo not in tipos:
+            tipos.append(tipo)
+
+    def ordem_do_tipo(tipo):
+        if tipo in MESES_ABREVIADOS:
+            return MESES_ABREVIADOS.index(tipo)
+        if tipo.startswith("Q"):
+            return 100 + int(tipo[1:])
+        if tipo.startswith("S"):
+            return 200 + int(tipo[1:])
+        return 300 # 'Total' (anual)
+
+    posicoes = {chave: index for index, chave in enumerate(chaves)}
+    cabecalhos = []
+    indices = []
+    for tipo in sorted(tipos, key=ordem_do_tipo):
+        for ano in sorted(anos):
+            if tipo.startswith("Q"):
+                cabecalho, chave = f"{tipo}º Trim/{ano}", f"{ano}-{tipo}"
+            elif tipo.startswith("S"):
+                cabecalho, chave = f"{tipo}º Sem/{ano}", f"{ano}-{tipo}"
+            elif tipo == "Total":
+                cabecalho, chave = f"Total {ano}", ano
+            else:
+                mes = MESES_ABREVIADOS.index(tipo) + 1
+                # Primeiro período mensal daquele mês e ano; sem ele, não há coluna
+                chave = next((c for c in chaves if datas_por_chave[c].year == int(ano) and datas_por_chave[c].month == mes), None)
+                if chave is None:
+                    continue
+                cabecalho = f"{tipo.capitalize()}/{ano}"
+            cabecalhos.append(cabecalho)
+            indices.append(posicoes.get(chave, -1))
+    return {"periodos": cabecalhos, "indices": indices}
+
+def calcular_layout_agregacoes(periodos):
+    """
+    Para cada modo de período, a lista de períodos agregados (na ordem do index.html), o período agregado
+    de destino de cada período original (-1 = ignorado) e o layout do modo comparação.
+    Retorna None se algum período não estiver no formato 'AAAA-MM-DD HH:MM:SS'.
+    """
+    datas = []
+    for period in periodos:
+        if not isinstance(period, str) or not _PERIODO_DATA_HORA.match(period):
+            return None
+        try:
+            datas.append(datetime.datetime.strptime(period, "%Y-%m-%d %H:%M:%S"))
+        except ValueError:
+            return None
+
+    layout = {}
+    for mode in PERIOD_MODES:
+        chaves = [] # Na ordem da primeira ocorrência, como o Set do index.html
+        datas_por_chave = {}
+        chave_de_cada_periodo = []
+        for period, data in zip(periodos, datas):
+            if data.year < 1900 or data.year > 2100:
+                chave_de_cada_periodo.append(None) # O index.html também ignora esses períodos
+                continue
+            chave = _chave_agregada(data, period, mode)
+            if chave not in datas_por_chave:
+                chaves.append(chave)
+                datas_por_chave[chave] = data
+            chave_de_cada_periodo.append(chave)
+
+        def ordem(chave):
+            data = datas_por_chave[chave]
+            if "-Q" in chave:
+                return (data.year, 100 + int(chave[-1]))
+            if "-S" in chave:
+                return (data.year, 200 + int(chave[-1]))
+            if mode == "annual":
+                return (data.year, 300)
+            return (data.year, data.month - 1)
+
+        chaves.sort(key=ordem) # Ordenação estável, como Array.prototype.sort
+        posicoes = {chave: index for index, chave in enumerate(chaves)}
+        layout[mode] = {
+            "periodos": chaves,
+            "destinos": [posicoes[chave] if chave is not None else -1 for chave in chave_de_cada_periodo],
+            "comparacao": _layout_comparacao(chaves, datas_por_chave),
+        }
+    return layout
+
+def _valores_como_no_navegador(view):
+    """Matriz (contas x períodos) com os valores como o index.html os vê depois de decodificar a visão."""
+    if isinstance(view, VisaoCalculada) and view.decimais is None:
+        matriz = view.valores.copy() # Valores gravados sem arredondamento: a própria matriz da visão
+        matriz[np.isnan(matriz)] = 0.0
+        return matriz
+    periodos = view["periodos"]
+    matriz = np.zeros((len(view["accounts"]), len(periodos)), dtype=np.float64)
+    colunar = view.get("formato") == "colunar"
+    scale = 10 ** view["decimais"] if colunar and view.get("delta") else None
+    for row, account in enumerate(view["accounts"]):
+        if not colunar:
+            valores = [account["valores"].get(period) for period in periodos]
+        elif scale is not None and not account.get("sem_delta"):
+            valores = []
+            acumulado = 0
+            for diferenca in account["valores"]:
+                acumulado += diferenca
+                valores.append(acumulado / scale)
         else:
-            print(f"Erro: Não foi possível encontrar o padrão '{js_variable_name} = ...;' nem a tag </script> no arquivo '{caminho_html}'. Não foi possível injetar os dados.")
-            return False 
+            valores = account["valores"]
+        matriz[row] = [value if value is not None else 0.0 for value in valores]
+    matriz[np.isnan(matriz)] = 0.0 # 'valor || 0' no index.html
+    return matriz
+
+def adicionar_agregacoes(view):
+    """
+    Acrescenta à visão (formato dicionário ou colunar) as agregações pré-calculadas:
+    view["agregacoes"][modo] = {"periodos", "indices" (só mensal: posição em periodos)} e
+    view["agregacoes"]["comparacao"][modo] = {"periodos": cabeçalhos, "indices": posição no modo};
+    e em cada conta account["agregados"][modo] com os valores somados (trimestral, semestral, anual),
+    codificados como os valores da visão. Retorna False (sem alterar a visão) se os períodos não permitirem.
+    """
+    layout = calcular_layout_agregacoes(view["periodos"])
+    if layout is None:
+        return False
+    matriz = _valores_como_no_navegador(view)
+    decimais = view.get("decimais") if view.get("formato") == "colunar" else None
+    delta = bool(view.get("delta")) if decimais is not None else False
+
+    agregacoes = {"comparacao": {}}
+    somas_por_modo = {}
+    for mode in PERIOD_MODES:
+        layout_modo = layout[mode]
+        agregacoes["comparacao"][mode] = layout_modo["comparacao"]
+        if mode == "monthly":
+            # Mensal: só reordena/filtra os períodos originais (cada período é a sua própria chave)
+            indices = [-1] * len(layout_modo["periodos"])
+            for original_index, destino in enumerate(layout_modo["destinos"]):
+                if destino >= 0:
+                    indices[destino] = original_index
+            agregacoes[mode] = {"periodos": layout_modo["periodos"], "indices": indices}
+            continue
+        agregacoes[mode] = {"periodos": layout_modo["periodos"]}
+        somas = np.zeros((matriz.shape[0], len(layout_modo["periodos"])), dtype=np.float64)
+        for original_index, destino in enumerate(layout_modo["destinos"]):
+            if destino >= 0:
+                somas[:, destino] += matriz[:, original_index] # Mesma ordem de soma do index.html
+        somas_por_modo[mode] = somas
+
+    if isinstance(view, VisaoCalculada):
+        # Os totais ficam em matrizes e são codificados junto com os valores de cada conta (ver VisaoCalculada.conta)
+        view.agregados = somas_por_modo
+        view.agregacoes = agregacoes
+        return True
+    for row, account in enumerate(view["accounts"]):
+        agregados = {}
+        for mode, somas in somas_por_modo.items():
+            valores, _ = _codificar_valores(somas[row].tolist(), decimais, delta and not account.get("sem_delta"))
+            agregados[mode] = valores
+        account["agregados"] = agregados
+    view["agregacoes"] = agregacoes
+    return True
+
+
+# --- Saída em arquivos externos (manifesto + um arquivo por visão) ---
+# 'embutido': todas as visões vão dentro do index.html (arquivo único, bom para compartilhar offline).
+# 'externo': o index.html recebe só o caminho de um manifesto; cada visão fica num arquivo JSON compacto
+# e o navegador só baixa a visão selecionada (a página precisa ser servida por HTTP).
+OUTPUT_MODES = ("embutido", "externo")
+DEFAULT_OUTPUT_MODE = "embutido"
+DEFAULT_VIEWS_DIR = "dados_visoes"
+
+def escrever_visoes_externas(dados_json, pasta_visoes=DEFAULT_VIEWS_DIR, caminho_html='index.html'):
+    """
+    Grava cada visão de dados_json["calculated_views"] num arquivo JSON compacto dentro de pasta_visoes,
+    mais um manifest.json com a lista de visões, e remove arquivos de visões de execuções anteriores.
+    Retorna o objeto a ser injetado no index.html (caminho do manifesto relativo ao HTML e timestamps),
+    ou None em caso de erro.
+    """
+    try:
+        os.makedirs(pasta_visoes, exist_ok=True)
+        manifest_views = []
+        arquivos_gravados = set()
+        for index, view in enumerate(dados_json.get("calculated_views", [])):
+            conteudo = json.dumps(view, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+            # O hash do conteúdo no nome evita que o navegador use uma versão antiga da visão em cache
+            nome_arquivo = f"visao_{index:03d}_{hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:12]}.json"
+            with open(os.path.join(pasta_visoes, nome_arquivo), 'w', encoding='utf-8') as f:
+                f.write(conteudo)
+            arquivos_gravados.add(nome_arquivo)
+            manifest_views.append({
+                "plan_name": view["plan_name"],
+                "data_source_name": view["data_source_name"],
+                "arquivo": nome_arquivo,
+                "num_contas": len(view["accounts"]),
+                "num_periodos": len(view["periodos"]),
+            })
+
+        manifest = {key: value for key, value in dados_json.items() if key != "calculated_views"}
+        manifest["views"] = manifest_views
+        # O manifesto é gravado por último (e de forma atômica): quem o lê sempre encontra as visões que ele lista
+        caminho_manifesto = os.path.join(pasta_visoes, "manifest.json")
+        with open(caminho_manifesto + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(caminho_manifesto + ".tmp", caminho_manifesto)
+
+        for nome in os.listdir(pasta_visoes):
+            if nome.startswith("visao_") and nome.endswith(".json") and nome not in arquivos_gravados:
+                os.remove(os.path.join(pasta_visoes, nome))
+    except OSError as e:
+        print(f"Erro ao gravar as visões em '{pasta_visoes}': {e}")
+        return None
 
+    print(f"{len(manifest_views)} visões gravadas em '{pasta_visoes}' (manifesto: '{caminho_manifesto}').")
+    referencia = {key: value for key, value in manifest.items() if key != "views"}
+    referencia["manifest"] = os.path.relpath(caminho_manifesto, os.path.dirname(os.path.abspath(caminho_html))).replace(os.sep, "/")
+    return referencia
+
+
+# --- Banco de resultados (--banco) ---
+# As visões calculadas podem ser gravadas num banco SQLite local, para consultas (consultar_resultados.py) e
+# outras ferramentas. Tabelas:
+#   planos, data_sources e periodos (com ano, mês, trimestre e semestre dos períodos 'AAAA-MM-DD HH:MM:SS')
+#   contas: todas as contas de cada plano (código, descrição, tipo, fórmula, nível e posição no plano)
+#   visoes: uma por plano x DataSource, com a assinatura (hash) do conteúdo gravado
+#   visao_periodos: os períodos de cada visão, na ordem da visão
+#   valores: (visao_id, conta_id, periodo_id) -> valor, chave primária na ordem (plano x DataSource, conta, período)
+# A gravação é incremental: só as visões cuja assinatura mudou têm os valores regravados; visões, planos e
+# DataSources que deixaram de existir são removidos. Tudo numa única transação por execução.
+FORMATO_BANCO = 1 # Versão do esquema do banco; um banco de outra versão é recriado
+DEFAULT_BANCO = "resultados.sqlite"
+ESQUEMA_BANCO = """
+CREATE TABLE IF NOT EXISTS informacoes (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS planos (id INTEGER PRIMARY KEY, nome TEXT NOT NULL UNIQUE, assinatura TEXT);
+CREATE TABLE IF NOT EXISTS data_sources (id INTEGER PRIMARY KEY, nome TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS periodos (id INTEGER PRIMARY KEY, nome TEXT NOT NULL UNIQUE,
+    ano INTEGER, mes TEXT, trimestre TEXT, semestre TEXT);
+CREATE TABLE IF NOT EXISTS contas (id INTEGER PRIMARY KEY, plano_id INTEGER NOT NULL REFERENCES planos(id), codigo TEXT NOT NULL,
+    descricao TEXT, tipo TEXT, formula TEXT, nivel INTEGER, posicao INTEGER, UNIQUE (plano_id, codigo));
+CREATE TABLE IF NOT EXISTS visoes (id INTEGER PRIMARY KEY, plano_id INTEGER NOT NULL REFERENCES planos(id),
+    data_source_id INTEGER NOT NULL REFERENCES data_sources(id), assinatura TEXT NOT NULL, atualizada_em TEXT NOT NULL,
+    UNIQUE (plano_id, data_source_id));
+CREATE TABLE IF NOT EXISTS visao_periodos (visao_id INTEGER NOT NULL, periodo_id INTEGER NOT NULL, posicao INTEGER NOT NULL,
+    PRIMARY KEY (visao_id, periodo_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS valores (visao_id INTEGER NOT NULL, conta_id INTEGER NOT NULL, periodo_id INTEGER NOT NULL, valor REAL,
+    PRIMARY KEY (visao_id, conta_id, periodo_id)) WITHOUT ROWID;
+"""
+TABELAS_BANCO = ("informacoes", "planos", "data_sources", "periodos", "contas", "visoes", "visao_periodos", "valores")
+
+def abrir_banco_resultados(caminho_banco):
+    """Abre (ou cria) o banco de resultados; um banco de outro FORMATO_BANCO tem as tabelas recriadas."""
+    import sqlite3
+
+    conexao = sqlite3.connect(caminho_banco)
+    try:
+        conexao.execute("PRAGMA synchronous = NORMAL")
+        formato = None
+        if conexao.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'informacoes'").fetchone():
+            linha = conexao.execute("SELECT valor FROM informacoes WHERE chave = 'formato'").fetchone()
+            formato = linha[0] if linha else None
+        if formato != str(FORMATO_BANCO):
+            with conexao:
+                if formato is not None:
+                    print(f"Aviso: O banco '{caminho_banco}' é de outra versão (formato {formato}); as tabelas serão recriadas.")
+                for tabela in TABELAS_BANCO:
+                    conexao.execute(f"DROP TABLE IF EXISTS {tabela}")
+                conexao.executescript(ESQUEMA_BANCO)
+                conexao.execute("INSERT INTO informacoes (chave, valor) VALUES ('formato', ?)", (str(FORMATO_BANCO),))
+    except Exception:
+        conexao.close()
+        raise
+    return conexao
+
+def _como_visao_compacta(view):
+    """A visão como VisaoCalculada; uma visão em dicionário (formato 'dicionario') é convertida."""
+    if isinstance(view, VisaoCalculada):
+        return view
+    periodos = list(view["periodos"])
+    accounts = [{chave: valor for chave, valor in account.items() if chave not in ("valores", "nivel")} for account in view["accounts"]]
+    niveis = {account["codigo"]: account.get("nivel", 1) for account in view["accounts"]}
+    valores = np.array([[account["valores"][period] for period in periodos] for account in view["accounts"]], dtype=np.float64).reshape(len(accounts), len(periodos))
+    return VisaoCalculada(view["plan_name"], view["data_source_name"], periodos, MetadadosDoPlano(accounts, niveis),
+                          np.arange(len(accounts), dtype=np.int32), valores)
+
+def _assinatura(*partes):
+    """Hash SHA-256 (hex) de textos e arrays NumPy."""
+    hasher = hashlib.sha256()
+    for parte in partes:
+        hasher.update(np.ascontiguousarray(parte).tobytes() if isinstance(parte, np.ndarray) else repr(parte).encode("utf-8"))
+    return hasher.hexdigest()
+
+def _colunas_do_periodo(period):
+    """(ano, mês 'AAAA-MM', trimestre 'AAAA-Qn', semestre 'AAAA-Sn') de um período 'AAAA-MM-DD HH:MM:SS', ou Nones."""
+    if not isinstance(period, str) or not _PERIODO_DATA_HORA.match(period):
+        return None, None, None, None
+    try:
+        data = datetime.datetime.strptime(period, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None, None, None, None
+    return (data.year, f"{data.year}-{data.month:02d}", _chave_agregada(data, period, "quarterly"),
+            _chave_agregada(data, period, "semiannual"))
+
+def _id_por_nome(conexao, tabela, nome, cache_ids, colunas_extras=()):
+    """Id da linha de 'tabela' com esse nome, inserida se ainda não existir."""
+    if nome not in cache_ids:
+        linha = conexao.execute(f"SELECT id FROM {tabela} WHERE nome = ?", (nome,)).fetchone()
+        if linha is None:
+            marcadores = ", ?" * len(colunas_extras)
+            nomes_extras = "".join(f", {coluna}" for coluna, _ in colunas_extras)
+            linha = (conexao.execute(f"INSERT INTO {tabela} (nome{nomes_extras}) VALUES (?{marcadores})",
+                                     (nome, *(valor for _, valor in colunas_extras))).lastrowid,)
+        cache_ids[nome] = linha[0]
+    return cache_ids[nome]
+
+def _gravar_contas_do_plano(conexao, plan_name, metadados):
+    """Grava o plano e as suas contas (só se mudaram desde a última gravação). Retorna (plano_id, {codigo: conta_id})."""
+    assinatura = _assinatura(metadados.campos, metadados.niveis)
+    linha = conexao.execute("SELECT id, assinatura FROM planos WHERE nome = ?", (plan_name,)).fetchone()
+    if linha is None:
+        plano_id = conexao.execute("INSERT INTO planos (nome) VALUES (?)", (plan_name,)).lastrowid
+    else:
+        plano_id = linha[0]
+    if linha is None or linha[1] != assinatura:
+        conexao.executemany(
+            "INSERT INTO contas (plano_id, codigo, descricao, tipo, formula, nivel, posicao) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (plano_id, codigo) DO UPDATE SET descricao = excluded.descricao, tipo = excluded.tipo, "
+            "formula = excluded.formula, nivel = excluded.nivel, posicao = excluded.posicao",
+            ((plano_id, campos.get("codigo"), campos.get("descricao"), campos.get("tipo"), campos.get("formula"), nivel, posicao)
+             for posicao, (campos, nivel) in enumerate(zip(map(dict, metadados.campos), metadados.niveis))))
+        # Contas que saíram do plano: os valores delas só existiam em visões deste plano, que mudaram e serão regravadas
+        codigos = set(metadados.codigos)
+        conexao.executemany("DELETE FROM contas WHERE id = ?",
+                            ((conta_id,) for conta_id, codigo in conexao.execute("SELECT id, codigo FROM contas WHERE plano_id = ?", (plano_id,)).fetchall()
+                             if codigo not in codigos))
+        conexao.execute("UPDATE planos SET assinatura = ? WHERE id = ?", (assinatura, plano_id))
+    return plano_id, dict(conexao.execute("SELECT codigo, id FROM contas WHERE plano_id = ?", (plano_id,)).fetchall())
+
+def _remover_visoes(conexao, visao_ids):
+    """Apaga visões do banco, com os seus períodos e valores."""
+    for tabela, coluna in (("valores", "visao_id"), ("visao_periodos", "visao_id"), ("visoes", "id")):
+        conexao.executemany(f"DELETE FROM {tabela} WHERE {coluna} = ?", ((visao_id,) for visao_id in visao_ids))
+
+def gravar_resultados_sqlite(caminho_banco, dados_json):
+    """
+    Grava as visões de dados_json["calculated_views"] no banco SQLite caminho_banco (criado se não existir),
+    regravando só as visões que mudaram. Retorna {"gravadas", "inalteradas", "removidas", "valores"}, ou None em caso de erro.
+    """
+    import sqlite3
 
+    visoes = [_como_visao_compacta(view) for view in dados_json.get("calculated_views", [])]
+    resumo = {"gravadas": 0, "inalteradas": 0, "removidas": 0, "valores": 0}
     try:
-        with open(caminho_html, 'w', encoding='utf-8') as f:
-            f.write(novo_html_content) 
-        print(f"Arquivo '{caminho_html}' atualizado com sucesso!")
-        return True 
-    except Exception as e:
-        print(f"Erro ao escrever no arquivo '{caminho_html}': {e}")
-        return False 
+        conexao = abrir_banco_resultados(caminho_banco)
+    except sqlite3.Error as e:
+        print(f"Erro ao abrir o banco de resultados '{caminho_banco}': {e}")
+        return None
+    try:
+        with conexao: # Uma única transação: o banco nunca fica com parte de uma execução
+            agora = datetime.datetime.now().astimezone().isoformat()
+            planos = {}
+            for view in visoes:
+                if view.plan_name not in planos:
+                    planos[view.plan_name] = _gravar_contas_do_plano(conexao, view.plan_name, view.metadados)
+            ids_data_sources = {}
+            ids_periodos = {}
+            visoes_gravadas = set()
+            for view in visoes:
+                plano_id, contas_ids = planos[view.plan_name]
+                data_source_id = _id_por_nome(conexao, "data_sources", view.data_source_name, ids_data_sources)
+                assinatura = _assinatura(view.periodos, [view.metadados.campos[linha] for linha in view.linhas],
+                                         [view.metadados.niveis[linha] for linha in view.linhas], view.valores)
+                linha = conexao.execute("SELECT id, assinatura FROM visoes WHERE plano_id = ? AND data_source_id = ?",
+                                        (plano_id, data_source_id)).fetchone()
+                if linha is not None:
+                    visoes_gravadas.add(linha[0])
+                    if linha[1] == assinatura:
+                        resumo["inalteradas"] += 1
+                        continue
+                    _remover_visoes(conexao, [linha[0]])
+                visao_id = conexao.execute("INSERT INTO visoes (plano_id, data_source_id, assinatura, atualizada_em) VALUES (?, ?, ?, ?)",
+                                           (plano_id, data_source_id, assinatura, agora)).lastrowid
+                visoes_gravadas.add(visao_id)
+                periodo_ids = [_id_por_nome(conexao, "periodos", period, ids_periodos,
+                                            tuple(zip(("ano", "mes", "trimestre", "semestre"), _colunas_do_periodo(period))))
+                               for period in view.periodos]
+                conexao.executemany("INSERT OR REPLACE INTO visao_periodos (visao_id, periodo_id, posicao) VALUES (?, ?, ?)",
+                                    ((visao_id, periodo_id, posicao) for posicao, periodo_id in enumerate(periodo_ids)))
+                # Uma linha por conta x período, montada sem laço Python por valor
+                conta_ids = [contas_ids[view.metadados.codigos[linha]] for linha in view.linhas.tolist()]
+                quantidade = len(conta_ids) * len(periodo_ids)
+                conexao.executemany("INSERT OR REPLACE INTO valores (visao_id, conta_id, periodo_id, valor) VALUES (?, ?, ?, ?)",
+                                    zip(itertools.repeat(visao_id, quantidade),
+                                        np.repeat(np.array(conta_ids, dtype=np.int64), len(periodo_ids)).tolist(),
+                                        np.tile(np.array(periodo_ids, dtype=np.int64), len(conta_ids)).tolist(),
+                                        np.asarray(view.valores, dtype=np.float64).ravel().tolist()))
+                resumo["gravadas"] += 1
+                resumo["valores"] += quantidade
+
+            # Visões, planos e DataSources que não estão mais na planilha
+            antigas = [visao_id for (visao_id,) in conexao.execute("SELECT id FROM visoes").fetchall() if visao_id not in visoes_gravadas]
+            _remover_visoes(conexao, antigas)
+            resumo["removidas"] = len(antigas)
+            planos_antigos = [(plano_id,) for plano_id, nome in conexao.execute("SELECT id, nome FROM planos").fetchall() if nome not in planos]
+            conexao.executemany("DELETE FROM contas WHERE plano_id = ?", planos_antigos)
+            conexao.executemany("DELETE FROM planos WHERE id = ?", planos_antigos)
+            conexao.execute("DELETE FROM data_sources WHERE id NOT IN (SELECT data_source_id FROM visoes)")
+            conexao.execute("DELETE FROM periodos WHERE id NOT IN (SELECT periodo_id FROM visao_periodos)")
+            conexao.execute("INSERT OR REPLACE INTO informacoes (chave, valor) VALUES ('atualizado_em', ?)", (agora,))
+    except sqlite3.Error as e:
+        print(f"Erro ao gravar os resultados no banco '{caminho_banco}': {e}")
+        return None
+    finally:
+        conexao.close()
 
+    print(f"Banco de resultados '{caminho_banco}': {resumo['gravadas']} visões gravadas ({resumo['valores']} valores), "
+          f"{resumo['inalteradas']} inalteradas, {resumo['removidas']} removidas.")
+    return resumo
+
+
+def preparar_visoes_para_saida(dados_extraidos, args, medir_etapa=lambda nome: contextlib.nullcontext()):
+    """
+    Acrescenta os timestamps a dados_extraidos e aplica às visões o formato (--formato colunar) e as
+    agregações por período (--pre-agregar) escolhidos na linha de comando.
+    """
+    dados_extraidos["timestamp_utc"] = datetime.datetime.utcnow().isoformat() + 'Z'
+    dados_extraidos["timestamp_local"] = datetime.datetime.now().astimezone().isoformat()
+
+    if args.formato == "colunar":
+        with medir_etapa("conversao_colunar"):
+            dados_extraidos["calculated_views"] = [converter_visao_colunar(view, args.decimais, args.delta)
+                                                   for view in dados_extraidos["calculated_views"]]
+
+    if args.pre_agregar:
+        with medir_etapa("pre_agregacao"):
+            for view in dados_extraidos["calculated_views"]:
+                if not adicionar_agregacoes(view):
+                    print(f"Aviso: Os períodos da visão '{view['plan_name']}' com '{view['data_source_name']}' não estão todos no formato AAAA-MM-DD HH:MM:SS; a agregação dessa visão ficará a cargo do navegador.")
+
+
+def executar_processamento(args, cache, workers, nome_arquivo_excel='DADOS.xlsx', nome_arquivo_html='index.html', dados_adicionais=None):
+    """
+    Processa a planilha com as opções da linha de comando (args), gera a saída escolhida e atualiza o index.html.
+    dados_adicionais: chaves extras incluídas no objeto injetado no index.html (ex: endereços do modo --watch).
+    Retorna o tamanho em bytes do JSON injetado no index.html, ou None se nada foi atualizado.
+    """
+    metricas = None
+    if args.metrics_json or args.profile:
+        metricas = MetricasExecucao(caminho_perfil=args.profile)
+        if args.metrics_json:
+            tracemalloc.start()
+        medidas_total = {}
+        medicao_total = contextlib.ExitStack()
+        medicao_total.enter_context(medir_recursos(medidas_total))
+
+    def medir_etapa(nome):
+        return metricas.etapa(nome) if metricas is not None else contextlib.nullcontext()
 
-# --- Bloco de Execução Principal ---
-if __name__ == "__main__":
     now_utc = datetime.datetime.now(datetime.timezone.utc)
     now_br = now_utc - datetime.timedelta(hours=3)
     time_info = f"Atualizado em {now_br.strftime('%d/%m/%Y %H:%M:%S')} (UTC-3) / {now_utc.strftime('%d/%m/%Y %H:%M:%S')} (UTC)"
 
-    nome_arquivo_excel = 'DADOS.xlsx' 
-    nome_arquivo_html = 'index.html' 
+    if metricas is not None:
+        metricas.informacoes["planilha"] = nome_arquivo_excel
+        metricas.informacoes["opcoes"] = {"engine": args.engine, "reader": resolver_leitor_excel(args.reader), "cache": cache is not None,
+                                          "workers": workers, "dados": args.dados, "banco": args.banco, "output": args.output, "formato": args.formato,
+                                          "decimais": args.decimais, "delta": args.delta, "pre_agregar": args.pre_agregar}
 
 
+    html_atualizado = None
     print(f"Iniciando processamento integrado do arquivo '{nome_arquivo_excel}'...")
 
     if not os.path.exists(nome_arquivo_excel):
         print(f"Erro: O arquivo '{nome_arquivo_excel}' não foi encontrado no diretório atual.")
         print("Certifique-se de que a planilha está na mesma pasta do script Python.")
     else:
-        dados_extraidos = processar_planilha_integrado(nome_arquivo_excel)
+        fontes_dados = listar_fontes_de_dados(args.dados) if args.dados else None
+        dados_extraidos = processar_planilha_integrado(nome_arquivo_excel, engine=args.engine, reader=args.reader, cache=cache, workers=workers, metricas=metricas,
+                                                       fontes_dados=fontes_dados)
 
         if dados_extraidos is not None:
             if dados_extraidos.get("calculated_views"):
-                dados_extraidos["timestamp_utc"] = datetime.datetime.utcnow().isoformat() + 'Z'
-                dados_extraidos["timestamp_local"] = datetime.datetime.now().astimezone().isoformat()
-
-                if update_index_html_with_json(nome_arquivo_html, dados_extraidos):
+                if args.banco:
+                    # Antes da conversão para a saída: o banco guarda os valores sem arredondamento
+                    with medir_etapa("banco_resultados"):
+                        gravar_resultados_sqlite(args.banco, dados_extraidos)
+                preparar_visoes_para_saida(dados_extraidos, args, medir_etapa)
+
+                if args.output == "externo":
+                    # O index.html recebe só a referência ao manifesto; as visões ficam em arquivos separados
+                    with medir_etapa("visoes_externas"):
+                        dados_html = escrever_visoes_externas(dados_extraidos, args.views_dir, nome_arquivo_html)
+                else:
+                    dados_html = dados_extraidos
+                if dados_html is not None and dados_adicionais:
+                    dados_html = {**dados_html, **dados_adicionais}
+
+                if dados_html is not None:
+                    with medir_etapa("injecao_html"):
+                        html_atualizado = update_index_html_with_json(nome_arquivo_html, dados_html)
+                    if metricas is not None and html_atualizado:
+                        metricas.informacoes["bytes_json_injetado"] = html_atualizado
+                        metricas.registrar_saida(nome_arquivo_html, "index.html")
+                    if metricas is not None and args.output == "externo":
+                        for nome in sorted(os.listdir(args.views_dir)):
+                            if nome == "manifest.json" or (nome.startswith("visao_") and nome.endswith(".json")):
+                                metricas.registrar_saida(os.path.join(args.views_dir, nome), "manifesto" if nome == "manifest.json" else "visão")
+
+                if html_atualizado:
                     print(f"\nProcessamento integrado concluído. {time_info}")
                     print(f"Arquivo '{nome_arquivo_html}' gerado/atualizado com a estrutura JSON calculada.")
 
@@ -586,4 +3391,500 @@ if __name__ == "__main__":
                 print("Verifique se suas abas estão nomeadas corretamente (iniciando com 'plano(...)' e 'dados(...)') e se os Planos referenciam DataSources existentes com dados.")
 
         else:
-            print(f"\nProcessamento falhou devido a erros na leitura inicial da planilha. {time_info}")
\ No newline at end of file
+            print(f"\nProcessamento falhou devido a erros na leitura inicial da planilha. {time_info}")
+
+    if metricas is not None:
+        medicao_total.close()
+        metricas.informacoes["total"] = medidas_total
+        metricas.informacoes["dependencias_carregadas"] = [nome for nome in DEPENDENCIAS_PESADAS if nome in sys.modules]
+        metricas.imprimir_resumo()
+        if args.metrics_json:
+            tracemalloc.stop()
+            try:
+                metricas.gravar(args.metrics_json)
+                print(f"Relatório de métricas gravado em '{args.metrics_json}'.")
+            except OSError as e:
+                print(f"Erro ao gravar o relatório de métricas em '{args.metrics_json}': {e}")
+    return html_atualizado
+
+
+# --- Modo lote (--lote) ---
+# Várias planilhas (ex: uma por unidade de negócio) processadas em paralelo, uma por processo. Cada unidade
+# ganha uma pasta com as suas visões em arquivos externos (manifesto + um arquivo por visão) e o log do seu
+# processamento; o lote.json lista as unidades, com as falhas, e o index.html do lote troca de unidade
+# pelo seletor "Unidade". Uma planilha com erro não interrompe as demais.
+DEFAULT_BATCH_DIR = "lote"
+FORMATO_LOTE = 1 # Versão do formato do lote.json
+EXTENSOES_PLANILHA = (".xlsx", ".xlsm", ".xls")
+
+def listar_planilhas_do_lote(entradas):
+    """
+    Expande as entradas do --lote (pastas, arquivos ou padrões glob como 'unidades/*.xlsx') na lista de
+    planilhas a processar, sem repetições e na ordem das entradas. Nas pastas entram os arquivos com
+    extensão de planilha, em ordem alfabética; arquivos de trava do Excel ('~$...') são ignorados.
+    """
+    import glob
+
+    planilhas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            encontrados = [os.path.join(entrada, nome) for nome in sorted(os.listdir(entrada))
+                           if nome.lower().endswith(EXTENSOES_PLANILHA)]
+        else:
+            encontrados = sorted(glob.glob(entrada)) or ([entrada] if os.path.exists(entrada) else [])
+            if not encontrados:
+                print(f"Aviso: Nenhuma planilha encontrada para '{entrada}'.")
+        planilhas.extend(caminho for caminho in encontrados
+                         if os.path.isfile(caminho) and not os.path.basename(caminho).startswith('~$'))
+    return list(dict.fromkeys(planilhas))
+
+def nomes_das_unidades(planilhas):
+    """Nome de cada unidade (o nome do arquivo sem extensão), com um sufixo numérico quando dois coincidem."""
+    nomes = []
+    usados = set()
+    for caminho in planilhas:
+        base = os.path.splitext(os.path.basename(caminho))[0].strip() or "unidade"
+        nome, sufixo = base, 2
+        while nome.lower() in usados:
+            nome, sufixo = f"{base}_{sufixo}", sufixo + 1
+        usados.add(nome.lower())
+        nomes.append(nome)
+    return nomes
+
+def processar_unidade(args, caminho_excel, pasta_unidade, caminho_html):
+    """
+    Processa a planilha de uma unidade do lote (num processo do pool) e grava as visões em pasta_unidade,
+    no modo externo, com o manifesto referenciado a partir de caminho_html. A saída do processamento vai
+    para pasta_unidade/processamento.log. Nunca lança exceção: retorna o resumo da unidade, com
+    "status" 'ok' ou 'erro' (e a mensagem em "erro").
+    """
+    inicio = time.perf_counter()
+    resumo = {"planilha": caminho_excel, "status": "erro", "erro": None, "manifest": None, "num_visoes": 0}
+    try:
+        os.makedirs(pasta_unidade, exist_ok=True)
+        caminho_log = os.path.join(pasta_unidade, "processamento.log")
+        resumo["log"] = caminho_log
+        with open(caminho_log, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            try:
+                cache = None if args.no_cache else CacheIncremental(args.cache_dir, args.cache_max_mb, rebuild=args.rebuild)
+                dados_extraidos = processar_planilha_integrado(caminho_excel, engine=args.engine, reader=args.reader, cache=cache, workers=1)
+                if dados_extraidos is None:
+                    resumo["erro"] = "falha na leitura da planilha"
+                elif not dados_extraidos.get("calculated_views"):
+                    resumo["erro"] = "nenhuma visão calculada (verifique os nomes das abas e os vínculos dos planos)"
+                else:
+                    preparar_visoes_para_saida(dados_extraidos, args)
+                    referencia = escrever_visoes_externas(dados_extraidos, pasta_unidade, caminho_html)
+                    if referencia is None:
+                        resumo["erro"] = "falha ao gravar as visões"
+                    else:
+                        resumo.update(status="ok", manifest=referencia["manifest"], num_visoes=len(dados_extraidos["calculated_views"]))
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                resumo["erro"] = f"{type(e).__name__}: {e}"
+    except OSError as e:
+        resumo["erro"] = f"{type(e).__name__}: {e}"
+    resumo["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+def processar_lote(args, entradas, pasta_saida=DEFAULT_BATCH_DIR, workers=None, nome_arquivo_html='index.html'):
+    """
+    Processa as planilhas do lote (ver listar_planilhas_do_lote) com até 'workers' processos (padrão: todos os
+    núcleos), grava pasta_saida/lote.json e o pasta_saida/index.html (cópia de nome_arquivo_html com o seletor de
+    unidades) e informa as falhas e o tempo total. Retorna o conteúdo do lote.json, ou None se não houver planilhas.
+    """
+    planilhas = listar_planilhas_do_lote(entradas)
+    if not planilhas:
+        print(f"Erro: Nenhuma planilha encontrada em {entradas}.")
+        return None
+    nomes = nomes_das_unidades(planilhas)
+    workers = min(workers or os.cpu_count() or 1, len(planilhas))
+    caminho_html = os.path.join(pasta_saida, "index.html")
+    os.makedirs(pasta_saida, exist_ok=True)
+    print(f"Lote: {len(planilhas)} planilha(s) com até {workers} processo(s); saída em '{pasta_saida}'.")
+
+    inicio = time.perf_counter()
+    resumos = [None] * len(planilhas)
+
+    def registrar(indice, resumo):
+        resumo = resumos[indice] = {"nome": nomes[indice], **resumo}
+        concluidas = sum(1 for item in resumos if item is not None)
+        situacao = f"{resumo['num_visoes']} visão(ões)" if resumo["status"] == "ok" else f"ERRO: {resumo['erro']}"
+        print(f"[{concluidas}/{len(planilhas)}] {nomes[indice]} ({resumo['segundos']:.2f} s): {situacao}")
+
+    tarefas = [(args, caminho, os.path.join(pasta_saida, nome), caminho_html) for caminho, nome in zip(planilhas, nomes)]
+    if workers <= 1:
+        for indice, tarefa in enumerate(tarefas):
+            registrar(indice, processar_unidade(*tarefa))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(processar_unidade, *tarefa): indice for indice, tarefa in enumerate(tarefas)}
+            for future in as_completed(futures):
+                indice = futures[future]
+                try:
+                    resumo = future.result()
+                except Exception as e: # O processo da unidade morreu (ex: falta de memória)
+                    resumo = {"planilha": planilhas[indice], "status": "erro", "erro": f"{type(e).__name__}: {e}",
+                              "manifest": None, "num_visoes": 0, "segundos": 0.0}
+                registrar(indice, resumo)
+    segundos_total = time.perf_counter() - inicio
+    falhas = [resumo for resumo in resumos if resumo["status"] != "ok"]
+
+    lote = {
+        "formato": FORMATO_LOTE,
+        "timestamp_utc": datetime.datetime.utcnow().isoformat() + 'Z',
+        "workers": workers,
+        "segundos_total": round(segundos_total, 3),
+        "segundos_somados": round(sum(resumo["segundos"] for resumo in resumos), 3),
+        "falhas": len(falhas),
+        "unidades": resumos,
+    }
+    caminho_lote = os.path.join(pasta_saida, "lote.json")
+    try:
+        with open(caminho_lote + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(lote, f, ensure_ascii=False, indent=1)
+        os.replace(caminho_lote + ".tmp", caminho_lote)
+        print(f"\nManifesto do lote gravado em '{caminho_lote}'.")
+    except OSError as e:
+        print(f"\nErro ao gravar o manifesto do lote em '{caminho_lote}': {e}")
+
+    # O index.html do lote começa pela primeira unidade processada com sucesso
+    primeira = next((resumo for resumo in resumos if resumo["status"] == "ok"), None)
+    if primeira is not None:
+        import shutil
+
+        dados_html = {
+            "manifest": primeira["manifest"],
+            "lote": [{"nome": resumo["nome"], "manifest": resumo["manifest"]} for resumo in resumos],
+            "timestamp_utc": lote["timestamp_utc"],
+            "timestamp_local": datetime.datetime.now().astimezone().isoformat(),
+        }
+        try:
+            if os.path.abspath(nome_arquivo_html) != os.path.abspath(caminho_html):
+                shutil.copyfile(nome_arquivo_html, caminho_html)
+            if update_index_html_with_json(caminho_html, dados_html):
+                print(f"Visualizador do lote: '{caminho_html}' (abra por um servidor web, ex: python -m http.server).")
+        except OSError as e:
+            print(f"Erro ao copiar '{nome_arquivo_html}' para '{caminho_html}': {e}")
+    else:
+        print(f"Nenhuma unidade foi processada com sucesso; o '{caminho_html}' do lote não foi gerado.")
+
+    print("\n--- Resumo do lote ---")
+    print(f"{len(resumos) - len(falhas)} de {len(resumos)} unidade(s) processada(s) com sucesso.")
+    if falhas:
+        print(f"{len(falhas)} falha(s):")
+        for resumo in falhas:
+            print(f" - {resumo['nome']} ('{resumo['planilha']}'): {resumo['erro']}" + (f" (log: '{resumo['log']}')" if resumo.get("log") else ""))
+    print(f"Tempo total: {segundos_total:.2f} s com {workers} processo(s) "
+          f"(soma dos tempos das unidades: {lote['segundos_somados']:.2f} s).")
+    return lote
+
+
+# --- Modo observação (--watch) ---
+# O processo fica aberto: as abas lidas, os planos compilados e as visões calculadas ficam em memória, a planilha
+# é verificada periodicamente e, quando é salva, só as abas alteradas são relidas e só as visões afetadas são
+# recalculadas (mesmas chaves por conteúdo do cache incremental). Um servidor HTTP local serve o index.html e as
+# visões e avisa a página aberta (Server-Sent Events), que recarrega os dados sem recarregar a página.
+DEFAULT_WATCH_PORT = 8000
+DEFAULT_WATCH_INTERVAL = 1.0 # Segundos entre verificações da planilha
+ROTA_EVENTOS = "/eventos"
+ROTA_DADOS = "/dados.json"
+
+class CacheEmMemoria(CacheIncremental):
+    """
+    Cache das execuções do modo --watch: as entradas ficam em memória (sem pickle), opcionalmente com um
+    CacheIncremental em disco por baixo (para a primeira execução e para as próximas execuções normais).
+    Ao fim de cada execução, as entradas que ela não usou (versões antigas das abas) saem da memória.
+    """
+
+    def __init__(self, cache_disco=None):
+        super().__init__(diretorio=cache_disco.diretorio if cache_disco is not None else DEFAULT_CACHE_DIR)
+        self.cache_disco = cache_disco
+        self.entradas = {} # {(categoria, chave): valor}
+        self.usadas = set()
+
+    def iniciar_execucao(self):
+        """Zera o relatório e o registro de entradas usadas antes de uma nova execução."""
+        self.reutilizados = defaultdict(list)
+        self.recalculados = defaultdict(list)
+        self.usadas = set()
+        if self.cache_disco is not None:
+            self.cache_disco.reutilizados = defaultdict(list)
+            self.cache_disco.recalculados = defaultdict(list)
+
+    def carregar(self, categoria, chave, descricao):
+        self.usadas.add((categoria, chave))
+        if (categoria, chave) in self.entradas:
+            self.reutilizados[categoria].append(descricao)
+            return True, self.entradas[(categoria, chave)]
+        if self.cache_disco is not None:
+            found, valor = self.cache_disco.carregar(categoria, chave, descricao)
+            if found:
+                self.entradas[(categoria, chave)] = valor
+                self.reutilizados[categoria].append(descricao)
+                return True, valor
+        self.recalculados[categoria].append(descricao)
+        return False, None
+
+    def salvar(self, categoria, chave, valor):
+        self.usadas.add((categoria, chave))
+        self.entradas[(categoria, chave)] = valor
+        if self.cache_disco is not None:
+            self.cache_disco.salvar(categoria, chave, valor)
+
+    def aplicar_limite(self):
+        for entrada in [entrada for entrada in self.entradas if entrada not in self.usadas]:
+            del self.entradas[entrada]
+        if self.cache_disco is not None:
+            self.cache_disco.aplicar_limite()
+
+    def imprimir_relatorio(self):
+        print("\n--- Cache em memória (modo --watch) ---")
+        for categoria in ("dados", "planos", "visoes"):
+            reutilizados = self.reutilizados.get(categoria, [])
+            recalculados = self.recalculados.get(categoria, [])
+            if not reutilizados and not recalculados:
+                continue
+            print(f" - {categoria}: {len(reutilizados)} reutilizados, {len(recalculados)} recalculados")
+            if recalculados:
+                print(f"   Recalculados: {recalculados}")
+
+def assinatura_arquivo(caminho):
+    """(tamanho, data de modificação) do arquivo, ou None se ele não existir (ex: no meio de um salvamento)."""
+    try:
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return (info.st_size, info.st_mtime_ns)
+
+class PublicadorDeAtualizacoes:
+    """Numera as versões dos dados gravados no index.html e acorda as conexões de eventos a cada nova versão."""
+
+    def __init__(self):
+        import threading
+        self.condicao = threading.Condition()
+        self.versao = 0
+
+    def publicar(self):
+        with self.condicao:
+            self.versao += 1
+            self.condicao.notify_all()
+
+    def aguardar(self, versao_conhecida, timeout):
+        """Espera uma versão diferente de versao_conhecida (ou o timeout) e retorna a versão atual."""
+        with self.condicao:
+            self.condicao.wait_for(lambda: self.versao != versao_conhecida, timeout)
+            return self.versao
+
+def criar_servidor_watch(pasta, porta, publicador, caminho_html):
+    """
+    Servidor HTTP local (só 127.0.0.1) com os arquivos de 'pasta' (index.html, visões externas),
+    ROTA_DADOS (o JSON injetado em caminho_html, copiado de lá em blocos) e ROTA_EVENTOS
+    (Server-Sent Events com a versão dos dados).
+    """
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *handler_args, **handler_kwargs):
+            super().__init__(*handler_args, directory=pasta, **handler_kwargs)
+
+        def end_headers(self):
+            self.send_header("Cache-Control", "no-cache") # A página e as visões mudam a cada processamento
+            super().end_headers()
+
+        def log_message(self, format, *log_args):
+            pass # Sem uma linha no console por requisição
+
+        def do_GET(self):
+            caminho = self.path.split("?", 1)[0]
+            if caminho == ROTA_EVENTOS:
+                self.enviar_eventos()
+            elif caminho == ROTA_DADOS:
+                self.enviar_dados()
+            else:
+                super().do_GET()
+
+        def enviar_dados(self):
+            # Sem Content-Length: o JSON é copiado do index.html em blocos e a conexão (HTTP/1.0) fecha no fim.
+            # O index.html é trocado inteiro a cada processamento, então o arquivo aberto é sempre uma versão completa.
+            try:
+                with open(caminho_html, 'rb') as origem:
+                    lido = _copiar_ate_marcador(origem, MARCADOR_INICIO_DADOS)
+                    if lido is None:
+                        self.send_error(404, "Dados não encontrados no index.html")
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json; charset=utf-8")
+                    self.end_headers()
+                    _copiar_ate_marcador(origem, MARCADOR_FIM_DADOS, self.wfile, lido)
+            except FileNotFoundError:
+                self.send_error(404, "index.html não encontrado")
+
+        def enviar_eventos(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            versao = publicador.versao
+            try:
+                # A versão atual vai logo na conexão: uma página que reconecta descobre se perdeu alguma atualização
+                self.wfile.write(f"retry: 2000\nevent: atualizacao\ndata: {json.dumps({'versao': versao})}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                while True:
+                    nova_versao = publicador.aguardar(versao, timeout=15)
+                    if nova_versao != versao:
+                        versao = nova_versao
+                        self.wfile.write(f"event: atualizacao\ndata: {json.dumps({'versao': versao})}\n\n".encode("utf-8"))
+                    else:
+                        self.wfile.write(b": ping\n\n") # Mantém a conexão aberta e detecta páginas fechadas
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), Handler)
+    servidor.daemon_threads = True
+    return servidor
+
+def observar_planilha(args, cache, workers, nome_arquivo_excel='DADOS.xlsx', nome_arquivo_html='index.html',
+                      porta=DEFAULT_WATCH_PORT, intervalo=DEFAULT_WATCH_INTERVAL):
+    """
+    Modo --watch: processa a planilha, sobe o servidor local e reprocessa a cada salvamento até Ctrl+C.
+    São observados o arquivo da planilha e os arquivos de --dados (os arquivos de trava '~$' que o Excel cria ao
+    lado são ignorados); um arquivo novo que combine com uma pasta ou padrão de --dados também dispara o reprocessamento.
+    """
+    import io
+    import threading
+
+    cache_memoria = CacheEmMemoria(cache)
+    publicador = PublicadorDeAtualizacoes()
+    dados_adicionais = {"atualizacao_ao_vivo": {"eventos": ROTA_EVENTOS, "dados": ROTA_DADOS}}
+
+    def processar():
+        cache_memoria.iniciar_execucao()
+        inicio = time.perf_counter()
+        if executar_processamento(args, cache_memoria, workers, nome_arquivo_excel, nome_arquivo_html, dados_adicionais) is not None:
+            publicador.publicar()
+            print(f"\n[watch] Dados atualizados em {time.perf_counter() - inicio:.1f}s (versão {publicador.versao}).")
+        else:
+            print("\n[watch] O processamento falhou; a página continua com os dados anteriores.")
+
+    processar()
+    try:
+        servidor = criar_servidor_watch(os.path.dirname(os.path.abspath(nome_arquivo_html)), porta, publicador, os.path.abspath(nome_arquivo_html))
+    except OSError as e:
+        print(f"Erro: Não foi possível iniciar o servidor na porta {porta}: {e}")
+        return
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    print(f"\n[watch] Servindo em http://127.0.0.1:{porta}/{os.path.basename(nome_arquivo_html)}")
+    print(f"[watch] Observando '{nome_arquivo_excel}'{' e os arquivos de --dados' if args.dados else ''} (verificação a cada {intervalo:g}s). Ctrl+C para sair.")
+
+    def assinatura_entradas():
+        assinatura = assinatura_arquivo(nome_arquivo_excel)
+        if assinatura is None or not args.dados:
+            return assinatura
+        with contextlib.redirect_stdout(io.StringIO()):  # os avisos da listagem já saíram no processamento
+            fontes = listar_fontes_de_dados(args.dados)
+        return (assinatura,) + tuple((ds_name, caminho, assinatura_arquivo(caminho)) for ds_name, caminho in sorted(fontes.items()))
+
+    ultima_assinatura = assinatura_entradas()
+    try:
+        while True:
+            time.sleep(intervalo)
+            assinatura = assinatura_entradas()
+            if assinatura is None or assinatura == ultima_assinatura:
+                continue
+            # O Excel (e quem exporta os CSV) grava em etapas: espera os arquivos ficarem estáveis antes de ler
+            time.sleep(intervalo)
+            if assinatura_entradas() != assinatura:
+                continue
+            ultima_assinatura = assinatura
+            print(f"\n[watch] '{nome_arquivo_excel}' ou os arquivos de --dados foram alterados. Reprocessando...")
+            processar()
+    except KeyboardInterrupt:
+        print("\n[watch] Encerrando.")
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+# --- Bloco de Execução Principal ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Processa a planilha de dados e planos de contas e atualiza o index.html com as visões calculadas.")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE,
+                        help="Motor de cálculo: 'vetorizado' (padrão, todos os períodos de uma vez), 'recursivo' (motor original, para comparação) ou 'linear' (o plano compilado numa matriz esparsa; requer scipy).")
+    parser.add_argument("--reader", choices=EXCEL_READERS, default=DEFAULT_EXCEL_READER,
+                        help="Leitor da planilha: 'auto' (padrão: calamine se instalado, senão openpyxl-streaming), 'openpyxl' (leitor original), "
+                             "'openpyxl-streaming', 'calamine' ou 'leve' (sem pandas, partida mais rápida; via python-calamine se instalado, senão openpyxl).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Não usa o cache incremental em disco (relê todas as abas e recalcula todas as visões, sem gravar nada).")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignora o conteúdo atual do cache, recalcula tudo e grava o cache de novo.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Pasta do cache incremental (padrão: '{DEFAULT_CACHE_DIR}').")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_LIMIT_MB,
+                        help=f"Tamanho máximo do cache em MB; as entradas usadas há mais tempo são removidas (padrão: {DEFAULT_CACHE_LIMIT_MB}).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Número de processos para calcular as visões (plano x DataSource) em paralelo, ou, com --lote, para processar as planilhas; 0 usa todos os núcleos (padrão: 1, ou todos os núcleos com --lote).")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default=DEFAULT_OUTPUT_MODE,
+                        help="'embutido' (padrão): todas as visões dentro do index.html; 'externo': manifesto + um arquivo por visão, carregados sob demanda pelo index.html.")
+    parser.add_argument("--views-dir", default=DEFAULT_VIEWS_DIR,
+                        help=f"Pasta dos arquivos de visões no modo 'externo' (padrão: '{DEFAULT_VIEWS_DIR}').")
+    parser.add_argument("--formato", choices=VIEW_FORMATS, default=DEFAULT_VIEW_FORMAT,
+                        help="Formato das visões: 'dicionario' (padrão, valores por período como objeto) ou 'colunar' (períodos uma vez por visão e um array de valores por conta).")
+    parser.add_argument("--decimais", type=int, default=None,
+                        help="No formato colunar, arredonda os valores para este número de casas decimais.")
+    parser.add_argument("--delta", action="store_true",
+                        help="No formato colunar, grava os valores de cada conta como deltas de inteiros (exige --decimais).")
+    parser.add_argument("--pre-agregar", action="store_true",
+                        help="Pré-calcula as agregações trimestral, semestral e anual e o layout do modo comparação, para o index.html não precisar agregar no navegador.")
+    parser.add_argument("--metrics-json", metavar="ARQUIVO",
+                        help="Grava um relatório JSON com tempo e pico de memória por etapa, aba e visão, contadores do cálculo (cache, avaliações e falhas de fórmula) e tamanho da saída. A memória é medida com tracemalloc, o que deixa a execução mais lenta.")
+    parser.add_argument("--profile", nargs="?", const="processar_dados.prof", metavar="ARQUIVO",
+                        help="Roda a etapa de cálculo sob o cProfile e grava o perfil neste arquivo (padrão: 'processar_dados.prof'; abra com pstats ou snakeviz).")
+    parser.add_argument("--watch", action="store_true",
+                        help="Fica observando a planilha: reprocessa só o que mudou a cada salvamento e serve o index.html num servidor local que atualiza a página aberta.")
+    parser.add_argument("--porta", type=int, default=DEFAULT_WATCH_PORT,
+                        help=f"Porta do servidor local do modo --watch (padrão: {DEFAULT_WATCH_PORT}).")
+    parser.add_argument("--intervalo", type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help=f"Segundos entre verificações da planilha no modo --watch (padrão: {DEFAULT_WATCH_INTERVAL:g}).")
+    parser.add_argument("--lote", nargs="+", metavar="ENTRADA",
+                        help="Processa várias planilhas (pastas, arquivos ou padrões como 'unidades/*.xlsx'), uma por processo, gravando as visões de cada uma no modo externo numa pasta própria, mais um lote.json e um index.html com seletor de unidade.")
+    parser.add_argument("--saida-lote", default=DEFAULT_BATCH_DIR, metavar="PASTA",
+                        help=f"Pasta de saída do --lote (padrão: '{DEFAULT_BATCH_DIR}').")
+    parser.add_argument("--dados", nargs="+", metavar="ENTRADA",
+                        help="Lê DataSources de arquivos CSV ou Parquet (pastas, arquivos ou padrões como 'erp/*.parquet'). O nome do DataSource vem do nome do arquivo ('dados (DS01).csv' ou 'DS01.csv') e substitui a aba 'dados' de mesmo nome.")
+    parser.add_argument("--banco", nargs="?", const=DEFAULT_BANCO, metavar="ARQUIVO",
+                        help=f"Grava também os resultados num banco SQLite (padrão: '{DEFAULT_BANCO}'), atualizando só as visões que mudaram. Consulte com consultar_resultados.py.")
+    args = parser.parse_args()
+    if args.engine == "linear" and not scipy_disponivel():
+        parser.error("o motor 'linear' requer o pacote scipy (pip install scipy).")
+    if args.lote and (args.watch or args.metrics_json or args.profile):
+        parser.error("--lote não pode ser combinado com --watch, --metrics-json ou --profile.")
+    if args.lote and (args.dados or args.banco):
+        parser.error("--dados e --banco não podem ser combinados com --lote.")
+    if args.formato != "colunar" and (args.decimais is not None or args.delta):
+        parser.error("--decimais e --delta só se aplicam com --formato colunar.")
+    if args.delta and args.decimais is None:
+        parser.error("--delta exige --decimais.")
+    if args.decimais is not None and args.decimais < 0:
+        parser.error("--decimais deve ser maior ou igual a zero.")
+    if args.workers is None:
+        args.workers = 0 if args.lote else 1
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    if args.profile and workers > 1:
+        print("Aviso: --profile só enxerga o próprio processo; as visões serão calculadas sem processos adicionais (--workers 1).")
+        workers = 1
+    cache = None if args.no_cache else CacheIncremental(args.cache_dir, args.cache_max_mb, rebuild=args.rebuild)
+
+    if args.lote:
+        lote = processar_lote(args, args.lote, args.saida_lote, workers)
+        sys.exit(0 if lote is not None and lote["falhas"] == 0 else 1)
+    elif args.watch:
+        observar_planilha(args, cache, workers, porta=args.porta, intervalo=args.intervalo)
+    else:
+        executar_processamento(args, cache, workers)
+
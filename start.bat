@@ -56,8 +56,11 @@ echo Dependencias verificadas/instaladas.
 echo.
 
 rem --- Executa o script Python ---
+rem '--reader leve' le a planilha sem importar o pandas: e o caminho mais rapido, e os testes
+rem (tests\test_leitor_leve.py) conferem que ele le o mesmo que os leitores do pandas. O pandas continua
+rem instalado para os demais leitores e para os CSV. Um --reader passado ao start.bat prevalece (o ultimo vale).
 echo Executando o script processar_dados.py...
-python processar_dados.py
+python processar_dados.py --reader leve %*
 if %errorlevel% neq 0 (
     echo ERRO: O script Python encontrou um problema durante a execucao.
     echo Verifique as mensagens de erro acima para detalhes.
@@ -75,8 +75,11 @@ echo "Dependencias verificadas/instaladas."
 echo ""
 
 # --- Executa o script Python ---
+# '--reader leve' le a planilha sem importar o pandas: e o caminho mais rapido, e os testes
+# (tests/test_leitor_leve.py) conferem que ele le o mesmo que os leitores do pandas. O pandas continua
+# instalado para os demais leitores e para os CSV. Um --reader passado ao start.sh prevalece (o ultimo vale).
 echo "Executando o script processar_dados.py..."
-python processar_dados.py
+python processar_dados.py --reader leve "$@"
 if [ $? -ne 0 ]; then
     echo "ERRO: O script Python encontrou um problema durante a execucao."
     echo "Verifique as mensagens de erro acima para detalhes."
@@ -0,0 +1,181 @@
+"""
+Testa o banco de resultados (processar_dados.py --banco) e as consultas do consultar_resultados.py: gravação,
+regravação sem mudanças (nenhuma linha alterada), regravação só das visões que mudaram e consultas.
+
+Uso:
+    python -m pytest tests
+"""
+import copy
+import datetime
+import pathlib
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+import processar_dados  # noqa: E402
+import consultar_resultados  # noqa: E402
+
+PERIODOS = [datetime.datetime(2024, mes, 1) for mes in range(1, 7)]
+TABELAS = ("planos", "data_sources", "periodos", "contas", "visoes", "visao_periodos", "valores")
+
+# {aba: linhas (a primeira é o cabeçalho)}
+PLANILHA = {
+    "plano (DRE)": [
+        ["Código", "Descrição", "Tipo", "(DS1)", "(DS2)"],
+        ["001", "Receitas", "sintetica", None, None],
+        ["001.01", "Vendas", "analitica", "R1", "R1"],
+        ["001.01.01", "Vendas online", "analitica", "R2", "R2"],
+        ["002", "Custos", "analitica", "R3", "R3"],
+        ["010", "EBITDA", "calculo (001 - 002)", None, None],
+    ],
+    "plano (CAIXA)": [
+        ["Código", "Descrição", "Tipo", "(DS1)"],
+        ["1", "Entradas", "analitica", "R1;R2"],
+        ["2", "Saídas", "analitica", "R3"],
+    ],
+    "dados (DS1)": [
+        ["Código", "Descrição"] + PERIODOS,
+        ["R1", "Bruto 1", 100, 110, 120, 130, 140, 150],
+        ["R2", "Bruto 2", 10, 20, 30, 40, 50, 60],
+        ["R3", "Bruto 3", 50, 50, 50, 60, 60, 60],
+    ],
+    "dados (DS2)": [
+        ["Código", "Descrição"] + PERIODOS,
+        ["R1", "Bruto 1", 1, 2, 3, 4, 5, 6],
+        ["R3", "Bruto 3", 0.5, 0.5, 0.5, 0.5, 0.5, 0.5],
+    ],
+}
+
+
+def gravar_planilha(caminho, abas):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for nome, linhas in abas.items():
+        ws = wb.create_sheet(nome)
+        for linha in linhas:
+            ws.append(linha)
+    wb.save(caminho)
+    return str(caminho)
+
+
+def processar_e_gravar(tmp_path, abas, banco):
+    """Processa a planilha, grava no banco e retorna (resumo, {(plano, DataSource, conta, período): valor})."""
+    dados = processar_dados.processar_planilha_integrado(gravar_planilha(tmp_path / "planilha.xlsx", abas), cache=None, workers=1)
+    resumo = processar_dados.gravar_resultados_sqlite(banco, dados)
+    valores = {(view["plan_name"], view["data_source_name"], conta["codigo"], periodo): valor
+               for view in dados["calculated_views"] for conta in view["accounts"] for periodo, valor in conta["valores"].items()}
+    return resumo, valores
+
+
+def registrar_alteracoes(banco):
+    """Gatilhos que registram em 'alteracoes' cada linha inserida, alterada ou apagada nas tabelas de resultados."""
+    with sqlite3.connect(banco) as conexao:
+        conexao.execute("CREATE TABLE alteracoes (tabela TEXT, operacao TEXT)")
+        for tabela in TABELAS:
+            for operacao in ("INSERT", "UPDATE", "DELETE"):
+                conexao.execute(f"CREATE TRIGGER registra_{tabela}_{operacao} AFTER {operacao} ON {tabela} "
+                                f"BEGIN INSERT INTO alteracoes VALUES ('{tabela}', '{operacao}'); END")
+    conexao.close()
+
+
+def alteracoes(banco):
+    conexao = sqlite3.connect(banco)
+    try:
+        linhas = conexao.execute("SELECT tabela, operacao FROM alteracoes").fetchall()
+        conexao.execute("DELETE FROM alteracoes")
+        conexao.commit()
+        return linhas
+    finally:
+        conexao.close()
+
+
+@pytest.fixture
+def conectar():
+    conexoes = []
+
+    def abrir(banco):
+        conexoes.append(sqlite3.connect(pathlib.Path(banco).resolve().as_uri() + "?mode=ro", uri=True))
+        return conexoes[-1]
+    yield abrir
+    for conexao in conexoes:
+        conexao.close()
+
+
+def valores_do_banco(conexao, **filtros):
+    return {(plano, ds, codigo, periodo): valor
+            for plano, ds, codigo, _, periodo, valor in consultar_resultados.consultar_valores(conexao, **filtros)}
+
+
+def test_gravar_regravar_e_consultar(tmp_path, conectar):
+    banco = str(tmp_path / "resultados.sqlite")
+
+    # 1. Primeira gravação: todas as visões
+    resumo, esperado = processar_e_gravar(tmp_path, PLANILHA, banco)
+    assert resumo == {"gravadas": 3, "inalteradas": 0, "removidas": 0, "valores": len(esperado)}
+    assert valores_do_banco(conectar(banco)) == esperado
+
+    # 2. Mesma planilha: nenhuma linha das tabelas de resultados é tocada
+    registrar_alteracoes(banco)
+    resumo, _ = processar_e_gravar(tmp_path, PLANILHA, banco)
+    assert resumo == {"gravadas": 0, "inalteradas": 3, "removidas": 0, "valores": 0}
+    assert alteracoes(banco) == []
+    assert valores_do_banco(conectar(banco)) == esperado
+
+    # 3. Um valor bruto do DS2 muda: só a visão DRE x DS2 é regravada
+    abas = copy.deepcopy(PLANILHA)
+    abas["dados (DS2)"][1][4] = 999.5
+    resumo, esperado = processar_e_gravar(tmp_path, abas, banco)
+    assert resumo == {"gravadas": 1, "inalteradas": 2, "removidas": 0,
+                      "valores": sum(1 for chave in esperado if chave[:2] == ("DRE", "DS2"))}
+    assert {tabela for tabela, _ in alteracoes(banco)} == {"visoes", "visao_periodos", "valores"}  # Contas e planos não mudaram
+    assert valores_do_banco(conectar(banco)) == esperado
+    assert esperado[("DRE", "DS2", "010", "2024-03-01 00:00:00")] == 999.5 - 0.5
+
+    # 4. O DS2 sai da planilha: a visão dele é removida, com o DataSource
+    del abas["dados (DS2)"]
+    resumo, esperado = processar_e_gravar(tmp_path, abas, banco)
+    assert resumo == {"gravadas": 0, "inalteradas": 2, "removidas": 1, "valores": 0}
+    conexao = conectar(banco)
+    assert valores_do_banco(conexao) == esperado
+    assert [linha[:4] for linha in consultar_resultados.listar(conexao, "visoes")[1]] == [("CAIXA", "DS1", 2, 6), ("DRE", "DS1", 5, 6)]
+    assert list(consultar_resultados.listar(conexao, "data-sources")[1]) == [("DS1",)]
+
+
+def test_consultas(tmp_path, conectar):
+    banco = str(tmp_path / "resultados.sqlite")
+    _, esperado = processar_e_gravar(tmp_path, PLANILHA, banco)
+    conexao = conectar(banco)
+
+    linhas = list(consultar_resultados.consultar_valores(conexao, plano="DRE", data_source="DS1", contas=["010"], periodos=["2024-Q1", "2024-t2", "2024-02"]))
+    ebitda = [esperado[("DRE", "DS1", "010", periodo.strftime("%Y-%m-%d %H:%M:%S"))] for periodo in PERIODOS]
+    assert linhas == [("DRE", "DS1", "010", "EBITDA", "2024-Q1", sum(ebitda[:3])),
+                      ("DRE", "DS1", "010", "EBITDA", "2024-Q2", sum(ebitda[3:])),
+                      ("DRE", "DS1", "010", "EBITDA", "2024-02", ebitda[1])]
+
+    subcontas = consultar_resultados.consultar_valores(conexao, plano="DRE", data_source="DS2", contas=["001.01"], subcontas=True, periodos=["2024"])
+    assert [(codigo, valor) for _, _, codigo, _, _, valor in subcontas] == [("001.01", 21.0)]  # 001.01.01 não tem dados no DS2
+
+    periodos = list(consultar_resultados.listar(conexao, "periodos")[1])
+    assert periodos[0] == ("2024-01-01 00:00:00", "2024-01", "2024-Q1", "2024-S1", 2024)
+    contas = [linha[1] for linha in consultar_resultados.listar(conexao, "contas", plano="DRE")[1]]
+    assert contas == ["001", "001.01", "001.01.01", "002", "010"]
+
+
+def test_linha_de_comando(tmp_path):
+    banco = str(tmp_path / "resultados.sqlite")
+    processar_e_gravar(tmp_path, PLANILHA, banco)
+    comando = [sys.executable, str(RAIZ / "consultar_resultados.py"), "--banco", banco]
+
+    saida = subprocess.run(comando + ["--plano", "CAIXA", "--conta", "1", "--periodo", "2024-S1", "--formato", "csv"],
+                           capture_output=True, text=True, check=True).stdout
+    assert saida.splitlines() == ["plano,data_source,codigo,descricao,periodo,valor", "CAIXA,DS1,1,Entradas,2024-S1,960.0"]
+
+    vazio = subprocess.run(comando + ["--plano", "CAIXA", "--periodo", "2030"], capture_output=True, text=True)
+    assert vazio.returncode == 1
+    assert "Nenhum resultado" in vazio.stderr
@@ -0,0 +1,137 @@
+"""
+Testa o compilador de fórmulas das contas 'calculo' (compilar_formula): precedência, parênteses, operadores
+unários, rejeição de fórmulas inválidas e divisão por zero, nos avaliadores e no cálculo das visões.
+
+Uso:
+    python -m pytest tests
+"""
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+import processar_dados  # noqa: E402
+
+
+def avaliar(formula, **valores):
+    """Avalia a fórmula nos dois avaliadores; cada conta vem como c<código> (com '_' no lugar de '.'), ex: c001_01=11.0."""
+    compilada = processar_dados.compilar_formula(formula)
+    por_slot = [valores[f"c{codigo.replace('.', '_')}"] for codigo in compilada.codigos]
+    escalar = compilada.avaliar(por_slot)
+    vetor, erro = compilada.avaliar_vetorial([np.array([valor]) for valor in por_slot])
+    assert not erro
+    assert vetor.tolist() == [escalar]
+    return escalar
+
+
+@pytest.mark.parametrize("formula, esperado", [
+    ("001 + 002 * 003", 2.0 + 3.0 * 5.0),
+    ("001 * 002 + 003", 2.0 * 3.0 + 5.0),
+    ("(001 + 002) * 003", (2.0 + 3.0) * 5.0),
+    ("001 - 002 - 003", (2.0 - 3.0) - 5.0),
+    ("001 / 002 / 003", (2.0 / 3.0) / 5.0),
+    ("001 - (002 - 003)", 2.0 - (3.0 - 5.0)),
+    ("001 + 002 / 003 * 004", 2.0 + 3.0 / 5.0 * 7.0),
+    ("-001 * 002", -2.0 * 3.0),
+    ("-(001 + 002)", -(2.0 + 3.0)),
+    ("001 - -002", 2.0 - -3.0),
+    ("+001 - +002", 2.0 - 3.0),
+    ("((001))", 2.0),
+    ("001.01 * 2 + 001", 11.0 * 0.0 + 2.0),
+])
+def test_precedencia_e_associatividade(formula, esperado):
+    valores = {"c001": 2.0, "c002": 3.0, "c003": 5.0, "c004": 7.0, "c001_01": 11.0, "c2": 0.0}
+    assert avaliar(formula, **valores) == esperado
+
+
+def test_codigos_sem_repeticao_na_ordem_da_formula():
+    compilada = processar_dados.compilar_formula(" 002.01 + 001 * (002.01 - 003)  ")
+    assert compilada.codigos == ("002.01", "001", "003")
+    assert compilada.avaliar([10.0, 2.0, 4.0]) == 10.0 + 2.0 * (10.0 - 4.0)
+
+
+@pytest.mark.parametrize("formula", [
+    "",
+    "   ",
+    "001 +",
+    "* 001",
+    "001 002",
+    "(001 + 002",
+    "001 + 002)",
+    "()",
+    "001 ** 002",
+    "001 % 002",
+    "abs(001)",
+    "001 + x",
+    "__import__('os')",
+    "001,5 + 002",
+    "1e3",
+])
+def test_formula_invalida(formula):
+    with pytest.raises(processar_dados.ErroFormula):
+        processar_dados.compilar_formula(formula)
+
+
+def test_divisao_por_zero():
+    compilada = processar_dados.compilar_formula("001 / (002 - 003) + 004")
+    with pytest.raises(ZeroDivisionError):
+        compilada.avaliar([1.0, 2.0, 2.0, 5.0])
+    vetor, erro = compilada.avaliar_vetorial([np.array([1.0, 1.0]), np.array([2.0, 4.0]), np.array([2.0, 2.0]), np.array([5.0, 5.0])])
+    assert erro.tolist() == [True, False]
+    assert vetor[1] == 1.0 / 2.0 + 5.0
+
+
+def test_plano_com_formulas(capsys):
+    contas = [
+        {"codigo": "001", "tipo": "analitica", "formula": None},
+        {"codigo": "002", "tipo": "calculo (001 - (001 + 003) / 2)", "formula": "001 - (001 + 003) / 2"},
+        {"codigo": "003", "tipo": "calculo (001 +)", "formula": "001 +"},
+        {"codigo": "004", "tipo": "sintetica", "formula": None},
+    ]
+    processar_dados.compilar_formulas_do_plano(contas, "P1")
+    saida = capsys.readouterr().out
+    assert contas[1]["formula_compilada"].codigos == ("001", "003", "2")
+    assert "referencia contas inexistentes no plano (valem 0.0): ['2']" in saida
+    assert contas[2]["formula_compilada"] is None
+    assert "Fórmula inválida na conta '003' do plano 'P1' ('001 +')" in saida
+    assert contas[0]["formula_compilada"] is None and contas[3]["formula_compilada"] is None
+
+
+def test_formula_com_parenteses_na_coluna_tipo():
+    pd = pytest.importorskip("pandas")
+    aba = pd.DataFrame({
+        "Código": ["001", "002", "003"],
+        "Descrição": ["A", "B", "C"],
+        "Tipo": ["analitica", "calculo (001 - (001 + 003) * 001)", "CALCULO((001))"],
+    })
+    contas, _ = processar_dados.ler_aba_plano(aba, "plano (P1)")
+    assert [conta["formula"] for conta in contas] == [None, "001 - (001 + 003) * 001", "(001)"]
+
+
+@pytest.mark.parametrize("engine", processar_dados.ENGINES)
+def test_divisao_por_zero_vale_zero_na_visao(engine):
+    if engine == "linear":
+        pytest.importorskip("scipy")
+    contas = [
+        {"codigo": "001", "descricao": "A", "tipo": "analitica", "formula": None, "data_sources": {"DS1": "R1"}},
+        {"codigo": "002", "descricao": "B", "tipo": "analitica", "formula": None, "data_sources": {"DS1": "R2"}},
+        {"codigo": "003", "descricao": "A / B", "tipo": "calculo (001 / 002)", "formula": "001 / 002", "data_sources": {}},
+        {"codigo": "004", "descricao": "A + A / (B - B)", "tipo": "calculo (001 + 001 / (002 - 002))",
+         "formula": "001 + 001 / (002 - 002)", "data_sources": {}},
+    ]
+    processar_dados.compilar_formulas_do_plano(contas, "P1")
+    periodos = ["Jan/2024", "Fev/2024", "Mar/2024"]
+    dados = {
+        "periodos": periodos,
+        "matriz": np.array([[6.0, 6.0, 0.0], [3.0, 0.0, 0.0]]),
+        "indice_codigos": {"R1": 0, "R2": 1},
+        "indice_periodos": {periodo: coluna for coluna, periodo in enumerate(periodos)},
+    }
+    visao = processar_dados.calcular_visao("P1", "DS1", contas, processar_dados.build_account_hierarchy(contas), dados, engine)
+    valores = {conta["codigo"]: list(conta["valores"].values()) for conta in visao["accounts"]}
+    assert valores["003"] == [2.0, 0.0, 0.0]
+    # A divisão por zero zera a conta inteira no período, não só o termo da divisão
+    assert valores["004"] == [0.0, 0.0, 0.0]
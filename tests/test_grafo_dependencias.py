@@ -0,0 +1,128 @@
+"""
+Testa o grafo de dependências (build_dependency_graph): ordem de avaliação, detecção e aviso de referências
+circulares (as contas do ciclo valem 0.0 em todos os motores) e cadeias longas sem estourar a recursão.
+
+Uso:
+    python -m pytest tests
+"""
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+import processar_dados  # noqa: E402
+
+PERIODOS = ["Jan/2024", "Fev/2024"]
+
+
+def conta(codigo, tipo="analitica", vinculo=None):
+    formula = tipo[tipo.index("(") + 1:tipo.rindex(")")] if tipo.startswith("calculo") else None
+    return {"codigo": codigo, "descricao": f"Conta {codigo}", "tipo": tipo, "formula": formula,
+            "data_sources": {"DS1": vinculo} if vinculo else {}}
+
+
+def grafo(contas):
+    processar_dados.compilar_formulas_do_plano(contas, "P1")
+    return processar_dados.build_account_hierarchy(contas)[3]
+
+
+def calcular(contas, engine):
+    """Visão do plano com um DataSource em que o código bruto Rn vale [n, 10 * n]: {codigo: valores}."""
+    if engine == "linear":
+        pytest.importorskip("scipy")
+    processar_dados.compilar_formulas_do_plano(contas, "P1")
+    hierarquia = processar_dados.build_account_hierarchy(contas)
+    processar_dados.report_dependency_cycles(hierarquia[3], "P1")
+    codigos = sorted({c["data_sources"]["DS1"] for c in contas if c["data_sources"]})
+    dados = {
+        "periodos": PERIODOS,
+        "matriz": np.array([[float(codigo[1:]), 10.0 * float(codigo[1:])] for codigo in codigos]).reshape(len(codigos), 2),
+        "indice_codigos": {codigo: linha for linha, codigo in enumerate(codigos)},
+        "indice_periodos": {periodo: coluna for coluna, periodo in enumerate(PERIODOS)},
+    }
+    visao = processar_dados.calcular_visao("P1", "DS1", contas, hierarquia, dados, engine)
+    return {c["codigo"]: list(c["valores"].values()) for c in visao["accounts"]}
+
+
+def test_ordem_de_avaliacao():
+    contas = [
+        conta("004", "calculo (003 * 001)"),
+        conta("001", "sintetica"),
+        conta("001.02", "analitica", "R2"),
+        conta("001.01", "sintetica"),
+        conta("001.01.01", "analitica", "R1"),
+        conta("003", "calculo (001 - 002)"),
+        conta("002", "analitica", "R3"),
+    ]
+    resultado = grafo(contas)
+    ordem = resultado["ordem"]
+    assert sorted(ordem) == sorted(c["codigo"] for c in contas)
+    posicao = {codigo: i for i, codigo in enumerate(ordem)}
+    for codigo, dependencias in resultado["dependencias"].items():
+        for dependencia in dependencias:
+            assert posicao[dependencia] < posicao[codigo]
+    assert resultado["dependentes"]["001"] == ["004", "003"]
+    assert resultado["ciclos"] == []
+    assert resultado["contas_em_ciclo"] == set()
+
+
+@pytest.mark.parametrize("contas, ciclos", [
+    # Conta que referencia a si mesma
+    ([conta("001", "calculo (001 + 002)"), conta("002", "analitica", "R2")], [["001"]]),
+    # Duas contas de cálculo que se referenciam
+    ([conta("001", "calculo (002)"), conta("002", "calculo (001 * 003)"), conta("003", "analitica", "R3")], [["001", "002"]]),
+    # Filha que referencia o próprio ancestral
+    ([conta("001", "sintetica"), conta("001.01", "sintetica"), conta("001.01.01", "calculo (001 - 002)"),
+      conta("001.02", "analitica", "R1"), conta("002", "analitica", "R2")], [["001", "001.01", "001.01.01"]]),
+    # Dois ciclos independentes
+    ([conta("001", "calculo (002)"), conta("002", "calculo (001)"), conta("003", "calculo (003)"),
+      conta("004", "analitica", "R4")], [["001", "002"], ["003"]]),
+])
+def test_ciclos_detectados_e_informados(contas, ciclos, capsys):
+    resultado = grafo(contas)
+    assert sorted(resultado["ciclos"]) == ciclos
+    assert resultado["contas_em_ciclo"] == {codigo for ciclo in ciclos for codigo in ciclo}
+    processar_dados.report_dependency_cycles(resultado, "P1")
+    saida = capsys.readouterr().out
+    for ciclo in ciclos:
+        assert f"Erro: Referência circular no plano 'P1' envolvendo as contas {ciclo}. Essas contas terão valor 0.0." in saida
+
+
+@pytest.mark.parametrize("engine", processar_dados.ENGINES)
+def test_contas_em_ciclo_valem_zero(engine, capsys):
+    contas = [
+        conta("001", "sintetica"),
+        conta("001.01", "analitica", "R1"),
+        conta("001.02", "calculo (003 + 001.01)"),  # 001.02 -> 003 -> 001 -> 001.02
+        conta("002", "analitica", "R2"),
+        conta("003", "calculo (001 - 002)"),
+        conta("004", "calculo (003 + 002)"),  # Depende do ciclo, mas não faz parte dele
+        conta("005", "calculo (001.01 * 002)"),  # Fora do ciclo
+        conta("006", "calculo (006)"),
+    ]
+    valores = calcular(contas, engine)
+    assert "Erro: Referência circular no plano 'P1' envolvendo as contas ['001', '001.02', '003']." in capsys.readouterr().out
+    for codigo in ("001.02", "003", "006"):
+        assert valores[codigo] == [0.0, 0.0]
+    assert "001" not in valores  # Sintética só com zeros fica fora da visão
+    assert valores["004"] == [2.0, 20.0]
+    assert valores["005"] == [2.0, 200.0]
+    assert valores["001.01"] == [1.0, 10.0]
+
+
+@pytest.mark.parametrize("engine", processar_dados.ENGINES)
+def test_cadeias_longas_sem_recursao(engine):
+    profundidade = 3 * sys.getrecursionlimit()
+    # Cadeia de cálculos: cada conta soma a anterior e a conta 000 (com o valor bruto R1), em ordem inversa no plano
+    cadeia = [conta(f"{i:05d}", f"calculo ({i - 1:05d} + 000)" if i > 1 else "calculo (000)") for i in range(profundidade - 1, 0, -1)]
+    cadeia.append(conta("000", "analitica", "R1"))
+    valores = calcular(cadeia, engine)
+    assert valores[f"{profundidade - 1:05d}"] == [float(profundidade - 1), 10.0 * (profundidade - 1)]
+    # Hierarquia profunda: 1, 1.1, 1.1.1, ... com a analítica no último nível
+    codigos = ["1" + ".1" * nivel for nivel in range(profundidade // 10)]
+    hierarquia = [conta(codigo, "sintetica") for codigo in codigos[:-1]] + [conta(codigos[-1], "analitica", "R7")]
+    valores = calcular(hierarquia, engine)
+    assert valores["1"] == [7.0, 70.0]
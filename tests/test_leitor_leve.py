@@ -0,0 +1,143 @@
+"""
+Compara o leitor 'leve' (sem pandas) com os leitores do pandas: nas mesmas planilhas, ler_aba_dados e
+ler_aba_plano devem dar o mesmo resultado e imprimir os mesmos avisos.
+
+Uso:
+    python -m pytest tests
+"""
+import datetime
+import pathlib
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("pandas")
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+import processar_dados  # noqa: E402
+
+LEITORES_PANDAS = ["openpyxl", "openpyxl-streaming"] + (["calamine"] if processar_dados.calamine_disponivel() else [])
+BACKENDS_LEVE = (["calamine"] if processar_dados.calamine_disponivel() else []) + ["openpyxl"]
+
+CABECALHO_DADOS = ["Código", "Descrição", "Jan/2024", "Fev/2024"]
+CABECALHO_PLANO = ["Código", "Descrição", "Tipo", "Vinc (DS1)", "(DS2)"]
+
+# {caso: linhas da aba (a primeira é o cabeçalho)}; None é uma célula vazia
+CASOS = {
+    "cabecalho_repetido": [
+        CABECALHO_DADOS,
+        CABECALHO_DADOS,
+        ["001", "Receita", 1000, 1500.5],
+        ["002", "Custo", -250, None],
+    ],
+    "textos_ausentes": [
+        CABECALHO_DADOS,
+        [1, "NA", "null", 10],
+        ["NA", "Sem código", 5, 5],
+        [2, "#N/A", "N/A", ""],
+        [3, None, "nan", "None"],
+        [None, None, None, None],
+        [4, "Normal", 7.25, 8],
+    ],
+    "textos_numericos": [
+        CABECALHO_DADOS,
+        ["0101", "Texto", "1.5", "-0"],
+        ["0102", "12", " 12 ", "1e3"],
+        ["0103", "1,5", "inf", "abc"],
+        ["0104", "+3", ".5", "1."],
+    ],
+    "codigos_com_vazio": [
+        CABECALHO_DADOS,
+        [101, "A", 1, 2],
+        [None, "Sem código", 3, 4],
+        [102, "B", 5, 6],
+    ],
+    "so_numeros": [
+        [1, 2, 3, 4],
+        [101, 5, 1, 2],
+        [102, 6, 3.5, 4],
+    ],
+    "booleanos_e_mistos": [
+        CABECALHO_PLANO,
+        [1, "Receitas", "sintetica", "TRUE", True],
+        ["1.1", "Vendas", "analitica", "false", False],
+        ["1.2", True, "analitica", "True", None],
+        ["2", 10, "calculo (1 - 1.1)", "FALSE", "x"],
+    ],
+    "cabecalho_de_datas": [
+        ["Código", "Descrição", datetime.datetime(2024, 1, 1), datetime.datetime(2024, 2, 1, 10, 30)],
+        ["001", "Receita", 1, 2],
+        ["002", "Custo", 3, 4],
+    ],
+    "colunas_sem_nome_e_repetidas": [
+        ["Código", None, "Jan/2024", "Jan/2024", None, "Jan/2024.1", "(DS1)"],
+        ["001", "Receita", 1, 2, 3, 4, "A"],
+        ["002", "Custo", 5, 6, 7, 8, "B"],
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def planilha(tmp_path_factory):
+    caminho = tmp_path_factory.mktemp("leitor_leve") / "casos.xlsx"
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for nome, linhas in CASOS.items():
+        ws = wb.create_sheet(nome)
+        for linha in linhas:
+            ws.append(linha)
+    wb.save(caminho)
+    return str(caminho)
+
+
+def ler_abas(caminho, reader):
+    with processar_dados.abrir_leitor_excel(caminho, reader) as leitor:
+        return {nome: leitor.parse(nome) for nome in leitor.sheet_names}
+
+
+def resultado(funcao, aba, nome, capsys):
+    """Resultado da função (com os arrays como listas) e o que ela imprimiu."""
+    capsys.readouterr()
+    lido = funcao(aba, nome)
+    if isinstance(lido, dict):
+        lido = {chave: valor.tolist() if isinstance(valor, np.ndarray) else valor for chave, valor in lido.items()}
+    return lido, capsys.readouterr().out
+
+
+@pytest.mark.parametrize("backend", BACKENDS_LEVE)
+@pytest.mark.parametrize("reader", LEITORES_PANDAS)
+@pytest.mark.parametrize("caso", sorted(CASOS))
+def test_leve_igual_aos_leitores_do_pandas(planilha, caso, reader, backend, monkeypatch, capsys):
+    esperado = ler_abas(planilha, reader)[caso]
+    if backend == "openpyxl":
+        monkeypatch.setattr(processar_dados, "calamine_disponivel", lambda: False)
+    leve = ler_abas(planilha, "leve")[caso]
+    assert isinstance(leve, processar_dados.TabelaDaAba)
+    for funcao in (processar_dados.ler_aba_dados, processar_dados.ler_aba_plano):
+        assert resultado(funcao, leve, caso, capsys) == resultado(funcao, esperado, caso, capsys)
+
+
+def test_cabecalho_repetido_e_removido(planilha, capsys):
+    lido = processar_dados.ler_aba_dados(ler_abas(planilha, "leve")["cabecalho_repetido"], "cabecalho_repetido")
+    assert "cabeçalho repetido" in capsys.readouterr().out
+    assert lido["codigos"] == ["001", "002"]
+    assert lido["matriz"].tolist() == [[1000.0, 1500.5], [-250.0, 0.0]]
+
+
+def test_leve_nao_importa_pandas(planilha):
+    codigo = (f"import sys; sys.path.insert(0, {str(RAIZ)!r}); import processar_dados\n"
+              f"with processar_dados.abrir_leitor_excel({planilha!r}, 'leve') as leitor:\n"
+              f"    abas = [leitor.parse(nome) for nome in leitor.sheet_names]\n"
+              f"print('pandas' in sys.modules)")
+    saida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True).stdout
+    assert saida.strip() == "False"
+
+
+def test_auto_continua_usando_os_leitores_do_pandas():
+    esperado = "calamine" if processar_dados.calamine_disponivel() else "openpyxl-streaming"
+    assert processar_dados.resolver_leitor_excel("auto") == esperado
+    assert processar_dados.resolver_leitor_excel("leve") == "leve"
@@ -0,0 +1,189 @@
+"""
+Testa o ModeloCalculo: depois de set_raw ou set_formula, os valores do modelo devem ser os mesmos de um
+processamento completo (processar_planilha_integrado) da planilha com a mesma edição, e as contas que não
+dependem da edição não são recalculadas.
+
+Uso:
+    python -m pytest tests
+"""
+import copy
+import pathlib
+import sys
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+import processar_dados  # noqa: E402
+
+PERIODOS = ["Jan/2024", "Fev/2024", "Mar/2024"]
+
+# {aba: linhas (a primeira é o cabeçalho)}
+PLANILHA = {
+    "plano (P1)": [
+        ["Código", "Descrição", "Tipo", "(DS1)", "(DS2)"],
+        ["001", "Receitas", "sintetica", None, None],
+        ["001.01", "Vendas", "analitica", "R1", "R1"],
+        ["001.02", "Serviços", "sintetica", None, None],
+        ["001.02.01", "Consultoria", "analitica", "R2;R3", "R2"],
+        ["001.02.02", "Suporte", "analitica", "R6", None],
+        ["002", "Custos", "analitica", "R4", "R4"],
+        ["003", "Resultado", "calculo (001 - 002)", None, None],
+        ["004", "Margem", "calculo (003 / 001)", None, None],
+        ["005", "Outras", "analitica", "R5", "R5"],
+    ],
+    "dados (DS1)": [
+        ["Código", "Descrição"] + PERIODOS,
+        ["R1", "Bruto 1", 1000, 1200.5, 0],
+        ["R2", "Bruto 2", 300, None, 25],
+        ["R3", "Bruto 3", 50, 60, 70],
+        ["R4", "Bruto 4", 800, 900, 10],
+        ["R5", "Bruto 5", 7, 8, 9],
+        ["R6", "Bruto 6", 1, 2, 3],
+    ],
+    "dados (DS2)": [
+        ["Código", "Descrição"] + PERIODOS,
+        ["R1", "Bruto 1", 10, 20, 30],
+        ["R2", "Bruto 2", 5, 5, 5],
+        ["R4", "Bruto 4", 40, 30, 20],
+        ["R5", "Bruto 5", 1, 0, 1],
+    ],
+}
+
+
+def gravar_planilha(caminho, abas):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for nome, linhas in abas.items():
+        ws = wb.create_sheet(nome)
+        for linha in linhas:
+            ws.append(linha)
+    wb.save(caminho)
+    return str(caminho)
+
+
+def linha_da_planilha(abas, aba, codigo):
+    return next(linha for linha in abas[aba][1:] if linha[0] == codigo)
+
+
+def visoes_recalculadas(caminho):
+    """Visões de um processamento completo da planilha: {ds_name: [contas da visão]}."""
+    resultado = processar_dados.processar_planilha_integrado(caminho, cache=None, workers=1)
+    return {view["data_source_name"]: list(view["accounts"]) for view in resultado["calculated_views"]}
+
+
+@pytest.fixture
+def modelo(tmp_path, capsys):
+    caminho = gravar_planilha(tmp_path / "original.xlsx", PLANILHA)
+    modelo = processar_dados.carregar_modelos(caminho)["P1"]
+    capsys.readouterr()
+    return modelo
+
+
+def assert_modelo_igual_ao_recalculo(modelo, abas, caminho):
+    esperado = visoes_recalculadas(gravar_planilha(caminho, abas))
+    assert sorted(esperado) == modelo.data_sources
+    for ds, contas in esperado.items():
+        assert list(modelo.view(ds)["accounts"]) == contas
+        for conta in contas:
+            for periodo, valor in conta["valores"].items():
+                assert modelo.value(conta["codigo"], periodo, ds) == valor
+
+
+def test_modelo_sem_edicoes_igual_ao_processamento(modelo, tmp_path):
+    assert_modelo_igual_ao_recalculo(modelo, PLANILHA, tmp_path / "igual.xlsx")
+
+
+@pytest.mark.parametrize("ds, raw_code, coluna, valor", [
+    ("DS1", "R1", 3, 2500.0),  # Vendas -> Receitas -> Resultado -> Margem
+    ("DS1", "R3", 2, -75.25),  # Segundo código vinculado à Consultoria
+    ("DS2", "R4", 4, 0.0),     # Custos -> Resultado -> Margem, com a Margem dividindo por zero
+    ("DS1", "R7", 2, 99.0),    # Código que não existe na aba de dados e não é vinculado a nenhuma conta
+])
+def test_set_raw_igual_ao_recalculo(modelo, tmp_path, ds, raw_code, coluna, valor):
+    modelo.view("DS1"), modelo.view("DS2")
+    modelo.set_raw(ds, raw_code, PERIODOS[coluna - 2], valor)
+
+    abas = copy.deepcopy(PLANILHA)
+    aba = f"dados ({ds})"
+    if any(linha[0] == raw_code for linha in abas[aba][1:]):
+        linha_da_planilha(abas, aba, raw_code)[coluna] = valor
+    else:
+        abas[aba].append([raw_code, "Novo", 0, 0, 0])
+        abas[aba][-1][coluna] = valor
+    assert_modelo_igual_ao_recalculo(modelo, abas, tmp_path / "editada.xlsx")
+
+
+@pytest.mark.parametrize("conta, formula", [
+    ("005", "001 - 002"),         # Analítica que vira cálculo
+    ("003", "001.01 + 005 * 002"),
+    ("004", "003 / 001.02.02"),
+    ("002", "009"),               # Conta inexistente no plano vale 0.0
+])
+def test_set_formula_igual_ao_recalculo(modelo, tmp_path, conta, formula):
+    modelo.view("DS1")  # DS2 só é calculado depois da edição
+    modelo.set_formula(conta, formula)
+
+    abas = copy.deepcopy(PLANILHA)
+    linha_da_planilha(abas, "plano (P1)", conta)[2] = f"calculo ({formula})"
+    assert_modelo_igual_ao_recalculo(modelo, abas, tmp_path / "editada.xlsx")
+
+
+def test_set_raw_recalcula_so_as_contas_afetadas(modelo):
+    valores = modelo._estado("DS1")["valores"]
+    # Valores marcados nas contas que não dependem de R1: se fossem recalculadas, a marca sumiria
+    for codigo in ("001.02", "002", "005"):
+        valores[modelo.linha_da_conta[codigo]] = -1.0
+
+    afetadas = modelo.set_raw("DS1", "R1", "Jan/2024", 5000.0)
+
+    assert afetadas == ["001.01", "001", "003", "004"]
+    assert modelo.value("001.01", "Jan/2024", "DS1") == 5000.0
+    for codigo in ("001.02", "002", "005"):
+        assert valores[modelo.linha_da_conta[codigo]].tolist() == [-1.0] * len(PERIODOS)
+
+
+def test_set_formula_recalcula_so_as_contas_afetadas(modelo):
+    valores = modelo._estado("DS1")["valores"]
+    for codigo in ("001", "002", "003"):
+        valores[modelo.linha_da_conta[codigo]] = -1.0
+
+    afetadas = modelo.set_formula("004", "005 - 001.01")
+
+    assert afetadas == ["004"]
+    assert modelo.value("004", "Jan/2024", "DS1") == 7.0 - 1000.0
+    for codigo in ("001", "002", "003"):
+        assert valores[modelo.linha_da_conta[codigo]].tolist() == [-1.0] * len(PERIODOS)
+
+
+def test_set_formula_que_cria_ciclo(modelo, tmp_path, capsys):
+    modelo.view("DS1")
+    # 001.01 -> 003 -> 001 (sintética, soma 001.01) -> 001.01
+    afetadas = modelo.set_formula("001.01", "003")
+
+    assert "Erro: Referência circular no plano 'P1'" in capsys.readouterr().out
+    assert modelo.dependency_graph["contas_em_ciclo"] == {"001.01", "001", "003"}
+    assert set(afetadas) == set(modelo.account_dict)
+    for codigo in ("001.01", "001", "003", "004"):
+        for ds in modelo.data_sources:
+            for periodo in PERIODOS:
+                assert modelo.value(codigo, periodo, ds) == 0.0
+
+    abas = copy.deepcopy(PLANILHA)
+    linha_da_planilha(abas, "plano (P1)", "001.01")[2] = "calculo (003)"
+    assert_modelo_igual_ao_recalculo(modelo, abas, tmp_path / "ciclo.xlsx")
+
+    # Desfazer o ciclo recalcula as contas que estavam nele
+    modelo.set_formula("001.01", "005")
+    assert modelo.dependency_graph["contas_em_ciclo"] == set()
+    assert modelo.value("003", "Jan/2024", "DS1") == 7.0 + 350.0 + 1.0 - 800.0
+
+
+def test_formula_invalida_nao_altera_o_modelo(modelo):
+    antes = modelo.value("003", "Jan/2024", "DS1")
+    with pytest.raises(processar_dados.ErroFormula):
+        modelo.set_formula("003", "001 + * 002")
+    assert modelo.account_dict["003"]["formula"] == "001 - 002"
+    assert modelo.value("003", "Jan/2024", "DS1") == antes
@@ -0,0 +1,128 @@
+"""
+Compara os motores de cálculo: nas mesmas planilhas, o 'vetorizado' deve dar exatamente os valores do
+'recursivo' (o motor original) e o 'linear' os mesmos valores, a menos de arredondamento (ver o README).
+
+Uso:
+    python -m pytest tests
+"""
+import pathlib
+import sys
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+RAIZ = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+import processar_dados  # noqa: E402
+import gerar_planilha_sintetica  # noqa: E402
+
+PERIODOS = ["Jan/2024", "Fev/2024", "Mar/2024", "Abr/2024"]
+
+# {aba: linhas (a primeira é o cabeçalho)}: hierarquia, vínculos múltiplos e ausentes, fórmulas com precedência,
+# operadores unários, divisão por zero, referências inexistentes e fórmula inválida
+PLANILHA = {
+    "plano (P1)": [
+        ["Código", "Descrição", "Tipo", "(DS1)", "(DS2)"],
+        ["001", "Receitas", "sintetica", None, None],
+        ["001.01", "Vendas", "analitica", "R1; R2", "R1"],
+        ["001.02", "Serviços", "analitica", "R3", "R3"],
+        ["001.03", "Sem filhos", "sintetica", None, None],
+        ["002", "Custos", "sintetica", None, None],
+        ["002.01", "Pessoal", "analitica", "R4", "R4"],
+        ["002.02", "Sem dados", "analitica", "RX", None],
+        ["003", "Resultado", "calculo (001 - 002)", None, None],
+        ["004", "Precedência", "calculo (001 - 002 * 003 / (001.01 + 001.02))", None, None],
+        ["005", "Divisão", "calculo (003 / 006)", None, None],
+        ["006", "Divisor", "analitica", "R5", "R5"],
+        ["007", "Unários", "calculo (-003 + +001 - -002.01)", None, None],
+        ["008", "Inexistente", "calculo (999 + 001)", None, None],
+        ["009", "Inválida", "calculo (001 +)", None, None],
+        ["010.01.01", "Órfã", "analitica", "R1", "R2"],
+    ],
+    "dados (DS1)": [
+        ["Código", "Descrição"] + PERIODOS,
+        ["R1", "Bruto 1", 1000.25, -50, 0, 1e6],
+        ["R2", "Bruto 2", 0.1, 0.2, None, "abc"],
+        ["R3", "Bruto 3", 300, 200, 100, -0.3],
+        ["R4", "Bruto 4", 1200, 10, 0, 999999.99],
+        ["R5", "Bruto 5", 0, 4, -2.5, 0],
+    ],
+    "dados (DS2)": [
+        ["Código", "Descrição"] + PERIODOS,
+        ["R1", "Bruto 1", 5, 6, 7, 8],
+        ["R2", "Bruto 2", -1, -2, -3, -4],
+        ["R3", "Bruto 3", 1 / 3, 2 / 3, 1, 4 / 3],
+        ["R4", "Bruto 4", 10, 0, 10, 0],
+        ["R5", "Bruto 5", 3, 0, 0, 3],
+    ],
+}
+
+
+def gravar_planilha(caminho, abas):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for nome, linhas in abas.items():
+        ws = wb.create_sheet(nome)
+        for linha in linhas:
+            ws.append(linha)
+    wb.save(caminho)
+    return str(caminho)
+
+
+@pytest.fixture(scope="module")
+def planilhas(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp("motores")
+    sintetica = pasta / "sintetica.xlsx"
+    gerar_planilha_sintetica.gerar_planilha_sintetica(str(sintetica), contas=400, profundidade=4, periodos=12,
+                                                      data_sources=2, fracao_calculo=0.1, planos=2)
+    return {"pequena": gravar_planilha(pasta / "pequena.xlsx", PLANILHA), "sintetica": str(sintetica)}
+
+
+def calcular(caminho, engine):
+    """Visões do processamento completo com o motor: {(plano, DataSource): [contas da visão]}."""
+    resultado = processar_dados.processar_planilha_integrado(caminho, engine=engine, cache=None, workers=1)
+    return {(view["plan_name"], view["data_source_name"]): list(view["accounts"]) for view in resultado["calculated_views"]}
+
+
+def valores(conta):
+    return list(conta["valores"].values())
+
+
+@pytest.mark.parametrize("nome", ["pequena", "sintetica"])
+def test_vetorizado_igual_ao_recursivo(planilhas, nome):
+    esperado = calcular(planilhas[nome], "recursivo")
+    assert esperado
+    assert calcular(planilhas[nome], "vetorizado") == esperado
+
+
+@pytest.mark.parametrize("nome", ["pequena", "sintetica"])
+def test_linear_igual_ao_vetorizado_a_menos_de_arredondamento(planilhas, nome):
+    pytest.importorskip("scipy")
+    esperado = calcular(planilhas[nome], "vetorizado")
+    linear = calcular(planilhas[nome], "linear")
+    assert linear.keys() == esperado.keys()
+    for visao, contas in esperado.items():
+        assert [conta["codigo"] for conta in linear[visao]] == [conta["codigo"] for conta in contas]
+        for conta_linear, conta in zip(linear[visao], contas):
+            assert {**conta_linear, "valores": None} == {**conta, "valores": None}
+            assert valores(conta_linear) == pytest.approx(valores(conta), rel=1e-11, abs=1e-9)
+
+
+def test_valores_da_planilha_pequena(planilhas):
+    visao = {conta["codigo"]: valores(conta) for conta in calcular(planilhas["pequena"], "vetorizado")[("P1", "DS1")]}
+    receitas = [1300.35, 150.2, 100.0, 999999.7]
+    custos = [1200.0, 10.0, 0.0, 999999.99]
+    resultado = [r - c for r, c in zip(receitas, custos)]
+    assert visao["001"] == pytest.approx(receitas)
+    assert visao["002"] == pytest.approx(custos)
+    assert visao["003"] == pytest.approx(resultado)
+    # 001 - ((002 * 003) / (001.01 + 001.02))
+    assert visao["004"] == pytest.approx([r - c * res / r for r, c, res in zip(receitas, custos, resultado)])
+    # Divisão por zero vale 0.0 só nos períodos em que o divisor é zero
+    assert visao["005"] == pytest.approx([0.0, resultado[1] / 4, resultado[2] / -2.5, 0.0])
+    assert visao["007"] == pytest.approx([-res + r + c for res, r, c in zip(resultado, receitas, custos)])
+    assert visao["008"] == pytest.approx(receitas)  # 999 não existe no plano: vale 0.0
+    assert visao["009"] == [0.0] * len(PERIODOS)  # Fórmula inválida
+    assert "001.03" not in visao and "002.02" not in visao  # Sintética e analítica só com zeros ficam fora da visão
+    assert visao["010.01.01"] == [1000.25, -50.0, 0.0, 1e6]